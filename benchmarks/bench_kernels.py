@@ -0,0 +1,148 @@
+"""
+Benchmarks for the interval and depth kernels, run outside of toil.
+
+Generates synthetic halLiftover-like beds (see synthetic_liftovers.py), then times each
+kernel of src/interval_kernels.py, and records its peak RSS. Every kernel runs in its own
+forked process, so that its peak RSS isn't polluted by the kernels that ran before it. Results are saved as json, so
+runs from different commits can be compared with --compare.
+
+Example call:
+python benchmarks/bench_kernels.py --num_contigs 500 --num_intervals 1000000 --output before.json
+python benchmarks/bench_kernels.py --num_contigs 500 --num_intervals 1000000 --output after.json --compare before.json
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import contig_length_table
+from src import interval_kernels
+import synthetic_liftovers
+
+from argparse import ArgumentParser
+import json
+import multiprocessing
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+
+def get_current_rss_kb():
+    with open("/proc/self/statm") as inf:
+        return int(inf.read().split()[1]) * resource.getpagesize() // 1024
+
+def run_kernel_in_child(kernel, connection):
+    rss_before = get_current_rss_kb()
+    start = time.perf_counter()
+    kernel()
+    wall_seconds = time.perf_counter() - start
+    connection.send({"wall_seconds": wall_seconds, "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "rss_before_kb": rss_before})
+    connection.close()
+
+def time_kernel(kernel):
+    """
+    Runs kernel (a function with no arguments) in a forked process, returning its wall time
+    and peak RSS.
+    """
+    context = multiprocessing.get_context("fork")
+    parent_connection, child_connection = context.Pipe(duplex=False)
+    process = context.Process(target=run_kernel_in_child, args=(kernel, child_connection))
+    process.start()
+    result = parent_connection.recv()
+    process.join()
+    return result
+
+def get_kernels(liftover_beds, contig_lengths, minimum_size_gap):
+    """
+    Returns list of (kernel_name, kernel). Every kernel's input is computed once, up front,
+    so each kernel is timed on its own. As in the pipeline, the contigs are interned, so
+    the kernels after parsing see contig_numbers rather than names.
+    """
+    contig_table = contig_length_table.intern_contigs(contig_lengths)
+    contig_lengths = contig_table.lengths
+    coverage_points = [interval_kernels.read_mapping_coverage_points(bed, contig_ids=contig_table.ids) for bed in liftover_beds]
+    merged_points = interval_kernels.merge_mapping_coverage_points(coverage_points)
+    coverage_coords = interval_kernels.get_mapping_coverage_coordinates(merged_points)
+    options = interval_kernels.get_poor_mapping_options(minimum_size_gap)
+    poor_coords = interval_kernels.get_poor_mapping_coverage_coordinates(contig_lengths, coverage_coords, options)
+
+    # named as before the kernels moved out of the toil jobs, so --compare still lines up.
+    return [
+        ("get_mapping_coverage_points", lambda: [interval_kernels.read_mapping_coverage_points(bed, contig_ids=contig_table.ids) for bed in liftover_beds]),
+        ("merge_mapping_coverage_points", lambda: interval_kernels.merge_mapping_coverage_points(coverage_points)),
+        ("get_mapping_coverage_coordinates", lambda: interval_kernels.get_mapping_coverage_coordinates(merged_points)),
+        ("get_poor_mapping_coverage_coordinates", lambda: interval_kernels.get_poor_mapping_coverage_coordinates(contig_lengths, coverage_coords, options)),
+        ("count_interval_size", lambda: interval_kernels.count_interval_size(poor_coords)),
+        ("count_gap_lengths", lambda: interval_kernels.count_gap_lengths(poor_coords)),
+        ("get_mapping_depths", lambda: interval_kernels.get_mapping_depths(merged_points, contig_lengths)),
+    ]
+
+def get_git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+def compare_results(old_results, new_results):
+    print("kernel\told_best_seconds\tnew_best_seconds\tspeedup\told_peak_rss_kb\tnew_peak_rss_kb")
+    for kernel_name, new in new_results["kernels"].items():
+        if kernel_name not in old_results["kernels"]:
+            continue
+        old = old_results["kernels"][kernel_name]
+        print(kernel_name + "\t" + str(round(old["best_seconds"], 4)) + "\t" + str(round(new["best_seconds"], 4)) + "\t" + str(round(old["best_seconds"] / new["best_seconds"], 2)) + "\t" + str(old["peak_rss_kb"]) + "\t" + str(new["peak_rss_kb"]))
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--num_contigs', help='The number of contigs in the synthetic target assembly.', default=100, type=int)
+    parser.add_argument(
+        '--mean_contig_length', help='The mean length of the synthetic contigs.', default=1000000, type=int)
+    parser.add_argument(
+        '--num_intervals', help='The total number of intervals, across all synthetic liftover beds.', default=200000, type=int)
+    parser.add_argument(
+        '--num_liftovers', help='The number of synthetic liftover beds (i.e. source assemblies) onto the target.', default=4, type=int)
+    parser.add_argument(
+        '--overlap_depth', help='The average number of intervals covering each aligned base, in each liftover bed.', default=2.0, type=float)
+    parser.add_argument(
+        '--fragmentation', help='The number of separate aligned blocks per contig, in each liftover bed.', default=10, type=int)
+    parser.add_argument(
+        '--minimum_size_gap', help='Passed to get_poor_mapping_coverage_coordinates.', default=0, type=int)
+    parser.add_argument(
+        '--repeat', help='The number of times to time each kernel.', default=3, type=int)
+    parser.add_argument(
+        '--seed', help='Seed for the synthetic data.', default=0, type=int)
+    parser.add_argument(
+        '--output', help='Where to save the json results.', default='./bench_kernels.json', type=str)
+    parser.add_argument(
+        '--compare', help='A json results file from a previous run, to compare against.', type=str)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        contig_lengths = synthetic_liftovers.generate_contig_lengths(options.num_contigs, options.mean_contig_length, options.seed)
+        liftover_beds = list()
+        for i in range(options.num_liftovers):
+            intervals = synthetic_liftovers.generate_liftover_intervals(contig_lengths, options.num_intervals // options.num_liftovers, options.overlap_depth, options.fragmentation, seed=options.seed + i + 1)
+            liftover_beds.append(synthetic_liftovers.write_liftover_bed(os.path.join(work_dir, "liftover_" + str(i) + ".bed"), intervals))
+
+        results = {"git_commit": get_git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "params": vars(options), "kernels": dict()}
+        for kernel_name, kernel in get_kernels(liftover_beds, contig_lengths, options.minimum_size_gap):
+            runs = [time_kernel(kernel) for _ in range(options.repeat)]
+            wall_seconds = [run["wall_seconds"] for run in runs]
+            results["kernels"][kernel_name] = {
+                "wall_seconds": wall_seconds,
+                "best_seconds": min(wall_seconds),
+                "median_seconds": statistics.median(wall_seconds),
+                "peak_rss_kb": max(run["peak_rss_kb"] for run in runs),
+                "rss_before_kb": min(run["rss_before_kb"] for run in runs)}
+            print(kernel_name, "best:", round(min(wall_seconds), 4), "s", "peak_rss:", results["kernels"][kernel_name]["peak_rss_kb"], "kB")
+
+    with open(options.output, "w") as outf:
+        json.dump(results, outf, indent=2)
+
+    if options.compare:
+        with open(options.compare) as inf:
+            compare_results(json.load(inf), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+End-to-end benchmark of the toil workflows (get_bases_unmapped_to_ref and
+get_asm_mapping_depths), including job-store I/O, without a real hal file.
+
+For each requested number of genomes, writes synthetic assemblies and a fake hal spec,
+puts fake_halLiftover.py on the PATH as halLiftover, and runs cactus_connectivity.py with
+the single_machine batch system. Reports the total wall time, per-stage wall time and job
+counts (from toil stats), and the bytes left in the job store.
+
+Example call:
+python benchmarks/bench_pipeline.py --num_genomes 10 50 100 --modes ref --output bench_pipeline.json
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic_liftovers
+import fake_halLiftover
+
+from argparse import ArgumentParser
+import collections as col
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+CACTUS_CONNECTIVITY = os.path.join(os.path.dirname(BENCHMARK_DIR), "cactus_connectivity.py")
+
+def write_synthetic_graph(work_dir, num_genomes, options):
+    """
+    Returns (seq_file, fake_hal) for num_genomes synthetic genomes.
+    """
+    genome_contig_lengths = dict()
+    with open(os.path.join(work_dir, "seq_file.txt"), "w") as seq_file:
+        for i in range(num_genomes):
+            genome = "genome_" + str(i)
+            genome_contig_lengths[genome] = synthetic_liftovers.generate_contig_lengths(options.num_contigs, options.mean_contig_length, options.seed + i, prefix=genome)
+            fasta = synthetic_liftovers.write_synthetic_fasta(os.path.join(work_dir, genome + ".fa"), genome_contig_lengths[genome], options.seed + i)
+            seq_file.write(genome + "\t" + fasta + "\n")
+    fake_hal = fake_halLiftover.write_fake_hal(os.path.join(work_dir, "fake.hal"), genome_contig_lengths, options.mapped_fraction, options.mean_block_length, options.mean_copies, options.bases_per_second)
+    return os.path.join(work_dir, "seq_file.txt"), fake_hal
+
+def get_fake_halLiftover_path(work_dir):
+    bin_dir = os.path.join(work_dir, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    os.symlink(os.path.join(BENCHMARK_DIR, "fake_halLiftover.py"), os.path.join(bin_dir, "halLiftover"))
+    return bin_dir + os.pathsep + os.environ["PATH"]
+
+def get_dir_size(path):
+    size = 0
+    for dir_path, dir_names, file_names in os.walk(path):
+        for file_name in file_names:
+            file_path = os.path.join(dir_path, file_name)
+            if not os.path.islink(file_path):
+                size += os.path.getsize(file_path)
+    return size
+
+def get_stage_stats(job_store, env):
+    """
+    Returns dict of key: stage (the job function's name), value: dict of job count and wall
+    time, summed over all jobs of that stage, according to toil stats.
+    """
+    stats = subprocess.run(["toil", "stats", "--raw", job_store], env=env, capture_output=True, text=True)
+    if stats.returncode != 0:
+        print("WARNING: toil stats failed:\n" + stats.stderr)
+        return dict()
+    job_types = json.loads(stats.stdout)["job_types"]
+    # depending on the toil version, job_types is either a list or a dict keyed by name.
+    if isinstance(job_types, dict):
+        job_types = job_types.values()
+
+    stages = col.defaultdict(lambda: {"jobs": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+    for job_type in job_types:
+        stage = job_type["name"].split(".")[-1]
+        stages[stage]["jobs"] += int(float(job_type["total_number"]))
+        stages[stage]["wall_seconds"] += float(job_type["total_time"])
+        stages[stage]["cpu_seconds"] += float(job_type["total_clock"])
+    return dict(stages)
+
+def run_pipeline(work_dir, seq_file, fake_hal, mode, env, options):
+    job_store = os.path.join(work_dir, "js_" + mode)
+    output = os.path.join(work_dir, "output_" + mode + ".txt")
+    command = [sys.executable, CACTUS_CONNECTIVITY, job_store, seq_file, fake_hal, "--output", output, "--batchSystem", "single_machine", "--stats", "--clean", "never", "--logWarning"]
+    if options.max_cores:
+        command += ["--maxCores", str(options.max_cores)]
+    if mode == "ref":
+        command += ["--get_bases_unmapped_to_ref", "genome_0"]
+
+    start = time.perf_counter()
+    run = subprocess.run(command, env=env, capture_output=True, text=True)
+    wall_seconds = time.perf_counter() - start
+    if run.returncode != 0:
+        print("WARNING: cactus_connectivity failed in " + mode + " mode:\n" + run.stderr[-5000:])
+
+    stages = get_stage_stats(job_store, env)
+    result = {
+        "mode": mode,
+        "succeeded": run.returncode == 0,
+        "wall_seconds": wall_seconds,
+        "jobs": sum(stage["jobs"] for stage in stages.values()),
+        "job_store_bytes": get_dir_size(job_store),
+        "stages": stages}
+    shutil.rmtree(job_store, ignore_errors=True)
+    return result
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--num_genomes', help='The numbers of genomes to benchmark with.', nargs='+', default=[10, 50, 100], type=int)
+    parser.add_argument(
+        '--modes', help='Which workflows to run: "ref" for get_bases_unmapped_to_ref, "depths" for get_asm_mapping_depths.', nargs='+', default=["ref", "depths"], choices=["ref", "depths"])
+    parser.add_argument(
+        '--num_contigs', help='The number of contigs in each synthetic genome.', default=10, type=int)
+    parser.add_argument(
+        '--mean_contig_length', help='The mean length of the synthetic contigs.', default=20000, type=int)
+    parser.add_argument(
+        '--mapped_fraction', help='The fraction of each source that fake_halLiftover lifts to the target.', default=0.9, type=float)
+    parser.add_argument(
+        '--mean_block_length', help='The mean length of the aligned blocks output by fake_halLiftover.', default=1000, type=int)
+    parser.add_argument(
+        '--mean_copies', help='The mean number of places in the target each aligned block lifts to.', default=1.2, type=float)
+    parser.add_argument(
+        '--bases_per_second', help='If nonzero, the speed of each fake liftover, in source bases per second.', default=0, type=float)
+    parser.add_argument(
+        '--max_cores', help='Passed to toil as --maxCores.', type=int)
+    parser.add_argument(
+        '--seed', help='Seed for the synthetic data.', default=0, type=int)
+    parser.add_argument(
+        '--output', help='Where to save the json results.', default='./bench_pipeline.json', type=str)
+    options = parser.parse_args()
+
+    results = {"params": vars(options), "runs": list()}
+    for num_genomes in options.num_genomes:
+        with tempfile.TemporaryDirectory() as work_dir:
+            seq_file, fake_hal = write_synthetic_graph(work_dir, num_genomes, options)
+            env = dict(os.environ, PATH=get_fake_halLiftover_path(work_dir))
+            for mode in options.modes:
+                result = run_pipeline(work_dir, seq_file, fake_hal, mode, env, options)
+                result["num_genomes"] = num_genomes
+                results["runs"].append(result)
+
+                print(num_genomes, "genomes,", mode, "mode:", round(result["wall_seconds"], 1), "s,", result["jobs"], "jobs,", result["job_store_bytes"], "job store bytes")
+                for stage, stage_stats in sorted(result["stages"].items(), key=lambda item: -item[1]["wall_seconds"]):
+                    print("\t" + stage + "\t" + str(stage_stats["jobs"]) + " jobs\t" + str(round(stage_stats["wall_seconds"], 2)) + " s")
+
+    with open(options.output, "w") as outf:
+        json.dump(results, outf, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+A stand-in for halLiftover, for benchmarking the whole pipeline without a real hal file.
+
+Takes the same positional arguments as halLiftover:
+    fake_halLiftover.py [--options] <halFile> <srcGenome> <srcBed> <tgtGenome> <tgtBed>
+
+but the "hal file" is a json spec (see write_fake_hal) that lists the contig lengths of each
+genome, plus the knobs that control how much output is made, and how fast. As with
+halLiftover, srcBed can be "stdin" and tgtBed "stdout", and --outPSL writes a psl line per
+lifted block (with the source as the query) instead of a bed line. --help lists the same
+options as halLiftover's (see HALLIFTOVER_OPTIONS); the others are accepted and ignored.
+
+Output is deterministic: the same (source, target, source interval) always lifts to the same
+target intervals. To use it in place of halLiftover, put a symlink to it called halLiftover
+first on the PATH (bench_pipeline.py does this for you).
+"""
+import bisect
+import json
+import random
+import sys
+import time
+import zlib
+
+# key: option, value: True if it takes a value, as listed by halLiftover --help.
+HALLIFTOVER_OPTIONS = {"--append": False, "--bedType": True, "--cacheBytes": True, "--cacheMDC": True, "--cacheRDC": True, "--cacheW0": True, "--coalescenceLimit": True, "--hdf5InMemory": False, "--inMemory": False, "--inPSL": False, "--keepExtra": False, "--noDupes": False, "--outPSL": False, "--outPSLWithName": False, "--tab": False, "--udcCacheDir": True}
+USAGE = "usage: fake_halLiftover.py [Options] <halFile> <srcGenome> <srcBed> <tgtGenome> <tgtBed>\n"
+
+def write_fake_hal(fake_hal, genome_contig_lengths, mapped_fraction=0.9, mean_block_length=1000, mean_copies=1.2, bases_per_second=0):
+    """
+    variables:
+        genome_contig_lengths: dict of key: genome, value: dict(key: contig_id, value: length)
+        mapped_fraction: the fraction of each source interval that lifts to the target.
+        mean_block_length: the mean length of each aligned block, so smaller blocks mean a
+            bigger, more fragmented output bed.
+        mean_copies: the mean number of places in the target each aligned block lifts to.
+        bases_per_second: if nonzero, each liftover takes (source bases / bases_per_second)
+            seconds, to mimic the run time of a real liftover.
+    """
+    with open(fake_hal, "w") as outf:
+        json.dump({"genomes": genome_contig_lengths, "mapped_fraction": mapped_fraction, "mean_block_length": mean_block_length, "mean_copies": mean_copies, "bases_per_second": bases_per_second}, outf)
+    return fake_hal
+
+def lift_interval(spec, target_contigs, target_cumulative_lengths, source_asm, target_asm, contig_id, start, stop):
+    """
+    Yields (target_contig_id, target_start, target_stop, source_start) for the given source
+    interval. The source block is the same length as the target block.
+    """
+    rng = random.Random(zlib.crc32((source_asm + "\t" + target_asm + "\t" + contig_id + "\t" + str(start)).encode()))
+    position = start
+    while position < stop:
+        block_length = min(stop - position, max(1, int(rng.expovariate(1 / spec["mean_block_length"]))))
+        if rng.random() < spec["mapped_fraction"]:
+            copies = 1
+            while rng.random() < 1 - 1 / spec["mean_copies"]:
+                copies += 1
+            for _ in range(copies):
+                # pick a target contig, weighted by length.
+                i = bisect.bisect_right(target_cumulative_lengths, rng.randrange(target_cumulative_lengths[-1]))
+                target_contig_id, target_length = target_contigs[i]
+                target_block_length = min(block_length, target_length)
+                target_start = rng.randint(0, target_length - target_block_length)
+                yield target_contig_id, target_start, target_start + target_block_length, position
+        position += block_length
+
+def main():
+    if "--help" in sys.argv[1:]:
+        # like halLiftover, the usage goes to stderr, with a nonzero exit status.
+        sys.stderr.write(USAGE + "\nOPTIONS:\n" + "".join(option + (" <value>" if takes_value else "") + ":\n" for option, takes_value in HALLIFTOVER_OPTIONS.items()))
+        sys.exit(1)
+    args = list()
+    argv = iter(sys.argv[1:])
+    for arg in argv:
+        if not arg.startswith("--"):
+            args.append(arg)
+        elif HALLIFTOVER_OPTIONS.get(arg):
+            next(argv, None)
+    out_psl = "--outPSL" in sys.argv[1:]
+    if len(args) != 5:
+        sys.stderr.write(USAGE)
+        sys.exit(1)
+    fake_hal, source_asm, source_bed, target_asm, target_bed = args
+
+    with open(fake_hal) as inf:
+        spec = json.load(inf)
+    if source_asm not in spec["genomes"] or target_asm not in spec["genomes"]:
+        sys.stderr.write("genome not found in " + fake_hal + "\n")
+        sys.exit(1)
+
+    target_contigs = sorted(spec["genomes"][target_asm].items())
+    target_cumulative_lengths = list()
+    cumulative_length = 0
+    for target_contig_id, length in target_contigs:
+        cumulative_length += length
+        target_cumulative_lengths.append(cumulative_length)
+
+    inf = sys.stdin if source_bed == "stdin" else open(source_bed)
+    outf = sys.stdout if target_bed == "stdout" else open(target_bed, "w")
+    source_bases = 0
+    for line in inf:
+        parsed = line.rstrip("\n").split("\t")
+        contig_id, start, stop = parsed[0], int(parsed[1]), int(parsed[2])
+        source_bases += stop - start
+        # like halLiftover, any extra bed columns are carried over to the output.
+        extra_columns = "".join("\t" + column for column in parsed[3:])
+        for target_contig_id, target_start, target_stop, source_start in lift_interval(spec, target_contigs, target_cumulative_lengths, source_asm, target_asm, contig_id, start, stop):
+            if out_psl:
+                block_length = target_stop - target_start
+                source_length = spec["genomes"][source_asm][contig_id]
+                target_length = spec["genomes"][target_asm][target_contig_id]
+                outf.write("\t".join(str(column) for column in [block_length, 0, 0, 0, 0, 0, 0, 0, "+", contig_id, source_length, source_start, source_start + block_length, target_contig_id, target_length, target_start, target_stop, 1, str(block_length) + ",", str(source_start) + ",", str(target_start) + ","]) + "\n")
+            else:
+                outf.write(target_contig_id + "\t" + str(target_start) + "\t" + str(target_stop) + extra_columns + "\n")
+    outf.flush()
+
+    if spec["bases_per_second"]:
+        time.sleep(source_bases / spec["bases_per_second"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Generators for synthetic halLiftover-like data, for benchmarking without a real hal file.
+
+A synthetic liftover bed looks like what halLiftover writes for a target genome: intervals
+on the target's contigs, in no particular order, overlapping one another wherever the
+source maps to the target more than once.
+"""
+import random
+
+def generate_contig_lengths(num_contigs, mean_contig_length, seed=0, prefix="contig"):
+    """
+    Returns dict of key: contig_id, value: length of contig. Lengths are drawn from an
+    exponential distribution around mean_contig_length, so there's a realistic mix of a few
+    big contigs and many small ones.
+    """
+    rng = random.Random(seed)
+    contig_lengths = dict()
+    for i in range(num_contigs):
+        contig_lengths[prefix + "_" + str(i)] = max(1, int(rng.expovariate(1 / mean_contig_length)))
+    return contig_lengths
+
+def generate_liftover_intervals(contig_lengths, num_intervals, overlap_depth=2.0, fragmentation=10, coverage=0.9, seed=0):
+    """
+    Returns a list of (contig_id, start, stop) intervals, in random order.
+
+    variables:
+        num_intervals: the total number of intervals, split between contigs in proportion
+            to their length.
+        overlap_depth: the average number of intervals covering each aligned base.
+        fragmentation: the number of separate aligned blocks per contig. Everything
+            between the blocks is left unaligned, so more fragmentation means more, smaller
+            gaps for the sweeps to find.
+        coverage: the fraction of each contig covered by the aligned blocks.
+    """
+    rng = random.Random(seed)
+    total_length = sum(contig_lengths.values())
+    intervals = list()
+    for contig_id, length in contig_lengths.items():
+        contig_intervals = int(round(num_intervals * length / total_length))
+        if not contig_intervals:
+            continue
+
+        # split the aligned part of the contig into fragmentation blocks, with the unaligned
+        # remainder spread randomly between them.
+        num_blocks = max(1, min(fragmentation, length))
+        block_length = max(1, int(length * coverage / num_blocks))
+        gap_total = max(0, length - block_length * num_blocks)
+        cuts = sorted(rng.randint(0, gap_total) for _ in range(num_blocks))
+        blocks = [(cuts[i] + i * block_length, cuts[i] + (i + 1) * block_length) for i in range(num_blocks)]
+
+        # interval length is chosen so that the intervals, stacked up in the blocks, give the
+        # requested overlap_depth.
+        mean_interval_length = max(1, int(overlap_depth * block_length * num_blocks / contig_intervals))
+        for _ in range(contig_intervals):
+            block_start, block_stop = blocks[rng.randrange(num_blocks)]
+            interval_length = min(block_stop - block_start, max(1, int(rng.expovariate(1 / mean_interval_length))))
+            start = rng.randint(block_start, block_stop - interval_length)
+            intervals.append((contig_id, start, start + interval_length))
+    rng.shuffle(intervals)
+    return intervals
+
+def write_liftover_bed(out_bed, intervals):
+    with open(out_bed, "w") as outf:
+        for contig_id, start, stop in intervals:
+            outf.write(contig_id + "\t" + str(start) + "\t" + str(stop) + "\n")
+    return out_bed
+
+def write_synthetic_fasta(out_fasta, contig_lengths, seed=0, line_length=60):
+    """
+    Writes random sequence for each contig in contig_lengths, for the steps of the pipeline
+    that need a real fasta (i.e. get_contig_lengths).
+    """
+    rng = random.Random(seed)
+    with open(out_fasta, "w") as outf:
+        for contig_id, length in contig_lengths.items():
+            outf.write(">" + contig_id + "\n")
+            seq = "".join(rng.choices("ACGT", k=length))
+            for i in range(0, length, line_length):
+                outf.write(seq[i:i + line_length] + "\n")
+    return out_fasta
@@ -1,40 +1,124 @@
 # Self-made libraries:
 from src import all_to_all_liftovers
+from src import ancestor_projection
 from src import calculate_bases_unmapped
 from src import calculate_asm_mapping_depths
+from src import contig_length_table
+from src import interval_kernels
+from src import local_liftovers
+from src import mask_intersection
+from src import genome_subsets
+from src import job_metrics
+from src import liftover_costs
+from src import connectivity_index
+from src import poor_mapping_regions as poor_mapping_regions_module
+from src import sampled_liftovers
+from src import result_tables
+from src import source_coverage
 
 from argparse import ArgumentParser
 import os
+import shlex
 
-from toil.common import Toil
-from toil.job import Job
-
-def get_asm_mapping_depths(job, assembly_files, hal_file):
+@job_metrics.instrumented
+def get_asm_mapping_depths(job, assembly_files, hal_file, options, checkpointed_liftovers):
     leader = job.addChildJobFn(all_to_all_liftovers.empty)
     
     # Part 0: calculate lengths of contigs in each asm:
     contig_lengths = dict()
+    n_runs = dict()
     for asm, asm_file in assembly_files.items():
-        contig_lengths[asm] = leader.addChildJobFn(all_to_all_liftovers.get_contig_lengths, asm_file).rv()
+        contig_lengths_job = leader.addChildJobFn(all_to_all_liftovers.get_contig_lengths, asm_file)
+        contig_lengths[asm] = contig_lengths_job.rv("lengths")
+        n_runs[asm] = contig_lengths_job.rv("n_runs")
+    # the lengths are written once, to a table in the job store. Every job after this is
+    # only given its file ID, and loads just the assemblies it needs.
+    length_table = leader.addFollowOnJobFn(contig_length_table.write_contig_length_table, contig_lengths, n_runs).rv()
     lengths_jobs = leader.encapsulate()
 
     # Part 1: perform all_to_all_liftovers:
-    liftovers = lengths_jobs.addChildJobFn(all_to_all_liftovers.all_to_all_liftovers, assembly_files, contig_lengths, hal_file).rv()
-
+    liftover_options = all_to_all_liftovers.get_liftover_options(options.liftover_preview_lines, options.liftover_retries, options.checkpoint_dir, halLiftover_arguments=options.halLiftover_arguments, memory=options.liftover_memory)
+    cost_options = liftover_costs.get_cost_options(options.liftover_timings)
+    liftovers = lengths_jobs.addChildJobFn(all_to_all_liftovers.all_to_all_liftovers, assembly_files, length_table, hal_file, liftover_options, checkpointed_liftovers, cost_options, options.selected_sources, options.selected_targets).rv()
     liftovers_jobs = lengths_jobs.encapsulate()
 
     # Part 2: calculate the bases left unmapped on each assembly:
-    mapping_depths = liftovers_jobs.addChildJobFn(calculate_asm_mapping_depths.calculate_all_mapping_depths, liftovers, contig_lengths).rv()
+    all_mapping_depths_job = liftovers_jobs.addChildJobFn(calculate_asm_mapping_depths.calculate_all_mapping_depths, liftovers, length_table, options.index_dir is not None, options.table_format, options.source_coverage_dir is not None)
+    mapping_depths = all_mapping_depths_job.rv("mapping_depths")
     mapping_depths_jobs = liftovers_jobs.encapsulate()
 
     #todo: change mapping_depths to a formatted output file.
-    output_file = mapping_depths_jobs.addChildJobFn(asm_mapping_depths_output, mapping_depths, contig_lengths).rv()
-    return output_file
+    output_file = mapping_depths_jobs.addChildJobFn(asm_mapping_depths_output, mapping_depths, length_table, all_mapping_depths_job.rv("n_bases_unmapped")).rv()
+    return {"output": output_file, "indexes": all_mapping_depths_job.rv("indexes"), "tables": {"depths": all_mapping_depths_job.rv("depths_tables")}, "source_coverage": all_mapping_depths_job.rv("source_coverage")}
+
+@job_metrics.instrumented
+def get_projected_asm_mapping_depths(job, assembly_files, ancestor, hal_file, options, checkpointed_liftovers):
+    """
+    Like get_asm_mapping_depths, but projected through ancestor (see ancestor_projection),
+    with one liftover per source onto the ancestor, and one back onto each target.
+    """
+    leader = job.addChildJobFn(all_to_all_liftovers.empty)
+
+    # Part 0: calculate lengths of contigs in each asm:
+    contig_lengths = dict()
+    n_runs = dict()
+    for asm, asm_file in assembly_files.items():
+        contig_lengths_job = leader.addChildJobFn(all_to_all_liftovers.get_contig_lengths, asm_file)
+        contig_lengths[asm] = contig_lengths_job.rv("lengths")
+        n_runs[asm] = contig_lengths_job.rv("n_runs")
+    length_table = leader.addFollowOnJobFn(contig_length_table.write_contig_length_table, contig_lengths, n_runs).rv()
+    lengths_jobs = leader.encapsulate()
+
+    # Part 1: lift each source over onto the ancestor:
+    liftover_options = all_to_all_liftovers.get_liftover_options(options.liftover_preview_lines, options.liftover_retries, options.checkpoint_dir, halLiftover_arguments=options.halLiftover_arguments, memory=options.liftover_memory)
+    cost_options = liftover_costs.get_cost_options(options.liftover_timings)
+    source_files = {asm: assembly_files[asm] for asm in options.selected_sources}
+    ancestor_liftovers_job = lengths_jobs.addChildJobFn(all_to_all_liftovers.all_to_ref_liftovers, source_files, length_table, ancestor, hal_file, liftover_options, checkpointed_liftovers, cost_options)
+    liftovers_jobs = lengths_jobs.encapsulate()
 
-def asm_mapping_depths_output(job, mapping_depths, contig_lengths):
+    # Part 2: sweep the sources' columns of the ancestor into its occupancy bed:
+    source_columns = list()
+    for asm in options.selected_sources:
+        source_columns.append(liftovers_jobs.addChildJobFn(ancestor_projection.get_ancestor_columns, ancestor_liftovers_job.rv(asm)).rv())
+    occupancy_bed = liftovers_jobs.addFollowOnJobFn(ancestor_projection.write_occupancy_bed, source_columns).rv()
+    occupancy_jobs = liftovers_jobs.encapsulate()
+
+    # Part 3: lift the occupancy bed back onto each target, for its mapping depths. These
+    # liftovers depend on the sources chosen, so they're never checkpointed.
+    projection_options = all_to_all_liftovers.get_liftover_options(options.liftover_preview_lines, options.liftover_retries, halLiftover_arguments=options.halLiftover_arguments, memory=options.liftover_memory)
+    mapping_depths = dict()
+    n_bases_unmapped = dict()
+    for asm in options.selected_targets:
+        projection_job = occupancy_jobs.addChildJobFn(all_to_all_liftovers.liftover, hal_file, ancestor, occupancy_bed, asm, projection_options, **all_to_all_liftovers.get_liftover_resources(projection_options))
+        self_occupancy = 1 if asm in options.selected_sources else 0
+        projected_depths_job = projection_job.addFollowOnJobFn(ancestor_projection.calculate_projected_mapping_depths, projection_job.rv(), length_table, asm, self_occupancy)
+        mapping_depths[asm] = projected_depths_job.rv("mapping_depths")
+        n_bases_unmapped[asm] = projected_depths_job.rv("n_bases_unmapped")
+    mapping_depths_jobs = occupancy_jobs.encapsulate()
+
+    output_file = mapping_depths_jobs.addChildJobFn(asm_mapping_depths_output, mapping_depths, length_table, n_bases_unmapped).rv()
+    return {"output": output_file, "occupancy": occupancy_bed}
+
+@job_metrics.instrumented
+def asm_mapping_depths_output(job, mapping_depths, length_table, n_bases_unmapped):
     output_file = job.fileStore.getLocalTempFile()
-    # for asm, len_dict in contig_lengths.items():
-    #     print(asm, len(len_dict))
+    write_asm_mapping_depths(output_file, mapping_depths, contig_length_table.load_asm_lengths(job, length_table), contig_length_table.load_asm_n_bases(job, length_table), n_bases_unmapped)
+    job_metrics.record(output_bytes=job_metrics.get_file_size(output_file))
+    return job.fileStore.writeGlobalFile(output_file)
+
+def get_ratio_excluding_n(bases, n_bases, length, length_n_bases):
+    """
+    bases/length, with the N bases taken out of both, e.g. so that the runs of Ns in a
+    scaffolded assembly don't count as unmapped.
+    """
+    return (bases - n_bases)/(length - length_n_bases) if length > length_n_bases else 0
+
+def write_asm_mapping_depths(output_file, mapping_depths, asm_lengths, asm_n_bases, n_bases_unmapped):
+    """
+    asm_lengths is dict of key: asm, value: sum of the lengths of its contigs, and
+    asm_n_bases the same for the bases in its runs of Ns. n_bases_unmapped has key: asm,
+    value: the bases of its runs of Ns at depth 0.
+    """
     with open(output_file, "w") as outf:
         for target_asm, (asm_mapping_depths, debug_1_if, debug_2_if) in mapping_depths.items():
             # (asm_mapping_depths, debug_1_if, debug_2_if) = mapping_depths[target_asm]
@@ -42,17 +126,12 @@ def asm_mapping_depths_output(job, mapping_depths, contig_lengths):
             asm_predicted_length = int()
             for depth in asm_mapping_depths:
                 asm_predicted_length += asm_mapping_depths[depth]
-            outf.write("sum of all bases in " + target_asm + " according to mapping_depths calc:\t" + str(asm_predicted_length) + "\ttrue length:\t" + str(get_asm_length(contig_lengths[target_asm])) + "\tratio:\t" + str(asm_predicted_length/get_asm_length(contig_lengths[target_asm])) + "\n")
+            outf.write("sum of all bases in " + target_asm + " according to mapping_depths calc:\t" + str(asm_predicted_length) + "\ttrue length:\t" + str(asm_lengths[target_asm]) + "\tratio:\t" + str(asm_predicted_length/asm_lengths[target_asm]) + "\n")
+            bases_unmapped = asm_mapping_depths.get(0, 0)
+            outf.write("N bases:\t" + str(asm_n_bases[target_asm]) + "\tbases at depth 0:\t" + str(bases_unmapped) + "\tN bases at depth 0:\t" + str(n_bases_unmapped[target_asm]) + "\tdepth 0 ratio excluding N:\t" + str(get_ratio_excluding_n(bases_unmapped, n_bases_unmapped[target_asm], asm_lengths[target_asm], asm_n_bases[target_asm])) + "\n")
             outf.write("debug_1_if "  + str(debug_1_if) +  " debug_2_if "  + str(debug_2_if) + "\n")
-        asm_lengths = dict()
-        for asm in contig_lengths:
-            asm_lengths[asm] = get_asm_length(contig_lengths[asm])
 
         outf.write("\nasm_mapping_depths dictionary:\n" + str(mapping_depths) + "\n\nasm_lengths dictionary:\n" + str(asm_lengths) + "\n")
-
-
-        
-    return job.fileStore.writeGlobalFile(output_file)
             
 # def get_bases_unmapped(job, assembly_files, hal_file, options):
 #     leader = job.addChildJobFn(all_to_all_liftovers.empty)
@@ -93,33 +172,81 @@ def asm_mapping_depths_output(job, mapping_depths, contig_lengths):
     
 #     return job.fileStore.writeGlobalFile(output)
 
-def get_bases_unmapped_to_ref(job, assembly_files, ref_id, hal_file, options):
+@job_metrics.instrumented
+def get_bases_unmapped_to_ref(job, assembly_files, ref_id, hal_file, options, checkpointed_liftovers, mask_files=None):
     leader = job.addChildJobFn(all_to_all_liftovers.empty)
 
     contig_lengths = dict()
+    n_runs = dict()
     for asm, asm_file in assembly_files.items():
-        contig_lengths[asm] = leader.addChildJobFn(all_to_all_liftovers.get_contig_lengths, asm_file).rv()
+        contig_lengths_job = leader.addChildJobFn(all_to_all_liftovers.get_contig_lengths, asm_file)
+        contig_lengths[asm] = contig_lengths_job.rv("lengths")
+        n_runs[asm] = contig_lengths_job.rv("n_runs")
+    # as in get_asm_mapping_depths, jobs are only given the file ID of the lengths table.
+    length_table = leader.addFollowOnJobFn(contig_length_table.write_contig_length_table, contig_lengths, n_runs).rv()
     lengths_jobs = leader.encapsulate()
 
     # Part 1: perform all_to_ref_liftovers:
+    # with both_directions, each liftover is a psl, with the coords of both the asm and the ref.
+    liftover_options = all_to_all_liftovers.get_liftover_options(options.liftover_preview_lines, options.liftover_retries, options.checkpoint_dir, options.both_directions, options.halLiftover_arguments, options.liftover_memory)
+    cost_options = liftover_costs.get_cost_options(options.liftover_timings)
+
+    #NOTE TO SELF: below is the liftover I don't want to run. It performs the liftover to find what bases in asm are involved in the mapping are aligned to ref.
+    # liftovers[asm] = lengths_jobs.addChildJobFn(all_to_all_liftovers.ref_to_asm_liftover, ref_id, contig_lengths[ref_id], asm, hal_file).rv()
+
+    #NOTE TO SELF: below is the liftover I actually want to run, here. It performs the liftover to find what bases in ref are involved in the mapping. Potential downside for either of these is if the asm for some reason maps many places in ref, or vice-versa, we won't know about that. 
+    # the liftovers are submitted longest-first, in the one job that can see every asm's size.
+    ref_liftovers_job = lengths_jobs.addChildJobFn(all_to_all_liftovers.all_to_ref_liftovers, assembly_files, length_table, ref_id, hal_file, liftover_options, checkpointed_liftovers, cost_options)
     liftovers = dict()
     for asm in assembly_files:
-        #NOTE TO SELF: below is the liftover I don't want to run. It performs the liftover to find what bases in asm are involved in the mapping are aligned to ref.
-        # liftovers[asm] = lengths_jobs.addChildJobFn(all_to_all_liftovers.ref_to_asm_liftover, ref_id, contig_lengths[ref_id], asm, hal_file).rv()
-
-        #NOTE TO SELF: below is the liftover I actually want to run, here. It performs the liftover to find what bases in ref are involved in the mapping. Potential downside for either of these is if the asm for some reason maps many places in ref, or vice-versa, we won't know about that. 
-        liftovers[asm] = lengths_jobs.addChildJobFn(all_to_all_liftovers.asm_to_ref_liftover, asm, contig_lengths[asm], ref_id, hal_file).rv()
+        if asm != ref_id:
+            liftovers[asm] = ref_liftovers_job.rv(asm)
     #     lengths_jobs.addFollowOnJobFn(print_file, liftovers[asm], 20)
     # lengths_jobs.addFollowOnJobFn(all_to_all_liftovers.print_debug, "liftovers dictionary", liftovers)
+    # the masks are read once, for the intersections with every asm's gaps.
+    masks = None
+    if mask_files:
+        masks = lengths_jobs.addChildJobFn(mask_intersection.read_masks, mask_files, length_table, ref_id).rv()
     liftovers_jobs = lengths_jobs.encapsulate()
 
-    #todo: add a part 1.5, where you get the bed files from dipcalls that say which bases align to ref according to dipcalls.
+    # part 1.5: external beds of ref regions (e.g. the dipcall beds of which bases align to
+    # ref according to dipcall) are intersected with the gaps with --masks, in part 2.
 
     # Part 2: calculate the bases mapped between each assembly and the ref:
     print("before_print_test")
 
 
-    bases_unmapped = dict()
+    # gap_length_counts has key: asm, value: col.Counter(key: gap length, value: number of gaps)
+    gap_length_counts = dict()
+    # asm_gap_length_counts is the same, for the gaps in each asm unmapped to ref (with
+    # both_directions).
+    asm_gap_length_counts = dict()
+    # gap_n_base_counts and asm_gap_n_base_counts are the N bases in those gaps.
+    gap_n_base_counts = dict()
+    asm_gap_n_base_counts = dict()
+    index_files = None
+    if options.index_dir is not None:
+        index_files = dict()
+    # unmapped_tables has key: asm, value: its part of the per-contig unmapped table.
+    unmapped_tables = None
+    if options.table_format is not None:
+        unmapped_tables = dict()
+    # multiplicity has key: asm, value: the bases of ref covered 0, 1, 2 and >= 3 times by asm.
+    multiplicity = dict()
+    multiplicity_options = calculate_bases_unmapped.get_multiplicity_options(options.export_multicopy_regions)
+    # multicopy_regions has key: asm, value: bed of the regions of ref covered at least twice by asm.
+    multicopy_regions = dict() if options.export_multicopy_regions else None
+    poor_mapping_options = None
+    poor_mapping_regions = None
+    if options.export_poor_regions:
+        poor_mapping_options = interval_kernels.get_poor_mapping_options(options.minimum_size_gap, options.sequence_context)
+        # poor_mapping_regions has key: asm, value: (bed, fasta) of the regions of ref poorly mapped to asm.
+        poor_mapping_regions = dict()
+    # gaps_unmapped has key: asm, value: the gaps in ref unmapped to asm, for the masks.
+    gaps_unmapped = dict()
+    # source_coverage_coords has key: asm, value: the coords of ref covered by asm, for the
+    # ref's source_coverage store.
+    source_coverage_coords = dict()
     for asm in assembly_files:
         if asm != ref_id:
             # print("before_print_contig_lengths")
@@ -138,18 +265,66 @@ def get_bases_unmapped_to_ref(job, assembly_files, ref_id, hal_file, options):
             #compatible with ref_to_asm_liftover
             # bases_unmapped[asm] = liftovers_jobs.addChildJobFn(calculate_bases_unmapped.calculate_bases_unmapped, [liftovers[asm]], contig_lengths[asm], options.minimum_size_gap).rv()
             #compatible with asm_to_ref_liftover
-            bases_unmapped[asm] = liftovers_jobs.addChildJobFn(calculate_bases_unmapped.calculate_bases_unmapped, [liftovers[asm]], contig_lengths[ref_id], options.minimum_size_gap).rv()
+            index_track = ref_id + "_from_" + asm if index_files is not None else None
+            table_options = None
+            if unmapped_tables is not None:
+                table_options = result_tables.get_table_options(options.table_format, {"ref": ref_id, "asm": asm}, options.minimum_size_gap)
+            if options.both_directions:
+                # the psl is read once, into the coverage of both the ref and the asm.
+                psl_job = liftovers_jobs.addChildJobFn(calculate_bases_unmapped.get_psl_coverage_points, liftovers[asm], length_table, ref_id, asm)
+                bases_unmapped_job = psl_job.addFollowOnJobFn(calculate_bases_unmapped.calculate_bases_unmapped, list(), length_table, ref_id, index_track, poor_mapping_options, table_options, [psl_job.rv(0)], multiplicity_options)
+                asm_bases_unmapped_job = psl_job.addFollowOnJobFn(calculate_bases_unmapped.calculate_bases_unmapped, list(), length_table, asm, liftover_coverage_points=[psl_job.rv(1)])
+                asm_gap_length_counts[asm] = asm_bases_unmapped_job.rv("gap_length_counts")
+                asm_gap_n_base_counts[asm] = asm_bases_unmapped_job.rv("gap_n_base_counts")
+            else:
+                bases_unmapped_job = liftovers_jobs.addChildJobFn(calculate_bases_unmapped.calculate_bases_unmapped, [liftovers[asm]], length_table, ref_id, index_track, poor_mapping_options, table_options, multiplicity_options=multiplicity_options)
+            gap_length_counts[asm] = bases_unmapped_job.rv("gap_length_counts")
+            gap_n_base_counts[asm] = bases_unmapped_job.rv("gap_n_base_counts")
+            multiplicity[asm] = bases_unmapped_job.rv("multiplicity")
+            if multicopy_regions is not None:
+                multicopy_regions[asm] = bases_unmapped_job.rv("multicopy_bed")
+            if unmapped_tables is not None:
+                unmapped_tables[asm] = bases_unmapped_job.rv("unmapped_table")
+            if index_files is not None:
+                index_files[index_track] = bases_unmapped_job.rv("index")
+            if poor_mapping_regions is not None:
+                poor_mapping_fasta = bases_unmapped_job.addFollowOnJobFn(poor_mapping_regions_module.write_poor_mapping_fasta, bases_unmapped_job.rv("poor_mapping_bed"), assembly_files[ref_id]).rv()
+                poor_mapping_regions[asm] = (bases_unmapped_job.rv("poor_mapping_bed"), poor_mapping_fasta)
+            source_coverage_coords[asm] = bases_unmapped_job.rv("mapping_coverage_coords")
+            gaps_unmapped[asm] = bases_unmapped_job.rv("gaps_unmapped")
             print("out_fxn_end")
 
             # bases_unmapped[asm] = liftovers_jobs.addChildJobFn(get_bases_unmapped_between_two_asms, liftovers[asm_file] asm_file, ref_id, hal_file).rv()
     bases_unmapped_jobs = liftovers_jobs.encapsulate()
     # for use with ref_to_asm_liftover:
+    save_job = bases_unmapped_jobs.addChildJobFn(save_bases_in_ref_unmapped_to_asms, ref_id, length_table, gap_length_counts, gap_n_base_counts, options.minimum_size_gap, options.gap_thresholds)
+    multiplicity_output = bases_unmapped_jobs.addChildJobFn(save_ref_multiplicity, ref_id, length_table, multiplicity).rv()
+    asms_output = None
+    if options.both_directions:
+        asms_output = bases_unmapped_jobs.addChildJobFn(save_bases_in_asms_unmapped_to_ref, ref_id, length_table, asm_gap_length_counts, asm_gap_n_base_counts, options.minimum_size_gap).rv()
+    store_files = None
+    if options.source_coverage_dir is not None:
+        store_options = source_coverage.get_store_options(ref_id, list(source_coverage_coords))
+        store_files = {ref_id: bases_unmapped_jobs.addChildJobFn(source_coverage.write_source_coverage_store, source_coverage_coords, length_table, ref_id, store_options).rv()}
+    mask_summary = None
+    masks_tables = None
+    if masks is not None:
+        mask_totals = dict()
+        if options.table_format is not None:
+            masks_tables = dict()
+        for asm, asm_gaps_unmapped in gaps_unmapped.items():
+            mask_options = mask_intersection.get_mask_options(ref_id, asm, options.minimum_size_gap, options.table_format)
+            masks_job = bases_unmapped_jobs.addChildJobFn(mask_intersection.intersect_masks, asm_gaps_unmapped, masks, length_table, mask_options)
+            mask_totals[asm] = masks_job.rv("mask_totals")
+            if masks_tables is not None:
+                masks_tables[asm] = masks_job.rv("masks_table")
+        mask_summary = bases_unmapped_jobs.encapsulate().addChildJobFn(mask_intersection.save_mask_summary, ref_id, mask_totals).rv()
     if options.export_liftovers:
-        return bases_unmapped_jobs.addChildJobFn(save_bases_in_ref_unmapped_to_asms, ref_id, contig_lengths, bases_unmapped).rv(), liftovers
+        return {"output": save_job.rv(0), "gap_threshold_curve": save_job.rv(1), "liftovers": liftovers, "indexes": index_files, "poor_mapping_regions": poor_mapping_regions, "tables": {"unmapped": unmapped_tables, "masks": masks_tables}, "source_coverage": store_files, "mask_summary": mask_summary, "asms_output": asms_output, "multiplicity": multiplicity_output, "multicopy_regions": multicopy_regions}
     else:
-        return bases_unmapped_jobs.addChildJobFn(save_bases_in_ref_unmapped_to_asms, ref_id, contig_lengths, bases_unmapped).rv()
-    # for use with ref_to_asm_liftover:
-    # return bases_unmapped_jobs.addChildJobFn(save_bases_in_asms_unmapped_to_ref, ref_id, contig_lengths, bases_unmapped).rv()
+        return {"output": save_job.rv(0), "gap_threshold_curve": save_job.rv(1), "indexes": index_files, "poor_mapping_regions": poor_mapping_regions, "tables": {"unmapped": unmapped_tables, "masks": masks_tables}, "source_coverage": store_files, "mask_summary": mask_summary, "asms_output": asms_output, "multiplicity": multiplicity_output, "multicopy_regions": multicopy_regions}
+    # the bases in asms unmapped to ref (i.e. what ref_to_asm_liftover would give) now come
+    # from --both_directions, as asms_output.
 
     #todo: consider automating calls to dipcall for comparisons, too.
 
@@ -163,38 +338,220 @@ def print_file(job, pfile, num_lines):
                 break
             line_cnt += 1
 
-def save_bases_in_ref_unmapped_to_asms(job, ref_id, contig_lengths, bases_unmapped):
+@job_metrics.instrumented
+def save_bases_in_ref_unmapped_to_asms(job, ref_id, length_table, gap_length_counts, gap_n_base_counts, minimum_size_gap, gap_thresholds):
+    """
+    Returns (output, gap_threshold_curve) files.
+    """
+    asm_lengths = contig_length_table.load_asm_lengths(job, length_table)
     output = job.fileStore.getLocalTempFile()
+    write_bases_in_ref_unmapped_to_asms(output, ref_id, asm_lengths, get_bases_unmapped_to_asms(gap_length_counts, minimum_size_gap), contig_length_table.load_asm_n_bases(job, length_table), get_n_bases_unmapped_to_asms(gap_n_base_counts, minimum_size_gap))
+    gap_threshold_curve = job.fileStore.getLocalTempFile()
+    write_gap_threshold_curve(gap_threshold_curve, ref_id, asm_lengths, gap_length_counts, gap_thresholds)
+    job_metrics.record(output_bytes=job_metrics.get_file_size(output) + job_metrics.get_file_size(gap_threshold_curve))
+    return job.fileStore.writeGlobalFile(output), job.fileStore.writeGlobalFile(gap_threshold_curve)
+
+def get_bases_unmapped_to_asms(gap_length_counts, minimum_size_gap):
+    bases_unmapped = dict()
+    for asm, asm_gap_length_counts in gap_length_counts.items():
+        bases_unmapped[asm] = interval_kernels.get_bases_unmapped(asm_gap_length_counts, minimum_size_gap)
+    return bases_unmapped
+
+def get_n_bases_unmapped_to_asms(gap_n_base_counts, minimum_size_gap):
+    n_bases_unmapped = dict()
+    for asm, asm_gap_n_base_counts in gap_n_base_counts.items():
+        n_bases_unmapped[asm] = interval_kernels.get_n_bases_unmapped(asm_gap_n_base_counts, minimum_size_gap)
+    return n_bases_unmapped
+
+def write_gap_threshold_curve(output, ref_id, asm_lengths, gap_length_counts, gap_thresholds):
+    """
+    Writes the bases in ref unmapped to each asm at every minimum_size_gap in 
+    gap_thresholds, all from the one set of liftovers.
+    """
+    ref_length = asm_lengths[ref_id]
+    with open(output, "w") as outf:
+        outf.write("asm\tminimum_size_gap\tbases_unmapped_in_ref\tgaps_unmapped_in_ref\tbases_unmapped_in_ref/ref_length_ratio\n")
+        for asm in asm_lengths:
+            if asm != ref_id:
+                for threshold, bases_unmapped, gaps in interval_kernels.get_threshold_curve(gap_length_counts[asm], gap_thresholds):
+                    outf.write(asm + "\t" + str(threshold) + "\t" + str(bases_unmapped) + "\t" + str(gaps) + "\t" + str(bases_unmapped/ref_length) + "\n")
+
+def write_bases_in_ref_unmapped_to_asms(output, ref_id, asm_lengths, bases_unmapped, asm_n_bases, n_bases_unmapped):
+    """
+    asm_lengths is dict of key: asm, value: sum of the lengths of its contigs, and
+    asm_n_bases the same for the bases in its runs of Ns. n_bases_unmapped has key: asm,
+    value: the N bases of ref in bases_unmapped[asm].
+    """
     with open(output, "w") as outf:
-        outf.write("asm\tbases_unmapped_in_ref\tref_length\tbases_unmapped_in_ref/ref_length_ratio\n")
+        outf.write("asm\tbases_unmapped_in_ref\tref_length\tbases_unmapped_in_ref/ref_length_ratio\tref_n_bases\tn_bases_unmapped_in_ref\tbases_unmapped_in_ref/ref_length_ratio_excluding_n\n")
 
-        asm_lengths = dict()
-        for asm in contig_lengths:
-            asm_lengths[asm] = get_asm_length(contig_lengths[asm])
-        
-        for asm in contig_lengths:
+        for asm in asm_lengths:
             if asm != ref_id: #todo: consider adding reference to full analysis (even though meaningless)
-                outf.write(asm + "\t" + str(bases_unmapped[asm]) + "\t" + str(asm_lengths[ref_id]) + "\t" + str(bases_unmapped[asm]/asm_lengths[ref_id]) + "\n")
-    
+                outf.write(asm + "\t" + str(bases_unmapped[asm]) + "\t" + str(asm_lengths[ref_id]) + "\t" + str(bases_unmapped[asm]/asm_lengths[ref_id]) + "\t" + str(asm_n_bases[ref_id]) + "\t" + str(n_bases_unmapped[asm]) + "\t" + str(get_ratio_excluding_n(bases_unmapped[asm], n_bases_unmapped[asm], asm_lengths[ref_id], asm_n_bases[ref_id])) + "\n")
+
+@job_metrics.instrumented
+def save_ref_multiplicity(job, ref_id, length_table, multiplicity):
+    output = job.fileStore.getLocalTempFile()
+    write_ref_multiplicity(output, ref_id, contig_length_table.load_asm_lengths(job, length_table), multiplicity)
+    job_metrics.record(output_bytes=job_metrics.get_file_size(output))
     return job.fileStore.writeGlobalFile(output)
 
-def save_bases_in_asms_unmapped_to_ref(job, ref_id, contig_lengths, bases_unmapped):
+def write_ref_multiplicity(output, ref_id, asm_lengths, multiplicity):
+    """
+    multiplicity has key: asm, value: the bases of ref covered 0, 1, 2 and >= 3 times by
+    asm's liftover (see interval_kernels.get_multiplicity).
+    """
+    ref_length = asm_lengths[ref_id]
+    with open(output, "w") as outf:
+        outf.write("asm\tref_length\tbases_covered_0x\tbases_covered_1x\tbases_covered_2x\tbases_covered_3x_or_more\tbases_covered_2x_or_more/ref_length_ratio\n")
+        for asm in asm_lengths:
+            if asm != ref_id:
+                outf.write(asm + "\t" + str(ref_length) + "".join("\t" + str(bases) for bases in multiplicity[asm]) + "\t" + str(sum(multiplicity[asm][2:])/ref_length) + "\n")
+
+@job_metrics.instrumented
+def save_bases_in_asms_unmapped_to_ref(job, ref_id, length_table, gap_length_counts, gap_n_base_counts, minimum_size_gap):
+    """
+    gap_length_counts has key: asm, value: the gap lengths in asm unmapped to ref, and
+    gap_n_base_counts the N bases in those gaps.
+    """
     output = job.fileStore.getLocalTempFile()
+    write_bases_in_asms_unmapped_to_ref(output, ref_id, contig_length_table.load_asm_lengths(job, length_table), get_bases_unmapped_to_asms(gap_length_counts, minimum_size_gap), contig_length_table.load_asm_n_bases(job, length_table), get_n_bases_unmapped_to_asms(gap_n_base_counts, minimum_size_gap))
+    job_metrics.record(output_bytes=job_metrics.get_file_size(output))
+    return job.fileStore.writeGlobalFile(output)
+
+def write_bases_in_asms_unmapped_to_ref(output, ref_id, asm_lengths, bases_unmapped, asm_n_bases, n_bases_unmapped):
     with open(output, "w") as outf:
-        outf.write("asm\tbases_unmapped_in_asm\tassembly_lengths\tbases_unmapped_in_asm/assembly_lengths_ratio\n")
+        outf.write("asm\tbases_unmapped_in_asm\tassembly_lengths\tbases_unmapped_in_asm/assembly_lengths_ratio\tasm_n_bases\tn_bases_unmapped_in_asm\tbases_unmapped_in_asm/assembly_lengths_ratio_excluding_n\n")
 
-        asm_lengths = dict()
-        for asm in contig_lengths:
-            asm_lengths[asm] = get_asm_length(contig_lengths[asm])
-        
-        for asm in contig_lengths:
+        for asm in asm_lengths:
             if asm != ref_id: #todo: consider adding reference to full analysis (even though meaningless)
-                outf.write(asm + "\t" + str(bases_unmapped[asm]) + "\t" + str(asm_lengths[asm]) + "\t" + str(bases_unmapped[asm]/asm_lengths[asm]) + "\n")
-    
+                outf.write(asm + "\t" + str(bases_unmapped[asm]) + "\t" + str(asm_lengths[asm]) + "\t" + str(bases_unmapped[asm]/asm_lengths[asm]) + "\t" + str(asm_n_bases[asm]) + "\t" + str(n_bases_unmapped[asm]) + "\t" + str(get_ratio_excluding_n(bases_unmapped[asm], n_bases_unmapped[asm], asm_lengths[asm], asm_n_bases[asm])) + "\n")
+
+
+
+
+@job_metrics.instrumented
+def get_approximate_bases_unmapped_to_ref(job, assembly_files, ref_id, hal_file, options):
+    """
+    Like get_bases_unmapped_to_ref, but estimated from a sample of windows in the ref (see
+    sampled_liftovers), which are lifted over from the ref to each asm. minimum_size_gap
+    doesn't apply here.
+    """
+    leader = job.addChildJobFn(all_to_all_liftovers.empty)
+
+    contig_lengths = dict()
+    n_runs = dict()
+    for asm, asm_file in assembly_files.items():
+        contig_lengths_job = leader.addChildJobFn(all_to_all_liftovers.get_contig_lengths, asm_file)
+        contig_lengths[asm] = contig_lengths_job.rv("lengths")
+        n_runs[asm] = contig_lengths_job.rv("n_runs")
+    # as in get_bases_unmapped_to_ref, jobs are only given the file ID of the lengths table.
+    length_table = leader.addFollowOnJobFn(contig_length_table.write_contig_length_table, contig_lengths, n_runs).rv()
+    lengths_jobs = leader.encapsulate()
+
+    # Part 1: sample windows from the ref:
+    sampled_bed_job = lengths_jobs.addChildJobFn(sampled_liftovers.write_sampled_bed, length_table, ref_id, options.sample_windows, options.sample_window_size, options.seed)
+    sampled_bed_jobs = lengths_jobs.encapsulate()
+
+    # Part 2: lift the sampled windows over to each asm, and estimate the fraction of the ref
+    # they leave unmapped. Sampled liftovers are never checkpointed, as they'd be mistaken 
+    # for full ones.
+    liftover_options = all_to_all_liftovers.get_liftover_options(options.liftover_preview_lines, options.liftover_retries, halLiftover_arguments=options.halLiftover_arguments, memory=options.liftover_memory)
+    estimates = dict()
+    for asm in assembly_files:
+        if asm != ref_id:
+            liftover_job = sampled_bed_jobs.addChildJobFn(all_to_all_liftovers.liftover, hal_file, ref_id, sampled_bed_job.rv(0), asm, liftover_options, **all_to_all_liftovers.get_liftover_resources(liftover_options))
+            copies_job = liftover_job.addFollowOnJobFn(sampled_liftovers.count_sampled_copies, liftover_job.rv())
+            estimates[asm] = copies_job.addFollowOnJobFn(sampled_liftovers.estimate_unmapped_fraction, sampled_bed_job.rv(1), sampled_bed_job.rv(2), copies_job.rv(), options.bootstraps, options.seed).rv()
+    estimates_jobs = sampled_bed_jobs.encapsulate()
+
+    return {"output": estimates_jobs.addChildJobFn(save_approximate_bases_in_ref_unmapped_to_asms, ref_id, length_table, estimates, options).rv()}
+
+@job_metrics.instrumented
+def save_approximate_bases_in_ref_unmapped_to_asms(job, ref_id, length_table, estimates, options):
+    output = job.fileStore.getLocalTempFile()
+    write_approximate_bases_in_ref_unmapped_to_asms(output, ref_id, contig_length_table.load_asm_lengths(job, length_table), estimates, options)
+    job_metrics.record(output_bytes=job_metrics.get_file_size(output))
     return job.fileStore.writeGlobalFile(output)
 
+def write_approximate_bases_in_ref_unmapped_to_asms(output, ref_id, asm_lengths, estimates, options):
+    """
+    asm_lengths is dict of key: asm, value: sum of the lengths of its contigs. estimates is
+    dict of key: asm, value: (estimate, ci_low, ci_high) of the fraction of the ref unmapped
+    to that asm.
+    """
+    ref_length = asm_lengths[ref_id]
+    with open(output, "w") as outf:
+        outf.write("# approximate, from " + str(options.sample_windows) + " windows of " + str(options.sample_window_size) + " bases sampled from " + ref_id + " (seed " + str(options.seed) + "), with 95% bootstrap confidence intervals\n")
+        outf.write("asm\testimated_bases_unmapped_in_ref\tci_low\tci_high\tref_length\testimated_bases_unmapped_in_ref/ref_length_ratio\tratio_ci_low\tratio_ci_high\n")
+        for asm in asm_lengths:
+            if asm != ref_id:
+                estimate, ci_low, ci_high = estimates[asm]
+                outf.write(asm + "\t" + str(round(estimate * ref_length)) + "\t" + str(round(ci_low * ref_length)) + "\t" + str(round(ci_high * ref_length)) + "\t" + str(ref_length) + "\t" + str(estimate) + "\t" + str(ci_low) + "\t" + str(ci_high) + "\n")
+
+@job_metrics.instrumented
+def get_approximate_asm_mapping_depths(job, assembly_files, hal_file, options):
+    """
+    Like get_asm_mapping_depths, but estimated from a sample of windows in each asm (see 
+    sampled_liftovers), which are lifted over from that asm to every other asm.
+    """
+    leader = job.addChildJobFn(all_to_all_liftovers.empty)
 
+    contig_lengths = dict()
+    n_runs = dict()
+    for asm, asm_file in assembly_files.items():
+        contig_lengths_job = leader.addChildJobFn(all_to_all_liftovers.get_contig_lengths, asm_file)
+        contig_lengths[asm] = contig_lengths_job.rv("lengths")
+        n_runs[asm] = contig_lengths_job.rv("n_runs")
+    # as in get_bases_unmapped_to_ref, jobs are only given the file ID of the lengths table.
+    length_table = leader.addFollowOnJobFn(contig_length_table.write_contig_length_table, contig_lengths, n_runs).rv()
+    lengths_jobs = leader.encapsulate()
+
+    # Part 1: sample windows from each target asm:
+    sampled_bed_jobs = dict()
+    for asm in options.selected_targets:
+        sampled_bed_jobs[asm] = lengths_jobs.addChildJobFn(sampled_liftovers.write_sampled_bed, length_table, asm, options.sample_windows, options.sample_window_size, options.seed)
+    all_sampled_bed_jobs = lengths_jobs.encapsulate()
+
+    # Part 2: lift each target asm's sampled windows over to every source asm:
+    liftover_options = all_to_all_liftovers.get_liftover_options(options.liftover_preview_lines, options.liftover_retries, halLiftover_arguments=options.halLiftover_arguments, memory=options.liftover_memory)
+    sampled_copies = dict()
+    for target_asm in options.selected_targets:
+        sampled_copies[target_asm] = list()
+        for source_asm in options.selected_sources:
+            if source_asm != target_asm:
+                liftover_job = all_sampled_bed_jobs.addChildJobFn(all_to_all_liftovers.liftover, hal_file, target_asm, sampled_bed_jobs[target_asm].rv(0), source_asm, liftover_options, **all_to_all_liftovers.get_liftover_resources(liftover_options))
+                sampled_copies[target_asm].append(liftover_job.addFollowOnJobFn(sampled_liftovers.count_sampled_copies, liftover_job.rv()).rv())
+    sampled_copies_jobs = all_sampled_bed_jobs.encapsulate()
+
+    # Part 3: estimate the fraction of each target asm at each mapping depth:
+    depth_estimates = dict()
+    for asm in options.selected_targets:
+        depth_estimates[asm] = sampled_copies_jobs.addChildJobFn(sampled_liftovers.estimate_depth_fractions, sampled_bed_jobs[asm].rv(1), sampled_bed_jobs[asm].rv(2), sampled_copies[asm], options.bootstraps, options.seed).rv()
+    depth_estimates_jobs = sampled_copies_jobs.encapsulate()
+
+    return {"output": depth_estimates_jobs.addChildJobFn(save_approximate_asm_mapping_depths, depth_estimates, length_table, options).rv()}
+
+@job_metrics.instrumented
+def save_approximate_asm_mapping_depths(job, depth_estimates, length_table, options):
+    output = job.fileStore.getLocalTempFile()
+    write_approximate_asm_mapping_depths(output, depth_estimates, contig_length_table.load_asm_lengths(job, length_table), options)
+    job_metrics.record(output_bytes=job_metrics.get_file_size(output))
+    return job.fileStore.writeGlobalFile(output)
 
+def write_approximate_asm_mapping_depths(output, depth_estimates, asm_lengths, options):
+    """
+    asm_lengths is dict of key: asm, value: sum of the lengths of its contigs.
+    depth_estimates is dict of key: asm, value: dict(key: mapping depth, value: (estimate,
+    ci_low, ci_high) of the fraction of the asm at that depth).
+    """
+    with open(output, "w") as outf:
+        outf.write("# approximate, from " + str(options.sample_windows) + " windows of " + str(options.sample_window_size) + " bases sampled from each asm (seed " + str(options.seed) + "), with 95% bootstrap confidence intervals\n")
+        outf.write("asm\tmapping_depth\testimated_bases\testimated_fraction\tfraction_ci_low\tfraction_ci_high\n")
+        for asm, estimates in depth_estimates.items():
+            asm_length = asm_lengths[asm]
+            for depth, (estimate, ci_low, ci_high) in estimates.items():
+                outf.write(asm + "\t" + str(depth) + "\t" + str(round(estimate * asm_length)) + "\t" + str(estimate) + "\t" + str(ci_low) + "\t" + str(ci_high) + "\n")
 
 def parse_seq_file(seq_file):
     assembly_files = dict()
@@ -221,27 +578,211 @@ def main():
     Example call for small_chr21 example:
     python cactus_connectivity.py js small_chr21.txt ./halLiftover_all_to_all/ref_based_small_chr21.hal
     """
+    from toil.common import Toil
+    from toil.job import Job
     parser = ArgumentParser()
     Job.Runner.addToilOptions(parser)
     parser.add_argument(
         'seq_file', help='A tab separated file with two columns: the name of each assembly, and the name of its respective fasta files in their file locations. Similar format to seqFile used as input for cactus-prepare.', type=str)
     parser.add_argument(
-        'hal_file', help='The location of the hal file to be profiled.', type=str)
+        'hal_file', help='The location of the hal file to be profiled. Left out with --paf.', nargs='?', type=str)
     #todo: minimum size gap includes more seq not mapped, or more seq as mapped?
     parser.add_argument(
-        '--minimum_size_gap', help="When calculating the amount of sequence that isn't mapped, you can specify to include bases that are (not?) mapped that are smaller than the specified gapsize.TODOFINISH.", type=str)
+        '--minimum_size_gap', help="When calculating the amount of sequence that isn't mapped, gaps between mappings (i.e. runs of unmapped bases) smaller than this are counted as mapped. The default, 0, counts every unmapped base.", default=0, type=int)
+    parser.add_argument(
+        '--gap_thresholds', help="Used in conjunction with get_bases_unmapped_to_ref, the minimum_size_gaps to report the bases unmapped at, in a curve saved next to the output (with _gap_thresholds.tsv in place of its extension). These all come from the same liftovers, so cost nothing extra.", nargs='+', default=[0] + [multiple * 10**power for power in range(7) for multiple in (1, 2, 5)], type=int)
     # parser.add_argument(
     #     '--get_bases_unmapped', help="Returns", type=str)
     parser.add_argument(
-        '--get_bases_unmapped_to_ref', help="Given a string representing which asm is treated as the reference, gives the bases mapped to that ref for every other asm.", type=str)
+        '--get_bases_unmapped_to_ref', help="Given a string representing which asm is treated as the reference, gives the bases mapped to that ref for every other asm. If not given, calculates the all-to-all mapping depths of every asm instead.", type=str)
     parser.add_argument(
         '--export_liftovers', help="Used in conjunction with get_bases_unmapped_to_ref, will export all liftover bedfiles.", action='store_true')
+    parser.add_argument(
+        '--both_directions', help="Used in conjunction with get_bases_unmapped_to_ref, runs each asm's liftover to the ref with psl output, which has the coords of both sides of every aligned block. So the same liftovers also give the bases of each asm unmapped to the ref, saved next to the output with _asms_unmapped_to_ref.tsv in place of its extension, without a second liftover per asm.", action='store_true')
+    parser.add_argument(
+        '--targets', help="Only measure these target assemblies. Not used with --get_bases_unmapped_to_ref, where the ref is the only target.", nargs='+', type=str)
+    parser.add_argument(
+        '--target_regex', help="Only measure the target assemblies whose whole name matches this regex.", type=str)
+    parser.add_argument(
+        '--target_subtree', help="Only measure the target assemblies under this ancestor in the hal's phylogeny (read with halStats --tree).", type=str)
+    parser.add_argument(
+        '--sources', help="Only lift these assemblies over to the targets (or the ref).", nargs='+', type=str)
+    parser.add_argument(
+        '--source_regex', help="Only lift the assemblies whose whole name matches this regex over to the targets (or the ref).", type=str)
+    parser.add_argument(
+        '--source_subtree', help="Only lift the assemblies under this ancestor in the hal's phylogeny over to the targets (or the ref). With any of the target or source restrictions, the pairs that aren't run are listed next to the output, with _pruned_pairs.tsv in place of its extension.", type=str)
     parser.add_argument(
         '--output', help='The dir to save the output, target bedfiles.', default='./cactus_connectivity_output.txt', type=str)
+    parser.add_argument(
+        '--local', help="Skip toil entirely, and run the liftovers as local halLiftover subprocesses (at most --max_local_liftovers at a time), streaming their output straight into memory. Much faster for small graphs and quick QC. The jobStore argument is ignored. Without --get_bases_unmapped_to_ref, runs the all-to-all mapping depths instead.", action='store_true')
+    parser.add_argument(
+        '--paf', help="Measure the connectivity of PAF alignments (e.g. from minigraph or wfmash, optionally gzipped) between the asms of the seq_file, instead of a hal, with the same outputs. Each alignment covers both its query and its target, only in its aligned blocks if it has a cg:Z: cigar. Contig names must be unique across the asms (e.g. PanSN names). Runs locally, like --local, with no halLiftover.", nargs='+', type=str)
+    parser.add_argument(
+        '--max_local_liftovers', help="Used in conjunction with --local, the maximum number of halLiftover processes to run at once.", default=os.cpu_count(), type=int)
+    parser.add_argument(
+        '--export_poor_regions', help="Used in conjunction with get_bases_unmapped_to_ref, exports the regions of the ref poorly mapped to each asm (gaps of at least --minimum_size_gap, expanded by --sequence_context and merged) as a bed and a fasta of their sequence, ready for remapping. Saved next to the output, as <output>_poor_regions_<asm>.bed/.fa.", action='store_true')
+    parser.add_argument(
+        '--export_multicopy_regions', help="Used in conjunction with get_bases_unmapped_to_ref, exports the regions of the ref covered at least twice by each asm's liftover (e.g. where one asm region maps to several places in the ref), as <output>_multicopy_regions_<asm>.bed. The bases of the ref covered 0, 1, 2 and >= 3 times by each asm are always saved, with _ref_multiplicity.tsv in place of the output's extension.", action='store_true')
+    parser.add_argument(
+        '--sequence_context', help="Used in conjunction with --export_poor_regions, the bases of context added to each side of each poorly mapped region.", default=0, type=int)
+    parser.add_argument(
+        '--masks', help="Used in conjunction with get_bases_unmapped_to_ref, bed files of ref regions (e.g. dipcall confident regions, benchmark regions, segdup or centromere masks) to intersect with the gaps unmapped to each asm, as NAME=BED (or just BED, named after the file). The bases of each mask mapped and unmapped by each asm are saved next to the output, with _masks.tsv in place of its extension, and per contig in the masks result table.", nargs='+', type=str)
+    parser.add_argument(
+        '--table_format', help="The format of the per-contig result tables, saved next to the output in <output>_tables/ (depths/<target> parts, or unmapped/<ref>_<asm> parts with --get_bases_unmapped_to_ref). auto gives parquet if pyarrow is installed, and tsv otherwise.", choices=result_tables.TABLE_FORMATS, default="auto", type=str)
+    parser.add_argument(
+        '--index_dir', help="If given, saves a connectivity index of the mapping depths along each target (<target>.ccidx, or <ref>_from_<asm>.ccidx with --get_bases_unmapped_to_ref) to this dir. Query them with src/connectivity_index.py for the depth, covered fraction or unmapped intervals of any region, without rerunning the liftovers.", type=str)
+    parser.add_argument(
+        '--source_coverage_dir', help="If given, saves a store of which sources cover each base of each target (<target>.ccsrc, or <ref>.ccsrc covered by every other asm with --get_bases_unmapped_to_ref) to this dir. Query them with python -m src.source_coverage for the bases covered only by some sources, by at least k of a group, or by none of a group.", type=str)
+    parser.add_argument(
+        '--via_ancestor', help="Measure the all-to-all mapping depths through an ancestor of the hal (the root, if given without a name) in O(N) liftovers: each source is lifted over once onto the ancestor, and the number of sources in each of its columns is lifted back once onto each target. The occupancy of the ancestor is saved next to the output, with _ancestor_occupancy.bed in place of its extension. Not used with --get_bases_unmapped_to_ref, which is already one liftover per asm. Ignores --export_liftovers and --table_format.", nargs='?', const="", type=str)
+    parser.add_argument(
+        '--approximate', help="For quick QC, estimate the results (with bootstrap confidence intervals) from a sample of windows in each assembly, stratified by contig length, rather than lifting over every base. Ignores --minimum_size_gap, --export_liftovers, --checkpoint_dir and --table_format.", action='store_true')
+    parser.add_argument(
+        '--sample_windows', help="Used in conjunction with --approximate, the number of windows sampled from each assembly. More windows give tighter confidence intervals.", default=1000, type=int)
+    parser.add_argument(
+        '--sample_window_size', help="Used in conjunction with --approximate, the length of each sampled window.", default=100, type=int)
+    parser.add_argument(
+        '--bootstraps', help="Used in conjunction with --approximate, the number of bootstrap resamples for the confidence intervals.", default=1000, type=int)
+    parser.add_argument(
+        '--seed', help="Used in conjunction with --approximate, the seed for sampling the windows and the bootstraps.", default=0, type=int)
+    parser.add_argument(
+        '--liftover_preview_lines', help="Log the first N lines of each liftover's output, for a quick look at the liftovers. By default, the liftovers are kept quiet, with halLiftover's stderr only logged if it fails.", default=0, type=int)
+    parser.add_argument(
+        '--halLiftover_preset', help="Settings for every halLiftover, with each liftover job's memory request to match. fast loads the whole hal into memory (--inMemory), which is much faster if the nodes have the memory for it. low_memory gives halLiftover a small hdf5 cache, and asks for less memory. default leaves halLiftover's own defaults.", choices=all_to_all_liftovers.HALLIFTOVER_PRESETS, default="default", type=str)
+    parser.add_argument(
+        '--halLiftover_options', help="Extra options passed through to every halLiftover, as one quoted string, after those of --halLiftover_preset, e.g. --halLiftover_options='--noDupes --cacheBytes 100000000'. They're checked against the installed halLiftover's --help. --outPSL is set by --both_directions, so can't be given here.", type=str)
+    parser.add_argument(
+        '--liftover_retries', help="The number of times a failed liftover (i.e. halLiftover exits nonzero, or leaves a truncated bed) is retried, each time with double the memory, before the workflow fails.", default=2, type=int)
+    parser.add_argument(
+        '--checkpoint_dir', help="If given, every liftover that finishes and passes validation is saved to this dir, and a later, fresh run with the same --checkpoint_dir reuses them instead of redoing them. The hal and halLiftover options they were made with are recorded there, and a run with a different (or rebuilt) hal or options is refused. Must be on a filesystem shared with the toil workers.", type=str)
+    parser.add_argument(
+        '--previous_metrics', help="The --job_metrics json of an earlier run on the same graph. The liftovers it timed are predicted from their timings (and ask for the memory they needed), and the rest are predicted from the lengths and contig counts of their source and target assemblies, scaled to fit. Either way, the liftovers are started longest-first, and the predicted vs actual critical path is reported in the job metrics.", type=str)
+    parser.add_argument(
+        '--job_metrics', help="Where to save the json file of per-job metrics (wall time, cpu time, peak RSS, bytes in/out, halLiftover exit statuses, interval counts), along with a summary of the slowest stages and liftovers. Defaults to the --output path, with _metrics.json in place of its extension.", type=str)
     options = parser.parse_args()
-    options.minimum_size_gap = 0
+    if (options.hal_file is None) == (options.paf is None):
+        parser.error("give either a hal_file or --paf (but not both).")
+    if options.paf is not None:
+        if options.approximate or options.via_ancestor is not None:
+            parser.error("--approximate and --via_ancestor aren't supported with --paf, as they sample or project the hal.")
+        if options.target_subtree or options.source_subtree:
+            parser.error("--target_subtree and --source_subtree aren't supported with --paf, as there's no hal tree to read.")
+        if options.export_liftovers or options.checkpoint_dir or options.halLiftover_options or options.halLiftover_preset != "default":
+            parser.error("--export_liftovers, --checkpoint_dir, --halLiftover_preset and --halLiftover_options aren't supported with --paf, as there are no liftovers.")
+    if options.approximate and options.local:
+        parser.error("--approximate isn't supported with --local.")
+    if options.approximate and options.index_dir:
+        parser.error("--index_dir isn't supported with --approximate, as the approximate mode doesn't see every base.")
+    if options.approximate and options.source_coverage_dir:
+        parser.error("--source_coverage_dir isn't supported with --approximate, as the approximate mode doesn't see every base.")
+    if options.via_ancestor is not None:
+        if options.get_bases_unmapped_to_ref is not None or options.approximate or options.local:
+            parser.error("--via_ancestor is only supported for the all-to-all mapping depths, without --approximate or --local.")
+        if options.index_dir or options.source_coverage_dir:
+            parser.error("--index_dir and --source_coverage_dir aren't supported with --via_ancestor, as the depths come from the occupancy of the ancestor, not the liftover of each source.")
+    if options.both_directions and (options.get_bases_unmapped_to_ref is None or options.approximate):
+        parser.error("--both_directions is only supported with --get_bases_unmapped_to_ref, without --approximate.")
+    mask_files = None
+    if options.masks:
+        if options.get_bases_unmapped_to_ref is None or options.approximate:
+            parser.error("--masks is only supported with --get_bases_unmapped_to_ref, without --approximate.")
+        try:
+            mask_files = mask_intersection.parse_mask_arguments(options.masks)
+        except ValueError as error:
+            parser.error(str(error))
+    options.halLiftover_arguments, options.liftover_memory = all_to_all_liftovers.get_halLiftover_preset(options.halLiftover_preset, job_metrics.get_file_size(options.hal_file) if options.paf is None else 0)
+    if options.halLiftover_options is not None:
+        options.halLiftover_arguments += shlex.split(options.halLiftover_options)
+    if options.halLiftover_arguments:
+        halLiftover_options = all_to_all_liftovers.get_halLiftover_options()
+        if halLiftover_options is None:
+            print("WARNING: halLiftover isn't on the PATH here, so the halLiftover options " + " ".join(options.halLiftover_arguments) + " can't be checked before the run.")
+        else:
+            problem = all_to_all_liftovers.validate_halLiftover_arguments(options.halLiftover_arguments, halLiftover_options)
+            if problem is not None:
+                parser.error(problem)
+    options.liftover_timings = None
+    if options.previous_metrics is not None:
+        options.liftover_timings = liftover_costs.read_liftover_timings(options.previous_metrics)
+    if options.job_metrics is None:
+        options.job_metrics = os.path.abspath(".".join(options.output.split(".")[:-1])) + "_metrics.json"
+    if options.checkpoint_dir is not None:
+        options.checkpoint_dir = os.path.abspath(options.checkpoint_dir)
+        # a rebuilt hal, or other halLiftover options, would give different liftovers.
+        problem = all_to_all_liftovers.check_checkpoint_manifest(options.checkpoint_dir, all_to_all_liftovers.get_checkpoint_manifest(options.hal_file, options.halLiftover_arguments))
+        if problem is not None:
+            parser.error(problem)
+    if options.index_dir is not None:
+        options.index_dir = os.path.abspath(options.index_dir)
+    if options.source_coverage_dir is not None:
+        options.source_coverage_dir = os.path.abspath(options.source_coverage_dir)
+    if options.approximate or options.via_ancestor is not None:
+        # the approximate output is already a table of estimates per asm, and the
+        # projected depths are swept from weighted intervals; there's no per-contig
+        # breakdown to give.
+        options.table_format = "none"
+    try:
+        options.table_format = result_tables.get_table_format(options.table_format)
+    except ImportError as error:
+        parser.error(str(error))
 
     assembly_files = parse_seq_file(options.seq_file)
+
+    # only the pairs of the selected targets and sources are run.
+    ref_id = options.get_bases_unmapped_to_ref
+    target_options = genome_subsets.get_subset_options(options.targets, options.target_regex, options.target_subtree)
+    source_options = genome_subsets.get_subset_options(options.sources, options.source_regex, options.source_subtree)
+    if ref_id is not None and (options.targets or options.target_regex or options.target_subtree):
+        parser.error("--targets, --target_regex and --target_subtree aren't used with --get_bases_unmapped_to_ref, where the ref is the only target.")
+    if ref_id is not None and ref_id not in assembly_files:
+        parser.error(ref_id + " isn't in the seq_file.")
+    if options.export_poor_regions and ref_id is not None and assembly_files[ref_id].endswith(".gz"):
+        parser.error("--export_poor_regions seeks to each region in the ref's fasta, so " + assembly_files[ref_id] + " needs to be uncompressed.")
+    tree = None
+    if options.target_subtree or options.source_subtree or options.via_ancestor is not None:
+        # the tree is read once, here, for all of them.
+        tree = genome_subsets.parse_newick(genome_subsets.read_hal_tree(options.hal_file))
+    try:
+        selection = genome_subsets.get_pair_selection(list(assembly_files), target_options, source_options, ref_id, tree)
+    except ValueError as error:
+        parser.error(str(error))
+    if not selection.pairs:
+        parser.error("no pairs of assemblies are left to lift over, with the targets and sources selected.")
+    if any(value is not None for value in vars(target_options).values()) or any(value is not None for value in vars(source_options).values()):
+        pruned_pairs_file = os.path.abspath(".".join(options.output.split(".")[:-1])) + "_pruned_pairs.tsv"
+        genome_subsets.write_pruned_pairs(pruned_pairs_file, selection.pruned)
+        print("running " + str(len(selection.pairs)) + " of the " + str(len(assembly_files)**2) + " pairs of assemblies. The " + str(len(selection.pruned)) + " pruned pairs are listed in " + pruned_pairs_file)
+    options.selected_targets = selection.targets
+    options.selected_sources = selection.sources
+    # the assemblies in no pair aren't even read.
+    assembly_files = {asm: asm_file for asm, asm_file in assembly_files.items() if asm in selection.targets or asm in selection.sources}
+    ancestor = None
+    if options.via_ancestor is not None:
+        try:
+            ancestor = ancestor_projection.get_projection_ancestor(tree, options.via_ancestor or None, list(assembly_files))
+        except ValueError as error:
+            parser.error(str(error))
+        print("projecting the mapping depths through " + ancestor + ", in " + str(len(selection.sources) + len(selection.targets)) + " liftovers rather than " + str(len(selection.pairs)))
+
+    if options.local or options.paf is not None:
+        metrics_records = list()
+        contig_lengths, results = local_liftovers.run_local(assembly_files, ref_id, options.hal_file, options, metrics_records, mask_files, options.paf)
+        asm_lengths = {asm: get_asm_length(asm_contig_lengths) for asm, asm_contig_lengths in contig_lengths.items()}
+        if ref_id is not None:
+            output_prefix = os.path.abspath(".".join(options.output.split(".")[:-1]))
+            write_bases_in_ref_unmapped_to_asms(os.path.abspath(options.output), ref_id, asm_lengths, get_bases_unmapped_to_asms(results["gap_length_counts"], options.minimum_size_gap), results["asm_n_bases"], get_n_bases_unmapped_to_asms(results["gap_n_base_counts"], options.minimum_size_gap))
+            write_gap_threshold_curve(output_prefix + "_gap_thresholds.tsv", ref_id, asm_lengths, results["gap_length_counts"], options.gap_thresholds)
+            write_ref_multiplicity(output_prefix + "_ref_multiplicity.tsv", ref_id, asm_lengths, results["multiplicity"])
+            if options.both_directions:
+                write_bases_in_asms_unmapped_to_ref(output_prefix + "_asms_unmapped_to_ref.tsv", ref_id, asm_lengths, get_bases_unmapped_to_asms(results["asm_gap_length_counts"], options.minimum_size_gap), results["asm_n_bases"], get_n_bases_unmapped_to_asms(results["asm_gap_n_base_counts"], options.minimum_size_gap))
+        else:
+            write_asm_mapping_depths(os.path.abspath(options.output), results["mapping_depths"], asm_lengths, results["asm_n_bases"], results["n_bases_unmapped"])
+        job_metrics.write_metrics(options.job_metrics, metrics_records)
+        return
+
+    # collects the metrics sent by each job to the leader's log.
+    metrics_collector = job_metrics.MetricsCollector()
+    metrics_collector.attach(options.logLevel)
     # print(assembly_files)
     
     
@@ -252,7 +793,6 @@ def main():
     # assembly_files = {"HG03098_paf_chr21": assembly_dir + "HG03098_paf_chr21.fa", "HG03492_paf_chr21": assembly_dir + "HG03492_paf_chr21.fa", "hg38_chr21": assembly_dir + "hg38_chr21.fa"}
     # hal_file = "./halLiftover_all_to_all/ref_based_small_chr21.hal"
 
-    liftovers = None
     with Toil(options) as workflow:
         if not workflow.options.restart:
             #importing files:
@@ -260,6 +800,20 @@ def main():
                 assembly_files[asm] = workflow.importFile("file://" + os.path.abspath(asm_file))
             
             hal_file = workflow.importFile("file://" + os.path.abspath(options.hal_file))
+
+            # any liftovers checkpointed by an earlier run are imported, rather than redone.
+            liftover_pairs = selection.pairs
+            if ancestor is not None:
+                liftover_pairs = [(asm, ancestor) for asm in selection.sources]
+            if mask_files is not None:
+                for name, mask_file in mask_files.items():
+                    mask_files[name] = workflow.importFile("file://" + os.path.abspath(mask_file))
+
+            checkpointed_liftovers = all_to_all_liftovers.get_checkpointed_liftovers(options.checkpoint_dir, liftover_pairs, options.both_directions)
+            for pair, checkpoint_bed in checkpointed_liftovers.items():
+                checkpointed_liftovers[pair] = workflow.importFile("file://" + checkpoint_bed)
+            if checkpointed_liftovers:
+                print("reusing", len(checkpointed_liftovers), "liftovers checkpointed in", options.checkpoint_dir)
                 
             # if options.get_bases_unmapped:
             #     output = workflow.start(Job.wrapJobFn(get_bases_unmapped, assembly_files, hal_file, options))
@@ -269,30 +823,77 @@ def main():
             # else:
             #     output = workflow.start(Job.wrapJobFn(get_asm_mapping_depths, assembly_files, hal_file))
             #todo: make it so pipline outputs important interim files if requested? Very useful for debugging/further analysis. 
-            ref_id = options.get_bases_unmapped_to_ref
-            if ref_id == None: #todo: remove quick debugging patch I've added here.
-                print("ERROR: options.get_bases_unmapped_to_ref is None! Fix that!")
-                import sys
-                sys.exit()
-            if options.export_liftovers:
-                output, liftovers = workflow.start(Job.wrapJobFn(get_bases_unmapped_to_ref, assembly_files, ref_id, hal_file, options))
+            # outputs is dict with the "output" file, plus "liftovers" if export_liftovers, 
+            # "indexes" if index_dir, and "source_coverage" if source_coverage_dir.
+            if options.approximate and ref_id == None:
+                outputs = workflow.start(Job.wrapJobFn(get_approximate_asm_mapping_depths, assembly_files, hal_file, options))
+            elif options.approximate:
+                outputs = workflow.start(Job.wrapJobFn(get_approximate_bases_unmapped_to_ref, assembly_files, ref_id, hal_file, options))
+            elif ancestor is not None:
+                outputs = workflow.start(Job.wrapJobFn(get_projected_asm_mapping_depths, assembly_files, ancestor, hal_file, options, checkpointed_liftovers))
+            elif ref_id == None:
+                outputs = workflow.start(Job.wrapJobFn(get_asm_mapping_depths, assembly_files, hal_file, options, checkpointed_liftovers))
             else:
-                output = workflow.start(Job.wrapJobFn(get_bases_unmapped_to_ref, assembly_files, ref_id, hal_file, options))
+                outputs = workflow.start(Job.wrapJobFn(get_bases_unmapped_to_ref, assembly_files, ref_id, hal_file, options, checkpointed_liftovers, mask_files))
 
             
         else:
-            if options.export_liftovers:
-                output, liftovers = workflow.restart()
-            else:
-                output = workflow.restart()
+            outputs = workflow.restart()
 
         # write output
         # print("output:", output)
-        workflow.exportFile(output, 'file://' + os.path.abspath(options.output))
-
-        if liftovers is not None: #i.e. if options.export_liftovers is True
-            for asm, liftover_file in liftovers.items():
-                workflow.exportFile(liftover_file, 'file://' + os.path.abspath(".".join(options.output.split(".")[:-1])) + "_liftover_asm_" + asm + ".bed")
+        workflow.exportFile(outputs["output"], 'file://' + os.path.abspath(options.output))
+
+        if outputs.get("gap_threshold_curve") is not None:
+            workflow.exportFile(outputs["gap_threshold_curve"], 'file://' + os.path.abspath(".".join(options.output.split(".")[:-1])) + "_gap_thresholds.tsv")
+
+        if outputs.get("multiplicity") is not None:
+            workflow.exportFile(outputs["multiplicity"], 'file://' + os.path.abspath(".".join(options.output.split(".")[:-1])) + "_ref_multiplicity.tsv")
+
+        if outputs.get("multicopy_regions") is not None: #i.e. if options.export_multicopy_regions is True
+            for asm, multicopy_bed in outputs["multicopy_regions"].items():
+                workflow.exportFile(multicopy_bed, 'file://' + os.path.abspath(".".join(options.output.split(".")[:-1])) + "_multicopy_regions_" + asm + ".bed")
+
+        if outputs.get("asms_output") is not None: #i.e. if options.both_directions is True
+            workflow.exportFile(outputs["asms_output"], 'file://' + os.path.abspath(".".join(options.output.split(".")[:-1])) + "_asms_unmapped_to_ref.tsv")
+
+        if outputs.get("mask_summary") is not None: #i.e. if options.masks is given
+            workflow.exportFile(outputs["mask_summary"], 'file://' + os.path.abspath(".".join(options.output.split(".")[:-1])) + "_masks.tsv")
+
+        if outputs.get("occupancy") is not None: #i.e. if options.via_ancestor is given
+            workflow.exportFile(outputs["occupancy"], 'file://' + os.path.abspath(".".join(options.output.split(".")[:-1])) + "_ancestor_occupancy.bed")
+
+        if outputs.get("liftovers") is not None: #i.e. if options.export_liftovers is True
+            for asm, liftover_file in outputs["liftovers"].items():
+                workflow.exportFile(liftover_file, 'file://' + os.path.abspath(".".join(options.output.split(".")[:-1])) + "_liftover_asm_" + asm + (".psl" if options.both_directions else ".bed"))
+
+        if outputs.get("poor_mapping_regions") is not None: #i.e. if options.export_poor_regions is True
+            for asm, (poor_mapping_bed, poor_mapping_fasta) in outputs["poor_mapping_regions"].items():
+                poor_mapping_prefix = os.path.abspath(".".join(options.output.split(".")[:-1])) + "_poor_regions_" + asm
+                workflow.exportFile(poor_mapping_bed, 'file://' + poor_mapping_prefix + ".bed")
+                workflow.exportFile(poor_mapping_fasta, 'file://' + poor_mapping_prefix + ".fa")
+
+        for table, table_parts in outputs.get("tables", dict()).items():
+            if table_parts is not None: #i.e. if options.table_format isn't none
+                os.makedirs(os.path.join(result_tables.get_table_dir(options.output), table), exist_ok=True)
+                for asm, table_part in table_parts.items():
+                    labels = {"target": asm} if table == "depths" else {"ref": options.get_bases_unmapped_to_ref, "asm": asm}
+                    workflow.exportFile(table_part, 'file://' + result_tables.get_part_file(result_tables.get_table_dir(options.output), table, labels, options.table_format))
+
+        if outputs.get("indexes") is not None: #i.e. if options.index_dir is given
+            os.makedirs(options.index_dir, exist_ok=True)
+            for track, index_file in outputs["indexes"].items():
+                workflow.exportFile(index_file, 'file://' + connectivity_index.get_index_file(options.index_dir, track))
+            print("connectivity indexes written to", options.index_dir)
+
+        if outputs.get("source_coverage") is not None: #i.e. if options.source_coverage_dir is given
+            os.makedirs(options.source_coverage_dir, exist_ok=True)
+            for track, store_file in outputs["source_coverage"].items():
+                workflow.exportFile(store_file, 'file://' + source_coverage.get_store_file(options.source_coverage_dir, track))
+            print("source coverage stores written to", options.source_coverage_dir)
+
+    # note that after a --restart, this only includes the jobs run since the restart.
+    job_metrics.write_metrics(options.job_metrics, metrics_collector.records)
 
             
 
@@ -0,0 +1,307 @@
+"""
+Toil-free command line for running the stages of cactus_connectivity one at a time, on
+local files. Each stage's output is the next stage's input, so a run can be scripted, or
+any one stage rerun, without a job store:
+
+python cactus_connectivity_cli.py lengths seq.txt -o lengths.tsv
+python cactus_connectivity_cli.py liftover graph.hal lengths.tsv HG002 hg38 -o HG002_to_hg38.bed
+python cactus_connectivity_cli.py coverage lengths.tsv hg38 HG002_to_hg38.bed --source HG002 -o unmapped/hg38_HG002.tsv
+python cactus_connectivity_cli.py depths lengths.tsv hg38 *_to_hg38.bed -o depths/hg38.tsv --index hg38.ccidx --source_coverage hg38.ccsrc
+python cactus_connectivity_cli.py report unmapped/
+
+coverage and depths write parts of the same tables as cactus_connectivity.py's
+<output>_tables/ (see src/result_tables.py), as parquet if -o ends in .parquet, and as tsv
+otherwise. report summarizes any of them.
+
+Everything beyond the standard library is imported by the subcommand that needs it, so
+startup and --help are instant.
+"""
+from argparse import ArgumentParser
+import collections as col
+import os
+import shlex
+import subprocess
+import sys
+
+def write_lengths(lengths_file, contig_lengths):
+    """
+    contig_lengths is dict of key: asm, value: dict(key: contig_id, value: length).
+    """
+    with open(lengths_file, "w") as outf:
+        outf.write("asm\tcontig\tlength\n")
+        for asm, asm_contig_lengths in contig_lengths.items():
+            for contig_id, length in asm_contig_lengths.items():
+                outf.write(asm + "\t" + contig_id + "\t" + str(length) + "\n")
+
+def read_lengths(lengths_file):
+    """
+    The inverse of write_lengths.
+    """
+    contig_lengths = col.defaultdict(dict)
+    with open(lengths_file) as inf:
+        inf.readline()
+        for line in inf:
+            asm, contig_id, length = line.rstrip("\n").split("\t")
+            contig_lengths[asm][contig_id] = int(length)
+    return contig_lengths
+
+def get_asm_lengths(contig_lengths, asm):
+    if asm not in contig_lengths:
+        raise KeyError(asm + " isn't in the lengths file. Assemblies in it: " + ", ".join(contig_lengths))
+    return contig_lengths[asm]
+
+def get_table_format(output):
+    return "parquet" if output.endswith(".parquet") else "tsv"
+
+def lengths(options):
+    from src import fasta_scan
+    from src import poor_mapping_regions
+
+    assembly_files = dict()
+    with open(options.seq_file) as inf:
+        for line in inf:
+            parsed = line.split()
+            if len(parsed) == 2:
+                assembly_files[parsed[0]] = parsed[1]
+            else:
+                print("WARNING: seq_file contains a line that has more or less than 2 values. Line:\n" + line, file=sys.stderr)
+
+    # the lengths come from the fasta index (<fasta>.fai if it's there, and a single pass
+    # over the fasta otherwise), rather than parsing every record. A gzipped fasta can't be
+    # indexed, so it's scanned instead.
+    contig_lengths = dict()
+    for asm, asm_file in assembly_files.items():
+        if poor_mapping_regions.is_gzipped(asm_file):
+            contig_lengths[asm] = fasta_scan.scan_fasta(asm_file)[0]
+        else:
+            contig_lengths[asm] = {contig_id: entry[0] for contig_id, entry in poor_mapping_regions.read_fasta_index(asm_file).items()}
+    write_lengths(options.output, contig_lengths)
+
+def liftover(options):
+    from src import all_to_all_liftovers
+
+    source_contig_lengths = get_asm_lengths(read_lengths(options.lengths), options.source)
+    # there are no jobs here, so the preset's memory request doesn't apply.
+    halLiftover_arguments, memory = all_to_all_liftovers.get_halLiftover_preset(options.halLiftover_preset, os.path.getsize(options.hal_file))
+    if options.halLiftover_options is not None:
+        halLiftover_arguments += shlex.split(options.halLiftover_options)
+    if halLiftover_arguments:
+        halLiftover_options = all_to_all_liftovers.get_halLiftover_options()
+        problem = None if halLiftover_options is None else all_to_all_liftovers.validate_halLiftover_arguments(halLiftover_arguments, halLiftover_options)
+        if problem is not None:
+            sys.exit(problem)
+    # the full bed of the source is streamed into halLiftover's stdin, rather than written.
+    with open(options.output + ".stderr", "w") as stderr:
+        process = subprocess.Popen(["halLiftover"] + halLiftover_arguments + [options.hal_file, options.source, "stdin", options.target, options.output], stdin=subprocess.PIPE, stderr=stderr, text=True)
+        try:
+            process.stdin.writelines(all_to_all_liftovers.get_full_bed_lines(source_contig_lengths))
+            process.stdin.close()
+        except BrokenPipeError:
+            # halLiftover died before reading all of its input. Its return code will tell us why.
+            pass
+        returncode = process.wait()
+
+    if returncode != 0:
+        interval_count, preview, problem = 0, list(), "halLiftover exited with status " + str(returncode)
+    else:
+        interval_count, preview, problem = all_to_all_liftovers.validate_liftover(options.output, options.preview_lines)
+    if problem is not None:
+        sys.exit("liftover " + options.source + " -> " + options.target + " failed: " + problem + ". halLiftover stderr:\n" + all_to_all_liftovers.get_file_tail(options.output + ".stderr"))
+    os.remove(options.output + ".stderr")
+    if preview:
+        print("first " + str(len(preview)) + " lines of liftover " + options.source + " -> " + options.target + ":\n" + "".join(preview), file=sys.stderr)
+    if interval_count == 0:
+        print("WARNING: liftover " + options.source + " -> " + options.target + " is empty, even though halLiftover succeeded.", file=sys.stderr)
+
+def read_mapping_coverage_points(liftover_beds, contig_table):
+    from src import interval_kernels
+
+    mapping_coverage_points = col.defaultdict(list)
+    for liftover_bed in liftover_beds:
+        interval_kernels.read_mapping_coverage_points(liftover_bed, mapping_coverage_points, contig_table.ids)
+    return mapping_coverage_points
+
+def make_output_dir(output):
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+
+def coverage(options):
+    from src import contig_length_table
+    from src import interval_kernels
+    from src import mask_intersection
+    from src import poor_mapping_regions
+    from src import result_tables
+
+    if bool(options.masks) != bool(options.masks_table):
+        sys.exit("--masks and --masks_table go together.")
+    contig_table = contig_length_table.intern_contigs(get_asm_lengths(read_lengths(options.lengths), options.target))
+    mapping_coverage_coordinates = interval_kernels.get_mapping_coverage_coordinates(read_mapping_coverage_points(options.liftover_beds, contig_table))
+    gaps_unmapped = interval_kernels.get_gaps_unmapped(mapping_coverage_coordinates, contig_table.lengths)
+
+    make_output_dir(options.output)
+    result_tables.write_table(options.output, "unmapped", {"ref": options.target, "asm": options.source}, result_tables.get_unmapped_rows(gaps_unmapped, contig_table.lengths, options.minimum_size_gap, contig_table.names), get_table_format(options.output))
+    if options.gaps_bed:
+        poor_mapping_regions.write_bed(options.gaps_bed, contig_table.lengths, mapping_coverage_coordinates, 0, options.minimum_size_gap, contig_table.names)
+    if options.masks:
+        masks = dict()
+        for name, mask_file in mask_intersection.parse_mask_arguments(options.masks).items():
+            masks[name], intervals_skipped = mask_intersection.read_mask(mask_file, contig_table.ids)
+            if intervals_skipped:
+                print("WARNING: " + str(intervals_skipped) + " intervals of mask " + name + " are on contigs that aren't in " + options.target + ", and were left out.", file=sys.stderr)
+        make_output_dir(options.masks_table)
+        result_tables.write_table(options.masks_table, "masks", {"ref": options.target, "asm": options.source}, mask_intersection.get_mask_rows(gaps_unmapped, masks, contig_table.lengths, options.minimum_size_gap, contig_table.names), get_table_format(options.masks_table))
+
+def depths(options):
+    from src import connectivity_index
+    from src import contig_length_table
+    from src import interval_kernels
+    from src import result_tables
+    from src import source_coverage
+
+    contig_table = contig_length_table.intern_contigs(get_asm_lengths(read_lengths(options.lengths), options.target))
+    if options.source_coverage:
+        # the store needs each liftover's coverage on its own, before they're merged.
+        sources = options.sources if options.sources else [os.path.basename(liftover_bed).split(".")[0] for liftover_bed in options.liftover_beds]
+        if len(sources) != len(options.liftover_beds):
+            sys.exit("--sources needs one name for each liftover bed.")
+        source_coverage_points = [read_mapping_coverage_points([liftover_bed], contig_table) for liftover_bed in options.liftover_beds]
+        source_coverage_coords = {source: interval_kernels.get_mapping_coverage_coordinates(points) for source, points in zip(sources, source_coverage_points)}
+        make_output_dir(options.source_coverage)
+        source_coverage.write_store(options.source_coverage, source_coverage_coords, contig_table.lengths, options.target, contig_table.names)
+        mapping_coverage_points = interval_kernels.merge_mapping_coverage_points(source_coverage_points)
+    else:
+        mapping_coverage_points = read_mapping_coverage_points(options.liftover_beds, contig_table)
+
+    make_output_dir(options.output)
+    result_tables.write_table(options.output, "depths", {"target": options.target}, result_tables.get_depth_rows(mapping_coverage_points, contig_table.lengths, contig_table.names), get_table_format(options.output))
+    if options.index:
+        connectivity_index.write_index(options.index, mapping_coverage_points, contig_table.lengths, options.target, contig_table.names)
+
+def report(options):
+    """
+    Totals of each table, over all contigs: the bases unmapped in the ref per (ref, asm), the
+    bases of each mask unmapped per (ref, asm, mask), or the bases at each depth per target.
+    """
+    from src import result_tables
+
+    # totals has key: (ref, asm), (ref, asm, mask) or (target, depth), value: [bases, total
+    # length].
+    totals = dict()
+    kind = None
+    for table in options.tables:
+        for row in result_tables.read_table(table):
+            if "mask" in row:
+                kind = "masks"
+                key = (row["ref"], row["asm"], row["mask"])
+                totals.setdefault(key, [0, 0])
+                totals[key][0] += row["bases_unmapped"]
+                totals[key][1] += row["mask_bases"]
+            elif "bases_unmapped" in row:
+                kind = "unmapped"
+                key = (row["ref"], row["asm"])
+                totals.setdefault(key, [0, 0])
+                totals[key][0] += row["bases_unmapped"]
+                totals[key][1] += row["contig_length"]
+            else:
+                kind = "depths"
+                totals.setdefault((row["target"], row["depth"]), [0, 0])[0] += row["bases"]
+
+    outf = open(options.output, "w") if options.output else sys.stdout
+    if kind == "unmapped":
+        outf.write("ref\tasm\tbases_unmapped_in_ref\tref_length\tbases_unmapped_in_ref/ref_length_ratio\n")
+        for (ref_id, asm), (bases_unmapped, ref_length) in totals.items():
+            outf.write(ref_id + "\t" + asm + "\t" + str(bases_unmapped) + "\t" + str(ref_length) + "\t" + str(bases_unmapped/ref_length) + "\n")
+    elif kind == "masks":
+        outf.write("ref\tasm\tmask\tbases_unmapped\tmask_bases\tbases_unmapped/mask_bases_ratio\n")
+        for (ref_id, asm, name), (bases_unmapped, mask_bases) in totals.items():
+            outf.write(ref_id + "\t" + asm + "\t" + name + "\t" + str(bases_unmapped) + "\t" + str(mask_bases) + "\t" + str(bases_unmapped/mask_bases if mask_bases else 0) + "\n")
+    elif kind == "depths":
+        target_lengths = col.Counter()
+        for (target, depth), (bases, length) in totals.items():
+            target_lengths[target] += bases
+        outf.write("target\tmapping_depth\tbases\ttarget_length\tbases/target_length_ratio\n")
+        for (target, depth), (bases, length) in sorted(totals.items()):
+            outf.write(target + "\t" + str(depth) + "\t" + str(bases) + "\t" + str(target_lengths[target]) + "\t" + str(bases/target_lengths[target]) + "\n")
+    if outf is not sys.stdout:
+        outf.close()
+
+def main():
+    parser = ArgumentParser(description="Run the stages of cactus_connectivity one at a time, on local files, without toil.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    lengths_parser = subparsers.add_parser("lengths", help="Measure the contig lengths of every assembly in a seq_file.")
+    lengths_parser.add_argument(
+        'seq_file', help='A tab separated file with two columns: the name of each assembly, and its fasta file. Same format as for cactus_connectivity.py.', type=str)
+    lengths_parser.add_argument(
+        '-o', '--output', help='Where to save the lengths (asm, contig, length), for the other subcommands.', required=True, type=str)
+    lengths_parser.set_defaults(run=lengths)
+
+    liftover_parser = subparsers.add_parser("liftover", help="Lift every base of the source assembly over to the target assembly with halLiftover.")
+    liftover_parser.add_argument(
+        'hal_file', help='The hal file to be profiled.', type=str)
+    liftover_parser.add_argument(
+        'lengths', help='The output of the lengths subcommand.', type=str)
+    liftover_parser.add_argument(
+        'source', help='The assembly to lift over from.', type=str)
+    liftover_parser.add_argument(
+        'target', help='The assembly to lift over to.', type=str)
+    liftover_parser.add_argument(
+        '-o', '--output', help='Where to save the liftover bed (in target coordinates).', required=True, type=str)
+    liftover_parser.add_argument(
+        '--preview_lines', help="Print the first N lines of the liftover to stderr.", default=0, type=int)
+    liftover_parser.add_argument(
+        '--halLiftover_preset', help="As in cactus_connectivity.py: fast (--inMemory), low_memory (a small hdf5 cache), or default.", choices=("default", "fast", "low_memory"), default="default", type=str)
+    liftover_parser.add_argument(
+        '--halLiftover_options', help="Extra options passed through to halLiftover, as one quoted string, checked against its --help.", type=str)
+    liftover_parser.set_defaults(run=liftover)
+
+    coverage_parser = subparsers.add_parser("coverage", help="Measure the bases of the target left unmapped by its liftovers, per contig.")
+    coverage_parser.add_argument(
+        'lengths', help='The output of the lengths subcommand.', type=str)
+    coverage_parser.add_argument(
+        'target', help='The assembly the liftovers were lifted over to (the ref).', type=str)
+    coverage_parser.add_argument(
+        'liftover_beds', help='Liftovers onto the target. Bases covered by any of them count as mapped.', nargs='+', type=str)
+    coverage_parser.add_argument(
+        '--source', help="The name for the liftovers' source in the table's asm column.", required=True, type=str)
+    coverage_parser.add_argument(
+        '-o', '--output', help='Where to save the unmapped table (parquet if it ends in .parquet, tsv otherwise).', required=True, type=str)
+    coverage_parser.add_argument(
+        '--minimum_size_gap', help="Gaps between mappings smaller than this are counted as mapped.", default=0, type=int)
+    coverage_parser.add_argument(
+        '--gaps_bed', help="If given, also saves the unmapped gaps (at least --minimum_size_gap long) to this bed.", type=str)
+    coverage_parser.add_argument(
+        '--masks', help="Bed files of target regions to intersect with the gaps, as NAME=BED (or just BED, named after the file). See src/mask_intersection.py.", nargs='+', type=str)
+    coverage_parser.add_argument(
+        '--masks_table', help="Used in conjunction with --masks, where to save the masks table (parquet if it ends in .parquet, tsv otherwise).", type=str)
+    coverage_parser.set_defaults(run=coverage)
+
+    depths_parser = subparsers.add_parser("depths", help="Measure the bases of the target at each mapping depth, per contig.")
+    depths_parser.add_argument(
+        'lengths', help='The output of the lengths subcommand.', type=str)
+    depths_parser.add_argument(
+        'target', help='The assembly the liftovers were lifted over to.', type=str)
+    depths_parser.add_argument(
+        'liftover_beds', help='Liftovers onto the target, e.g. from every other assembly.', nargs='+', type=str)
+    depths_parser.add_argument(
+        '-o', '--output', help='Where to save the depths table (parquet if it ends in .parquet, tsv otherwise).', required=True, type=str)
+    depths_parser.add_argument(
+        '--index', help="If given, also saves a connectivity index of the target's mapping depths here (see src/connectivity_index.py).", type=str)
+    depths_parser.add_argument(
+        '--source_coverage', help="If given, also saves a store of which liftovers cover each base of the target here (see src/source_coverage.py).", type=str)
+    depths_parser.add_argument(
+        '--sources', help="Used in conjunction with --source_coverage, the name of each liftover's source, in the same order as the liftover beds. Defaults to each bed's file name, up to its first '.'.", nargs='+', type=str)
+    depths_parser.set_defaults(run=depths)
+
+    report_parser = subparsers.add_parser("report", help="Summarize unmapped or depths tables over all contigs.")
+    report_parser.add_argument(
+        'tables', help='Table parts, or directories of them (e.g. <output>_tables/unmapped from cactus_connectivity.py).', nargs='+', type=str)
+    report_parser.add_argument(
+        '-o', '--output', help='Where to save the report. Defaults to stdout.', type=str)
+    report_parser.set_defaults(run=report)
+
+    options = parser.parse_args()
+    options.run(options)
+
+if __name__ == "__main__":
+    main()
@@ -11,22 +11,18 @@ from toil.common import Toil
 from toil.job import Job
 import os
 import subprocess
-from Bio import SeqIO
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import collections as col
 
-#first step is to make the full_beds.
-def get_contig_lengths(assembly):
-    lengths = dict()
-    asm = SeqIO.index(assembly, "fasta")
-    for contig_id, seq in asm.items():
-        lengths[contig_id] = len(seq)
-    return lengths
+from src.all_to_all_liftovers import get_full_bed_lines
+from src.all_to_all_liftovers import read_contig_lengths as get_contig_lengths
 
+#first step is to make the full_beds.
 def write_full_bed(contig_lengths, out_bed):
     with open(out_bed, "w") as outf:
-        for contig_id, length in contig_lengths.items():
-            outf.write(contig_id + "\t" + "0" + "\t" + str(length) + "\n")
+        outf.writelines(get_full_bed_lines(contig_lengths))
     return out_bed
 
 #Second step is to call liftover on each possible combination of assembly.
@@ -2,136 +2,16 @@
 """
 Built to exclude overlap in bedfiles with lots of overlap. (e.g. the halLiftover output)
 """
-import collections as col
-import operator
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from types import SimpleNamespace
 import ast
 
-def get_mapping_coverage_points(alignment_bed):
-    """
-    Returns:
-    all start and stop points of lines in the bedfile, sorted by contigs.
-        key: contig_id, value: list[regions in tuple(point_value, start_bool) format].
-        where start_bool is true if the point is a start of a region, and false if the point is a stop of the region.
-    """
-    # start-points and stop-points of each line in the bedfile. 
-    # key: tuple(fasta_file, contig_id), value: list[regions in tuple(point_value, start_bool) format].
-    mapping_coverage_points = col.defaultdict(list)
-
-    # add all start and end points for regions that map well 
-    with open(alignment_bed) as f:
-        for line in f:
-            # parse line in map_file:
-            parsed = line.split("\t")
-            
-            contig_id = parsed[0]
-            start = int(parsed[1])
-            stop = int(parsed[2])
-
-            # add these coordinates to mapping_coverage_points
-            mapping_coverage_points[contig_id].append((start, True))
-            mapping_coverage_points[contig_id].append((stop, False))
-    return mapping_coverage_points
-
-def get_mapping_coverage_coordinates(mapping_coverage_points):
-    """
-    Returns all the coords (defined by tuple(start,stop)) that are covered by at least one mapping in 
-    mapping_coverage_points.
-    """
-    # mapping_coverage_coords is key: contig_id, value: list of coords: [(start, stop)]
-    mapping_coverage_coords = col.defaultdict(list)
-    for contig_id in mapping_coverage_points:
-        contig_coverage_points = sorted(mapping_coverage_points[contig_id], key=operator.itemgetter(0, 1))
-        # contig_coverage_points = sorted(mapping_coverage_points[contig_id], key=lambda point: point[0])
-        open_points = 0
-        current_region = [0, 0] # format (start, stop)
-        for i in range(len(contig_coverage_points)):
-            if open_points:
-                # then we have at least one read overlapping this region.
-                # expand the stop point of current_region
-                current_region[1] = contig_coverage_points[i][0]
-            if contig_coverage_points[i][1]:
-                # if start_bool is true, the point represents a start of mapping
-                open_points += 1
-                if open_points == 1:
-                    # that is, if we've found the starting point of a new current_region,
-                    # so we should set the start of the current_region.
-                    current_region[0] = contig_coverage_points[i][0]
-            else:
-                # if start_bool is not true, the point represents the end of a mapping.
-                open_points -= 1
-                if not open_points:
-                    # if there's no more open_points in this region, then this is the 
-                    # end of the current_region. Save current_region.
-                    mapping_coverage_coords[contig_id].append(current_region.copy())
-    return mapping_coverage_coords
-
-def get_poor_mapping_coverage_coordinates(contig_lengths, mapping_coverage_coords, options):
-    """
-    mapping_coverage_coords is a dictionary of lists of coords in (start, stop) format.
-    This function returns poor mapping coords, which is essentially the gaps between 
-        those coords.
-    example: mapping_coverage_coords{contig_1:[(3,5), (7, 9)]} would result in
-                mapping_coverage_coords{contig_1:[(0,3), (5,7), (9, 11)]}, if contig_1 had a
-                length of 11.
-    variables:
-        contig_lengths: A dictionary of the length of all the contigs in 
-            {key: contig_id value: len(contig)} format.
-        mapping_coverage_coords: a dictionary of lists of coords in 
-            {key: contig_id, value:[(start, stop)]}
-        sequence_context: an integer, representing the amount of sequence you would 
-            want to expand each of the poor_mapping_coords by, to include context
-            sequence for the poor mapping sequence. 
-    """
-    # poor_mapping_coords has key: contig_id, value list(tuple_of_positions(start, stop))
-    poor_mapping_coords = col.defaultdict(list)
-    for contig_id in contig_lengths:
-        if contig_id in mapping_coverage_coords:
-            if mapping_coverage_coords[contig_id][0][0] > 0:
-                # if the first mapping region for the contig doesn't start at the start of
-                # the contig, the first region is between the start of the contig and the 
-                # start of the good_mapping_region.
-                poor_mapping_stop = mapping_coverage_coords[contig_id][0][0] + options.sequence_context
-                if poor_mapping_stop > contig_lengths[contig_id]:
-                    poor_mapping_stop = contig_lengths[contig_id]
-                if poor_mapping_stop - 0 >= options.minimum_size_remap: # implement size threshold.
-                    poor_mapping_coords[contig_id].append((0, poor_mapping_stop))
-                else:
-                    pass
-            for i in range(len(mapping_coverage_coords[contig_id]) - 1):
-                # for every pair of mapping coords i and i + 1,
-                # make a pair of (stop_from_ith_region, start_from_i+1th_region) to
-                # represent the poor_mapping_coords. Include sequence_context as necessary.
-                poor_mapping_start = mapping_coverage_coords[contig_id][i][1] - options.sequence_context
-                if poor_mapping_start < 0:
-                    poor_mapping_start = 0
-                    
-                poor_mapping_stop = mapping_coverage_coords[contig_id][i + 1][0] + options.sequence_context
-                if poor_mapping_stop > contig_lengths[contig_id]:
-                    poor_mapping_stop = contig_lengths[contig_id]
-
-                if poor_mapping_stop - poor_mapping_start >= options.minimum_size_remap: # implement size threshold.
-                    poor_mapping_coords[contig_id].append((poor_mapping_start, poor_mapping_stop))
-                else:
-                    pass
-            if mapping_coverage_coords[contig_id][-1][1] < contig_lengths[contig_id]:
-                # if the last mapping region for the contig stops before the end of
-                # the contig, the last region is between the end of the mapping and the 
-                # end of the contig.
-                poor_mapping_start = mapping_coverage_coords[contig_id][-1][1] - options.sequence_context
-                if poor_mapping_start < 0:
-                    poor_mapping_start = 0
-                if contig_lengths[contig_id] - poor_mapping_start >= options.minimum_size_remap: # implement size threshold.
-                    poor_mapping_coords[contig_id].append((poor_mapping_start, contig_lengths[contig_id]))
-                else:
-                    pass
-
-        else:
-            # there isn't a good_mapping region for this contig. The full length of 
-            # the contig belongs in poor_mapping_coords.
-            poor_mapping_coords[contig_id].append((0, contig_lengths[contig_id]))
-    return poor_mapping_coords
+# the same kernels the workflow runs, without toil.
+from src import interval_kernels
+from src.interval_kernels import get_mapping_coverage_coordinates, get_poor_mapping_coverage_coordinates
+from src.interval_kernels import read_mapping_coverage_points as get_mapping_coverage_points
 
 def get_seq_lengths_from_length_file(length_file):
     seq_lengths = dict()
@@ -154,17 +34,10 @@ hg002 assemblies (where hg38 was the target, and the different assemblies the re
 sources of each liftover.).
 """
 def calc_free_bases(liftover_bed_files, contig_lengths, minimum_size_gap):
-    mapping_coverage_points = col.defaultdict(list)
-    for bedfile in liftover_bed_files:
-        bed_mapping_coverage_points = get_mapping_coverage_points(bedfile)
-        for key, values in bed_mapping_coverage_points.items():
-            for value in values:
-                mapping_coverage_points[key].append(value)
+    mapping_coverage_points = interval_kernels.merge_mapping_coverage_points([get_mapping_coverage_points(bedfile) for bedfile in liftover_bed_files])
     mapping_coverage_coordinates = get_mapping_coverage_coordinates(mapping_coverage_points)
 
-    options = SimpleNamespace()
-    options.sequence_context = 0 #The nonzero default used in ref-based pipeline doesn't make sense in this context. 
-    options.minimum_size_remap = minimum_size_gap
+    options = interval_kernels.get_poor_mapping_options(minimum_size_gap)
 
     poor_mapping_coverage_coordinates = get_poor_mapping_coverage_coordinates(contig_lengths, mapping_coverage_coordinates, options)
 
@@ -173,9 +46,7 @@ def calc_free_bases(liftover_bed_files, contig_lengths, minimum_size_gap):
     print(seq_len_tot)
     print()
 
-    unmapped_seq_len = int()
-    for i in poor_mapping_coverage_coordinates.values():
-        unmapped_seq_len += sum([int(j[1])-int(j[0]) for j in i])
+    unmapped_seq_len = interval_kernels.count_interval_size(poor_mapping_coverage_coordinates)
     print("bases in target of liftover bed that are unaligned to the source sequence (with gaps between alignments <" + str(minimum_size_gap) + " bases in size still counted as aligned):")
     print(str(unmapped_seq_len) + " (" + str(round((unmapped_seq_len/seq_len_tot)*100, 2)) + "%)")
 
@@ -5,13 +5,20 @@ Note: for now, I'm manually crafting my "assembly_files" dict from the seq.txt u
         Maybe even extract the info from the cactus graph itself, if I"m feeling ambitious (and it records the original fasta files it was made from).
 """
 
-from toil.common import Toil
-from toil.job import Job
+from src import contig_length_table
+from src import fasta_scan
+from src import job_metrics
+from src import liftover_costs
+
+import json
 import os
+import re
+import shutil
 import subprocess
-from Bio import SeqIO
 from argparse import ArgumentParser
+from types import SimpleNamespace
 import collections as col
+import logging
 
 def empty(job):
     """
@@ -20,149 +27,413 @@ def empty(job):
     return
 
 #first step is to make the full_beds.
+@job_metrics.instrumented
 def get_contig_lengths(job, assembly):
-    lengths = dict()
-    asm = SeqIO.index(job.fileStore.readGlobalFile(assembly), "fasta")
-    for contig_id, seq in asm.items():
-        lengths[contig_id] = len(seq)
-    return lengths
+    """
+    Returns dict with "lengths" and "n_runs" of the assembly, from the one pass over its
+    fasta of fasta_scan.scan_fasta.
+    """
+    assembly_file = job.fileStore.readGlobalFile(assembly)
+    lengths, n_runs = fasta_scan.scan_fasta(assembly_file)
+    job_metrics.record(input_bytes=job_metrics.get_file_size(assembly_file), contigs=len(lengths), n_bases=fasta_scan.count_n_bases(n_runs))
+    return {"lengths": lengths, "n_runs": n_runs}
+
+def read_contig_lengths(assembly_file):
+    """
+    Given a local fasta file, returns dict of key: contig_id, value: length of contig.
+    """
+    return fasta_scan.scan_fasta(assembly_file)[0]
+
+def get_full_bed_lines(contig_lengths):
+    """
+    Yields one bed line per contig, spanning the whole contig. This is the srcBed for the 
+    liftovers, whether it's written to a file or streamed into halLiftover's stdin.
+    """
+    for contig_id, length in contig_lengths.items():
+        yield contig_id + "\t" + "0" + "\t" + str(length) + "\n"
 
-def write_full_bed(job, contig_lengths):
+@job_metrics.instrumented
+def write_full_bed(job, length_table, asm):
+    contig_lengths = contig_length_table.load_contig_lengths(job, length_table, asm)
     out_bed = job.fileStore.getLocalTempFile()
     
     with open(out_bed, "w") as outf:
-        for contig_id, length in contig_lengths.items():
-            outf.write(contig_id + "\t" + "0" + "\t" + str(length) + "\n")
+        for line in get_full_bed_lines(contig_lengths):
+            outf.write(line)
+    job_metrics.record(output_bytes=job_metrics.get_file_size(out_bed), intervals=len(contig_lengths))
 
     return job.fileStore.writeGlobalFile(out_bed)
 
-#Second step is to call liftover on each possible combination of assembly.
-def liftover(job, hal_file, source_assembly, source_full_bed, target_assembly):
-    out_bed_tmp = job.fileStore.getLocalTempFile()
-    out_bed = job.fileStore.writeGlobalFile(out_bed_tmp)
-    
-    #todo: remove debug:
-    job.addChildJobFn(print_debug, "halLiftover_arguments", [job.fileStore.readGlobalFile(hal_file), source_assembly, job.fileStore.readGlobalFile(source_full_bed), target_assembly, job.fileStore.readGlobalFile(out_bed)])
-    
-    # #todo: remove debug: (note that this will always fail b/c binary file)
-    # with open(job.fileStore.readGlobalFile(hal_file)) as inf:
-    #     print("hal_file_incoming!")
-    #     for line in inf:
-    #         print(line)
-    #     print("hal_file_done")
-
-    #todo: remove debug:
-    with open(job.fileStore.readGlobalFile(source_full_bed)) as inf:
-        print("source_full_bed_incoming!")
+# halLiftover's options that the pipeline sets itself, so they can't be passed through.
+MANAGED_HALLIFTOVER_OPTIONS = ("--outPSL", "--outPSLWithName", "--inPSL", "--append")
+HALLIFTOVER_PRESETS = ("default", "fast", "low_memory")
+# the memory asked for by the fast preset, as a multiple of the hal file's size (hdf5 hals
+# are usually compressed on disk), plus a fixed amount for everything else.
+IN_MEMORY_HAL_FACTOR = 3
+IN_MEMORY_BASE_BYTES = 1 << 30
+# the hdf5 cache of the low_memory preset (halLiftover's default is 15MB), and the memory
+# it asks for.
+LOW_MEMORY_CACHE_BYTES = 1 << 22
+LOW_MEMORY_BYTES = 1 << 29
+
+def get_halLiftover_preset(preset, hal_size):
+    """
+    Returns (halLiftover_arguments, memory) for the preset, where memory is the bytes each
+    liftover job asks toil for (None for toil's default):
+        default: halLiftover's own defaults.
+        fast: --inMemory, so the whole hal is loaded into memory up front, rather than read
+            through the hdf5 cache block by block. Asks for IN_MEMORY_HAL_FACTOR times the
+            size of the hal file (hal_size), plus IN_MEMORY_BASE_BYTES.
+        low_memory: a small hdf5 cache, for nodes short on memory. Asks for
+            LOW_MEMORY_BYTES.
+    """
+    if preset == "fast":
+        return ["--inMemory"], IN_MEMORY_HAL_FACTOR * hal_size + IN_MEMORY_BASE_BYTES
+    if preset == "low_memory":
+        return ["--cacheBytes", str(LOW_MEMORY_CACHE_BYTES)], LOW_MEMORY_BYTES
+    return list(), None
+
+def get_halLiftover_options(halLiftover="halLiftover"):
+    """
+    Returns dict of key: each option listed by the installed halLiftover's --help, value:
+    True if it takes a value. Returns None if halLiftover isn't on the PATH.
+    """
+    try:
+        # halLiftover prints its usage and exits nonzero, so the exit status is ignored.
+        usage = subprocess.run([halLiftover, "--help"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True).stdout
+    except FileNotFoundError:
+        return None
+    halLiftover_options = dict()
+    for line in usage.splitlines():
+        match = re.match(r"\s*(--\w+)(\s+<\w+>)?", line)
+        if match:
+            halLiftover_options[match.group(1)] = match.group(2) is not None
+    return halLiftover_options
+
+def validate_halLiftover_arguments(halLiftover_arguments, halLiftover_options):
+    """
+    Checks the arguments to pass through to halLiftover against halLiftover_options (from
+    get_halLiftover_options). Returns None if they're fine, and otherwise says what's wrong
+    with them.
+    """
+    i = 0
+    while i < len(halLiftover_arguments):
+        argument = halLiftover_arguments[i]
+        if not argument.startswith("--"):
+            return "the halLiftover argument " + argument + " doesn't belong to any option."
+        if argument in MANAGED_HALLIFTOVER_OPTIONS:
+            return argument + " is set by cactus_connectivity itself, so can't be passed through to halLiftover."
+        if argument not in halLiftover_options:
+            return argument + " isn't an option of the installed halLiftover (see halLiftover --help)."
+        if halLiftover_options[argument]:
+            if i + 1 == len(halLiftover_arguments) or halLiftover_arguments[i + 1].startswith("--"):
+                return "the halLiftover option " + argument + " needs a value."
+            i += 1
+        i += 1
+    return None
+
+def get_liftover_options(preview_lines=0, max_retries=0, checkpoint_dir=None, psl=False, halLiftover_arguments=None, memory=None):
+    """
+    Generate a namespace of the settings passed on to each liftover job.
+        preview_lines: if nonzero, the first preview_lines lines of each liftover's output are
+            sent to the leader's log.
+        max_retries: the number of times a failed halLiftover is rerun (in a child job, with
+            double the memory each time) before the workflow is failed.
+        checkpoint_dir: if given, every liftover that passes validation is copied here, so a
+            fresh run can skip it (see get_checkpointed_liftovers). Must be on a filesystem
+            shared with the toil workers.
+        psl: if True, halLiftover is run with --outPSL, so each liftover has the coords of
+            both the source and the target (see
+            interval_kernels.parse_psl_coverage_points).
+        halLiftover_arguments: list of extra options passed through to halLiftover (see
+            get_halLiftover_preset and validate_halLiftover_arguments).
+        memory: if given, the bytes each liftover job asks toil for, unless an earlier run
+            measured what the liftover needs (see liftover_costs.get_resources).
+    """
+    options = SimpleNamespace()
+    options.preview_lines = preview_lines
+    options.max_retries = max_retries
+    options.checkpoint_dir = checkpoint_dir
+    options.psl = psl
+    options.halLiftover_arguments = halLiftover_arguments if halLiftover_arguments is not None else list()
+    options.memory = memory
+    return options
+
+def get_liftover_resources(liftover_options):
+    """
+    Returns the toil resource requests of a liftover job that isn't ordered by cost (e.g.
+    the sampled liftovers), i.e. liftover_options.memory, if it's given.
+    """
+    if liftover_options.memory is None:
+        return dict()
+    return {"memory": liftover_options.memory}
+
+def get_halLiftover_command(liftover_options, hal_file, source_assembly, source_bed, target_assembly, target_bed):
+    return ["halLiftover"] + (["--outPSL"] if liftover_options.psl else []) + liftover_options.halLiftover_arguments + [hal_file, source_assembly, source_bed, target_assembly, target_bed]
+
+# written into the checkpoint_dir by the first run to use it.
+CHECKPOINT_MANIFEST = "checkpoint_manifest.json"
+
+def get_checkpoint_bed(checkpoint_dir, source_assembly, target_assembly, psl=False):
+    # psl liftovers are checkpointed separately, so a run never reuses the wrong format.
+    return os.path.join(checkpoint_dir, source_assembly + "_source_" + target_assembly + "_target_liftover." + ("psl" if psl else "bed"))
+
+def get_checkpoint_manifest(hal_file, halLiftover_arguments):
+    """
+    Everything besides the pair that a checkpointed liftover depends on: the hal (by path,
+    size and mtime, so a rebuilt hal doesn't match) and the options passed through to
+    halLiftover. Whether they're psls (--both_directions) is in the checkpoint's name.
+    """
+    hal_stat = os.stat(hal_file)
+    return {"hal_file": os.path.abspath(hal_file), "hal_size": hal_stat.st_size, "hal_mtime_ns": hal_stat.st_mtime_ns, "halLiftover_arguments": list(halLiftover_arguments)}
+
+def check_checkpoint_manifest(checkpoint_dir, manifest):
+    """
+    Compares manifest (from get_checkpoint_manifest) with the one the checkpoints in
+    checkpoint_dir were made with, writing it there if there are no checkpoints yet.
+    Returns None if the checkpoints can be reused, and otherwise says why not.
+    """
+    manifest_file = os.path.join(checkpoint_dir, CHECKPOINT_MANIFEST)
+    if os.path.isfile(manifest_file):
+        with open(manifest_file) as inf:
+            checkpoint_manifest = json.load(inf)
+        changed = [key for key in manifest if checkpoint_manifest.get(key) != manifest[key]]
+        if changed:
+            return "the liftovers checkpointed in " + checkpoint_dir + " were made with a different " + ", ".join(changed) + " (they were made with " + ", ".join(key + " " + str(checkpoint_manifest.get(key)) for key in changed) + "). Use a new --checkpoint_dir, or empty this one."
+        return None
+    if os.path.isdir(checkpoint_dir) and any(name.endswith(("_liftover.bed", "_liftover.psl")) for name in os.listdir(checkpoint_dir)):
+        return checkpoint_dir + " has checkpointed liftovers, but no " + CHECKPOINT_MANIFEST + " to say what they were made with. Use a new --checkpoint_dir, or empty this one."
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    with open(manifest_file + ".partial", "w") as outf:
+        json.dump(manifest, outf, indent=1)
+    os.replace(manifest_file + ".partial", manifest_file)
+    return None
+
+def get_checkpointed_liftovers(checkpoint_dir, pairs, psl=False):
+    """
+    Given list of (source_asm, target_asm), returns dict of key: (source_asm, target_asm),
+    value: local path of its checkpointed liftover, for every pair with a checkpoint.
+    Checkpoints are only ever moved into place once they're complete (see
+    write_checkpoint), and the run has already checked they were made from the same hal
+    and halLiftover options (see check_checkpoint_manifest), so any checkpoint found here
+    is safe to use.
+    """
+    checkpointed = dict()
+    if checkpoint_dir is None:
+        return checkpointed
+    for source_asm, target_asm in pairs:
+        checkpoint_bed = get_checkpoint_bed(checkpoint_dir, source_asm, target_asm, psl)
+        if os.path.isfile(checkpoint_bed):
+            checkpointed[(source_asm, target_asm)] = checkpoint_bed
+    return checkpointed
+
+def write_checkpoint(checkpoint_dir, source_assembly, target_assembly, out_bed, psl=False):
+    checkpoint_bed = get_checkpoint_bed(checkpoint_dir, source_assembly, target_assembly, psl)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    # copy to a temp name first, so that a half-copied checkpoint is never mistaken for a
+    # finished one.
+    shutil.copyfile(out_bed, checkpoint_bed + ".partial")
+    os.replace(checkpoint_bed + ".partial", checkpoint_bed)
+
+def validate_liftover(out_bed, preview_lines=0, psl=False):
+    """
+    Reads through halLiftover's output once, returning (interval_count, preview, problem).
+    problem is None if the output looks like a complete bed (or psl, if psl), and otherwise
+    says what's wrong with it.
+    """
+    interval_count = int()
+    preview = list()
+    problem = None
+    line = ""
+    with open(out_bed) as inf:
         for line in inf:
-            print(line)
-        print("source_full_bed_done")
-
-    print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~", job.fileStore.readGlobalFile(hal_file), source_assembly, job.fileStore.readGlobalFile(source_full_bed), target_assembly, job.fileStore.readGlobalFile(out_bed))
-
-    #todo: remove debug:
-    debug_stderr = job.fileStore.getLocalTempFile()
-    with open(debug_stderr, "w") as debug:
-        # subprocess.run(["halLiftover", job.fileStore.readGlobalFile(hal_file), source_assembly, job.fileStore.readGlobalFile(source_full_bed), target_assembly, job.fileStore.readGlobalFile(out_bed)])
-        subprocess.run(["halLiftover", job.fileStore.readGlobalFile(hal_file), source_assembly, job.fileStore.readGlobalFile(source_full_bed), target_assembly, job.fileStore.readGlobalFile(out_bed)], stderr=debug)
-    with open(debug_stderr) as debug:
-        print("Debug incoming!")
-        for line in debug:
-            print(line)
-        print("Debug_done")
-
-    print("about_to_read out_bedfile")
-    with open(job.fileStore.readGlobalFile(out_bed)) as out_bedfile:
-        print("out_bedfile incoming!")
-        for line in out_bedfile:
-            print(line)
-        print("out_bedfile_done")
-    print("just_finished_reading out_bedfile")
+            if interval_count < preview_lines:
+                preview.append(line)
+            interval_count += 1
+    if interval_count and not line.endswith("\n"):
+        problem = "the output bed is truncated (its last line is incomplete)"
+    elif preview and len(preview[0].split("\t")) < 3:
+        problem = "the output doesn't look like a bed file. First line: " + preview[0]
+    elif psl and preview and len(preview[0].split("\t")) < 21:
+        problem = "the output doesn't look like a psl file. First line: " + preview[0]
+    return interval_count, preview, problem
+
+#Second step is to call liftover on each possible combination of assembly.
+@job_metrics.instrumented
+def liftover(job, hal_file, source_assembly, source_full_bed, target_assembly, liftover_options, attempt=1, predicted_seconds=None):
+    """
+    Lifts source_full_bed over from source_assembly to target_assembly, and returns the 
+    output bedfile. 
     
-    #todo: remove debug:
-    debug_cnt = int()
-    with open(job.fileStore.readGlobalFile(out_bed)) as inf:
-        for line in inf:
-            job.addChildJobFn(print_debug, "example liftover line:", line)
-            if debug_cnt == 20:
-                break
-            debug_cnt += 1
+    This is the hot path of the whole pipeline, so it's kept quiet: halLiftover's stderr is
+    only sent to the leader's log if halLiftover fails, and no child jobs are made (unless
+    it fails). If liftover_options.preview_lines is nonzero, the first preview_lines lines 
+    of the output are sent to the leader's log, for a quick look at the liftover.
+
+    A crashed or OOM-killed halLiftover would otherwise leave an empty or partial bed, which
+    looks just like sequence that's unmapped. So, the exit status and output are checked,
+    and on failure the liftover is rerun in a child job with double the memory, up to 
+    liftover_options.max_retries times, before failing the workflow.
+
+    predicted_seconds (see liftover_costs) is only recorded in the job metrics, to be
+    compared with the actual time.
+    """
+    out_bed = job.fileStore.getLocalTempFile()
+    stderr_file = job.fileStore.getLocalTempFile()
+    with open(stderr_file, "w") as stderr:
+        returncode, halLiftover_peak_rss_kb = job_metrics.run_measured(get_halLiftover_command(liftover_options, job.fileStore.readGlobalFile(hal_file), source_assembly, job.fileStore.readGlobalFile(source_full_bed), target_assembly, out_bed), stderr=stderr)
+
+    # count the intervals (and grab the preview) in the same pass that validates the output.
+    # the preview has at least one line, so the format can be checked.
+    interval_count, preview, problem = validate_liftover(out_bed, max(1, liftover_options.preview_lines), liftover_options.psl)
+    preview = preview[:liftover_options.preview_lines]
+    if returncode != 0:
+        problem = "halLiftover exited with status " + str(returncode)
+    if preview and problem is None:
+        job.fileStore.logToMaster("first " + str(len(preview)) + " lines of liftover " + source_assembly + " -> " + target_assembly + ":\n" + "".join(preview))
+    if interval_count == 0 and problem is None:
+        job.fileStore.logToMaster("WARNING: liftover " + source_assembly + " -> " + target_assembly + " is empty, even though halLiftover succeeded. All of " + source_assembly + " will count as unmapped to " + target_assembly + ".", logging.WARNING)
+
+    job_metrics.record(source=source_assembly, target=target_assembly, attempt=attempt, halLiftover_exit_status=returncode, input_bytes=job_metrics.get_file_size(job.fileStore.readGlobalFile(source_full_bed)), output_bytes=job_metrics.get_file_size(out_bed), intervals=interval_count, predicted_seconds=predicted_seconds, memory=job.memory, halLiftover_peak_rss_kb=halLiftover_peak_rss_kb)
+
+    if problem is not None:
+        message = "liftover " + source_assembly + " -> " + target_assembly + " failed on attempt " + str(attempt) + ": " + problem + ". halLiftover stderr:\n" + get_file_tail(stderr_file)
+        job_metrics.record(failure=problem)
+        if attempt > liftover_options.max_retries:
+            raise RuntimeError(message)
+        job.fileStore.logToMaster(message + "\nRetrying with " + str(job.memory * 2) + " bytes of memory.", logging.WARNING)
+        return job.addChildJobFn(liftover, hal_file, source_assembly, source_full_bed, target_assembly, liftover_options, attempt + 1, predicted_seconds, memory=job.memory * 2).rv()
+
+    if liftover_options.checkpoint_dir is not None:
+        write_checkpoint(liftover_options.checkpoint_dir, source_assembly, target_assembly, out_bed, liftover_options.psl)
+    return job.fileStore.writeGlobalFile(out_bed)
 
-    return out_bed
+def get_file_tail(path, max_bytes=10000):
+    """
+    Returns the last max_bytes of the file (e.g. the end of halLiftover's stderr, which is 
+    where the error is).
+    """
+    with open(path, "rb") as inf:
+        inf.seek(0, os.SEEK_END)
+        inf.seek(max(0, inf.tell() - max_bytes))
+        return inf.read().decode(errors="replace")
     
 def print_debug(job, message, thing):
     print("++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++", message, thing)
 
 
-def all_to_all_liftovers(job, assembly_files, assembly_lengths, hal_file):
+@job_metrics.instrumented
+def all_to_all_liftovers(job, assembly_files, length_table, hal_file, liftover_options, checkpointed_liftovers=None, cost_options=None, sources=None, targets=None):
     """assembly_files is a dict with key: assembly name and value: assembly_file.
+    length_table is the file ID of the contig_length_table of every assembly.
+    liftover_options (see get_liftover_options) is passed on to each liftover.
+    checkpointed_liftovers is dict of key: (source_asm, target_asm), value: file ID of a 
+    liftover that's already been done, which is used instead of redoing it.
+    The liftovers are submitted longest-first, as estimated with cost_options (see 
+    liftover_costs.get_cost_options).
+    sources and targets (see genome_subsets) restrict the liftovers to the pairs of a
+    source and a target. By default, every asm in assembly_files is both.
     """
+    if checkpointed_liftovers is None:
+        checkpointed_liftovers = dict()
+    if sources is None:
+        sources = list(assembly_files)
+    if targets is None:
+        targets = list(assembly_files)
     leader = job.addFollowOnJobFn(empty)
     
     # Then, make the full.bed files, which will act as srcBed in the liftover. This way,
     # the liftover will look for where the target genome is mapped to all possible locations
     # in the src genome.
     full_beds = dict()
-    for asm in assembly_files:
-        full_beds[asm] = leader.addChildJobFn(write_full_bed, assembly_lengths[asm]).rv()
+    for asm in sources:
+        full_beds[asm] = leader.addChildJobFn(write_full_bed, length_table, asm).rv()
 
     full_beds_jobs = leader.addFollowOnJobFn(empty)
 
     #liftovers is nested dict, with key:(target_asm), value:<dict, with key:source_asm, value:<list of liftover_files with target_asm as target> >
     liftovers = dict()
-    for target_asm in assembly_files:
+    pairs = list()
+    for target_asm in targets:
         liftovers[target_asm] = dict()
-        for source_asm in assembly_files:
+        for source_asm in sources:
             
             if source_asm == target_asm:
                 continue
 
-            # liftovers[target_asm][source_asm] = full_beds_jobs.addChildJobFn(liftover, hal_file, source_asm, full_beds[source_asm], target_asm, cores=1).rv()
-            liftovers[target_asm][source_asm] = full_beds_jobs.addChildJobFn(liftover, hal_file, source_asm, full_beds[source_asm], target_asm).rv()
+            liftovers[target_asm][source_asm] = checkpointed_liftovers.get((source_asm, target_asm))
+            if (source_asm, target_asm) not in checkpointed_liftovers:
+                pairs.append((source_asm, target_asm))
+
+    for source_asm, target_asm, predicted_seconds, resources in get_ordered_liftovers(job, pairs, length_table, cost_options, liftover_options.memory):
+        # liftovers[target_asm][source_asm] = full_beds_jobs.addChildJobFn(liftover, hal_file, source_asm, full_beds[source_asm], target_asm, cores=1).rv()
+        liftovers[target_asm][source_asm] = full_beds_jobs.addChildJobFn(liftover, hal_file, source_asm, full_beds[source_asm], target_asm, liftover_options, predicted_seconds=predicted_seconds, **resources).rv()
     
     return liftovers
 
+def get_ordered_liftovers(job, pairs, length_table, cost_options=None, default_memory=None):
+    """
+    Returns list of (source_asm, target_asm, predicted_seconds, resources) for each pair
+    in pairs, longest-first, where resources are the toil resource requests for the pair's
+    liftover (see liftover_costs.get_resources).
+    """
+    if cost_options is None:
+        cost_options = liftover_costs.get_cost_options()
+    costs = liftover_costs.get_liftover_costs(pairs, contig_length_table.load_asm_sizes(job, length_table), cost_options)
+    return [(source_asm, target_asm, costs[(source_asm, target_asm)], liftover_costs.get_resources((source_asm, target_asm), cost_options, default_memory)) for source_asm, target_asm in liftover_costs.order_by_cost(pairs, costs)]
 
-# def all_to_ref_liftovers(job, assembly_files, assembly_lengths, reference_asm, hal_file):
-#     leader = job.addFollowOnJobFn(empty)
-#     # get all the full_beds, so that we can do a liftover on the full sequence in the assembly:
-#     full_beds = dict()
-#     for asm in assembly_files:
-#         full_beds[asm] = leader.addChildJobFn(write_full_bed, assembly_lengths[asm]).rv()
-#     full_beds_jobs = leader.addFollowOnJobFn(empty)
-
-#     # do all the liftovers (key:asm, value:bases_mapped_to_ref):
-#     liftovers = dict()
-#     for asm in assembly_files:
-#         if asm != reference_asm:
-#             liftover[asm] = full_beds_job.addChildJobFn(liftover, hal_file, asm, full_beds[asm], reference_asm).rv()
-
-#     return liftovers
+@job_metrics.instrumented
+def all_to_ref_liftovers(job, assembly_files, length_table, reference_asm, hal_file, liftover_options, checkpointed_liftovers=None, cost_options=None):
+    """
+    Lifts every other asm in assembly_files over to reference_asm, longest-first as in
+    all_to_all_liftovers. Returns dict of key: asm, value: its liftover to reference_asm.
+    """
+    if checkpointed_liftovers is None:
+        checkpointed_liftovers = dict()
+    leader = job.addFollowOnJobFn(empty)
+    # get all the full_beds, so that we can do a liftover on the full sequence in the assembly:
+    full_beds = dict()
+    for asm in assembly_files:
+        if asm != reference_asm and (asm, reference_asm) not in checkpointed_liftovers:
+            full_beds[asm] = leader.addChildJobFn(write_full_bed, length_table, asm).rv()
+    full_beds_jobs = leader.addFollowOnJobFn(empty)
 
+    # do all the liftovers (key:asm, value:bases_mapped_to_ref):
+    liftovers = dict()
+    for asm in assembly_files:
+        if asm != reference_asm:
+            liftovers[asm] = checkpointed_liftovers.get((asm, reference_asm))
+    for asm, target_asm, predicted_seconds, resources in get_ordered_liftovers(job, [(asm, reference_asm) for asm in full_beds], length_table, cost_options, liftover_options.memory):
+        liftovers[asm] = full_beds_jobs.addChildJobFn(liftover, hal_file, asm, full_beds[asm], reference_asm, liftover_options, predicted_seconds=predicted_seconds, **resources).rv()
 
+    return liftovers
 
-def ref_to_asm_liftover(job, ref, ref_contig_lengths, asm, hal_file):
+@job_metrics.instrumented
+def ref_to_asm_liftover(job, ref, length_table, asm, hal_file, liftover_options):
     # get the full_bed, for the liftover calculation on the full of the ref:
-    ref_full_bed_job = job.addChildJobFn(write_full_bed, ref_contig_lengths)
+    ref_full_bed_job = job.addChildJobFn(write_full_bed, length_table, ref)
     ref_full_bed = ref_full_bed_job.rv()
 
     # do all the liftovers (key:asm, value:bases_mapped_to_ref):
-    return ref_full_bed_job.addChildJobFn(liftover, hal_file, ref, ref_full_bed, asm).rv()
+    return ref_full_bed_job.addChildJobFn(liftover, hal_file, ref, ref_full_bed, asm, liftover_options).rv()
 
-def asm_to_ref_liftover(job, asm, assembly_contig_lengths, reference_asm, hal_file):
+@job_metrics.instrumented
+def asm_to_ref_liftover(job, asm, length_table, reference_asm, hal_file, liftover_options):
     """
     #NOTE TO SELF: Below is the code for performing the opposite liftover of the one we want for the original graphs - the one that shows coverage in terms of the reference bases involved in a mapping, rather than the asm bases involved in a mapping. 
     """
     # get the full_bed, for the liftover calculation on the full sequence in the assembly:
-    asm_full_bed_job = job.addChildJobFn(write_full_bed, assembly_contig_lengths)
+    asm_full_bed_job = job.addChildJobFn(write_full_bed, length_table, asm)
     asm_full_bed = asm_full_bed_job.rv()
 
     # do all the liftovers (key:asm, value:bases_mapped_to_ref):
-    return asm_full_bed_job.addChildJobFn(liftover, hal_file, asm, asm_full_bed, reference_asm).rv()
+    return asm_full_bed_job.addChildJobFn(liftover, hal_file, asm, asm_full_bed, reference_asm, liftover_options).rv()
 
 def main():
     # if I wanted to make this into a true command line tool, I'd fill out the parser.
     # Instead, I'm just going to add the bare minimum for making a workflow. 
+    from toil.common import Toil
+    from toil.job import Job
     parser = ArgumentParser()
     Job.Runner.addToilOptions(parser)
     # parser.add_argument(
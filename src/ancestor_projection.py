@@ -0,0 +1,166 @@
+"""
+The all-to-all mapping depths, projected through an ancestor of the hal in O(N) liftovers,
+rather than the O(N^2) of all_to_all_liftovers.
+
+Cactus hals have the ancestral genomes as well as the leaves. Every leaf under an ancestor
+is aligned through it, so each base of the ancestor is a column of the alignment, and the
+leaves lifted onto it are that column's members. So:
+    1. each source is lifted over once, onto the ancestor (the root, by default), and its
+       liftover is merged into the columns it occupies.
+    2. the occupancy of every column (the number of sources in it) is swept into a bed of
+       the ancestor, with the occupancy as the name of each interval.
+    3. the occupancy bed is lifted over once onto each target. halLiftover carries the
+       name over, so each base of the target gets the occupancy of its column, less one
+       if the target is itself a source. That's its mapping depth.
+So the number of halLiftovers grows linearly with the number of genomes (one per source,
+plus one per target), and all-vs-all connectivity stays feasible on graphs of hundreds of
+genomes.
+
+This counts the sources aligned to each base through the ancestor's columns, which is what
+halLiftover follows between leaves anyway, so long as the ancestor is above both. Where a
+target base is in more than one column (e.g. a duplication in the ancestor), the occupancy
+of each is counted, as with the copies of a pairwise liftover.
+"""
+from src import contig_length_table
+from src import genome_subsets
+from src import interval_kernels
+from src import job_metrics
+
+import collections as col
+import operator
+
+def get_root(tree):
+    """
+    Returns the root of tree (from genome_subsets.parse_newick), i.e. the one genome that
+    isn't the child of any other.
+    """
+    children = {child for node_children in tree.values() for child in node_children}
+    return [genome for genome in tree if genome not in children][0]
+
+def get_projection_ancestor(tree, ancestor, genomes):
+    """
+    Returns the ancestor to project through: the root of tree if ancestor is None.
+    Raises ValueError if it isn't an ancestor in tree, or if any of genomes isn't under it.
+    """
+    if ancestor is None:
+        ancestor = get_root(tree)
+    subtree_genomes = genome_subsets.get_subtree_genomes(tree, ancestor)
+    if not tree[ancestor]:
+        raise ValueError(ancestor + " is a leaf of the hal's tree, not an ancestor.")
+    outside = [genome for genome in genomes if genome not in subtree_genomes]
+    if outside:
+        raise ValueError("these assemblies aren't under " + ancestor + ", so can't be projected through it: " + ", ".join(outside))
+    return ancestor
+
+@job_metrics.instrumented
+def get_ancestor_columns(job, liftover_bed):
+    """
+    Returns the coords of the ancestor occupied by one source's liftover onto it (in the
+    same format as interval_kernels.get_mapping_coverage_coordinates), keyed by
+    the ancestor's contig names.
+    """
+    alignment_bed_file = job.fileStore.readGlobalFile(liftover_bed)
+    mapping_coverage_points = interval_kernels.read_mapping_coverage_points(alignment_bed_file)
+    job_metrics.record(input_bytes=job_metrics.get_file_size(alignment_bed_file))
+    return interval_kernels.get_mapping_coverage_coordinates(mapping_coverage_points)
+
+def get_occupancy_intervals(source_columns):
+    """
+    source_columns is list of the output of get_ancestor_columns, one per source. Yields
+    (contig_id, start, stop, occupancy) for every run of the ancestor occupied by the same
+    number (at least one) of sources, in order along each contig.
+    """
+    occupancy_points = col.defaultdict(list)
+    for columns in source_columns:
+        for contig_id, coords in columns.items():
+            for start, stop in coords:
+                occupancy_points[contig_id].append((start, True))
+                occupancy_points[contig_id].append((stop, False))
+
+    for contig_id in sorted(occupancy_points):
+        occupancy = 0
+        last_base = 0
+        for point, start_bool in sorted(occupancy_points[contig_id], key=operator.itemgetter(0, 1)):
+            if point != last_base and occupancy:
+                yield contig_id, last_base, point, occupancy
+            last_base = point
+            occupancy += 1 if start_bool else -1
+
+@job_metrics.instrumented
+def write_occupancy_bed(job, source_columns):
+    """
+    Returns the file ID of the occupancy bed of the ancestor (see get_occupancy_intervals),
+    with the occupancy of each interval in its name column.
+    """
+    out_bed = job.fileStore.getLocalTempFile()
+    intervals = int()
+    with open(out_bed, "w") as outf:
+        for contig_id, start, stop, occupancy in get_occupancy_intervals(source_columns):
+            outf.write(contig_id + "\t" + str(start) + "\t" + str(stop) + "\t" + str(occupancy) + "\n")
+            intervals += 1
+    job_metrics.record(output_bytes=job_metrics.get_file_size(out_bed), intervals=intervals)
+    return job.fileStore.writeGlobalFile(out_bed)
+
+def parse_projected_points(bed_lines, self_occupancy=0, contig_ids=None):
+    """
+    Given the occupancy bed lifted over onto a target, returns dict of key: contig_id,
+    value: list of (point, change in depth), for the start and stop of each interval.
+    self_occupancy is 1 if the target is one of the sources, so it doesn't count itself.
+    If contig_ids (from the target's contig table) is given, contigs are keyed by their
+    contig_number.
+    """
+    projected_points = col.defaultdict(list)
+    contig_name = None
+    for line in bed_lines:
+        parsed = line.rstrip("\n").split("\t")
+        depth = int(parsed[3]) - self_occupancy
+        if not depth:
+            continue
+        if parsed[0] != contig_name:
+            contig_name = parsed[0]
+            contig_points = projected_points[contig_name if contig_ids is None else contig_ids[contig_name]]
+        contig_points.append((int(parsed[1]), depth))
+        contig_points.append((int(parsed[2]), -depth))
+    return projected_points
+
+def get_projected_mapping_depths(projected_points, contig_lengths):
+    """
+    Like interval_kernels.get_mapping_depths, but for the weighted points of
+    parse_projected_points. Returns the same (mapping_depths, debug_1_if, debug_2_if), so
+    the same output functions apply.
+    """
+    mapping_depths = col.defaultdict(int)
+    debug_1_if = int()
+    debug_2_if = int()
+    for contig_id, contig_length in contig_lengths.items():
+        depth_coverage = 0
+        last_base = 0
+        for point, depth_change in sorted(projected_points.get(contig_id, list()), key=operator.itemgetter(0)):
+            if point == last_base:
+                debug_1_if += 1
+            else:
+                mapping_depths[depth_coverage] += point - last_base
+                last_base = point
+                debug_2_if += 1
+            depth_coverage += depth_change
+        if last_base < contig_length:
+            mapping_depths[0] += contig_length - last_base
+    return (mapping_depths, debug_1_if, debug_2_if)
+
+@job_metrics.instrumented
+def calculate_projected_mapping_depths(job, projected_bed, length_table, asm, self_occupancy=0):
+    """
+    projected_bed is the occupancy bed lifted over onto the target, asm, whose contig table
+    is loaded from the contig_length_table with file ID length_table. Returns dict with:
+        "mapping_depths": the output of get_projected_mapping_depths.
+        "n_bases_unmapped": the bases of the target's runs of Ns at depth 0 (see
+            interval_kernels.count_unmapped_n_bases).
+    """
+    contig_table = contig_length_table.load_contig_table(job, length_table, asm)
+    projected_bed_file = job.fileStore.readGlobalFile(projected_bed)
+    with open(projected_bed_file) as inf:
+        projected_points = parse_projected_points(inf, self_occupancy, contig_table.ids)
+    job_metrics.record(input_bytes=job_metrics.get_file_size(projected_bed_file), intervals=job_metrics.count_intervals(projected_points) // 2)
+    # every interval has a depth of at least one, so its points cover it like a liftover's.
+    coverage_points = {contig_id: [(point, depth_change > 0) for point, depth_change in contig_points] for contig_id, contig_points in projected_points.items() if contig_id in contig_table.n_runs}
+    return {"mapping_depths": get_projected_mapping_depths(projected_points, contig_table.lengths), "n_bases_unmapped": interval_kernels.count_unmapped_n_bases(coverage_points, contig_table.lengths, contig_table.n_runs)}
@@ -1,58 +1,47 @@
 from src import calculate_bases_unmapped
-
-import collections as col
-import operator
-
-def get_mapping_depths(job, mapping_coverage_points, contig_lengths):
+from src import contig_length_table
+from src import interval_kernels
+from src import job_metrics
+from src import result_tables
+from src import source_coverage
+
+@job_metrics.instrumented
+def get_mapping_depths(job, mapping_coverage_points, length_table, asm):
     """
-    Based on get_mapping_coverage_coordinates algorithm.
-    Returns the number of bases covered at each depth level.
+    See interval_kernels.get_mapping_depths, with the contig lengths of asm.
     """
-    # mapping_depths is key: depth_level (int); value:bases_covered_at_depth_level
-    # it measure the number of bases involved in an alignment, segregated by the number of
-    # times each base is involved in an alignment.
-    mapping_depths = col.defaultdict(int)
-    
-    for contig_id in mapping_coverage_points:
-        liftover_coverage_points = sorted(mapping_coverage_points[contig_id], key=operator.itemgetter(0, 1))
-
-        depth_coverage = 0
-        last_base = 0 # The "previous" bases we measured ended at the beginning of the sequence. So, last_base is at 0.
-        debug_1_if = int()
-        debug_2_if = int()
-        for point in liftover_coverage_points:
-            # first, check to see if we've actually moved anywhere along the seq:
-            if point[0] == last_base:
-                if point[1]:
-                    depth_coverage += 1
-                else:
-                    depth_coverage -= 1
-                debug_1_if += 1
-            else:
-                # We've reached a point that's further along the seq.
-                # print("++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++mapping_depths", mapping_depths, "++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
-                # print("++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++depth_coverage", depth_coverage, "++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
-                # print("++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++last_base", last_base, "++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
-                # print("++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++point", point, "++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
-                mapping_depths[depth_coverage] += (point[0] - last_base)
-                if point[1]:
-                    depth_coverage += 1
-                else:
-                    depth_coverage -= 1
-                last_base = point[0]
-                debug_2_if += 1
-
-
-        # check to make sure that any sequence after the last coverage point is included
-        # in the mapping_depths dict at depth = 0.
-        # if last_base + 1 < contig_lengths[contig_id]:
-        if last_base < contig_lengths[contig_id]:
-            # mapping_depths[0] += contig_lengths[contig_id] - last_base + 1
-            mapping_depths[0] += contig_lengths[contig_id] - last_base
+    contig_lengths = contig_length_table.load_contig_table(job, length_table, asm).lengths
+    mapping_depths = interval_kernels.get_mapping_depths(mapping_coverage_points, contig_lengths)
+    job_metrics.record(intervals=job_metrics.count_intervals(mapping_coverage_points) // 2)
+    return mapping_depths
 
-    return (mapping_depths, debug_1_if, debug_2_if)
+@job_metrics.instrumented
+def count_unmapped_n_bases(job, mapping_coverage_points, length_table, asm):
+    """
+    See interval_kernels.count_unmapped_n_bases, with the contigs of asm.
+    """
+    contig_table = contig_length_table.load_contig_table(job, length_table, asm)
+    n_bases_unmapped = interval_kernels.count_unmapped_n_bases(mapping_coverage_points, contig_table.lengths, contig_table.n_runs)
+    job_metrics.record(intervals=job_metrics.count_intervals(contig_table.n_runs))
+    return n_bases_unmapped
 
-def calculate_mapping_depths(job, liftover_bed_files, contig_lengths):
+@job_metrics.instrumented
+def calculate_mapping_depths(job, liftover_bed_files, length_table, asm, index_track=None, table_options=None, store_options=None):
+    """
+    asm is the target, and length_table the file ID of the contig_length_table, from which
+    each child loads asm's contig table (see contig_length_table.intern_contigs) itself.
+
+    Returns dict with:
+        "mapping_depths": the output of get_mapping_depths.
+        "n_bases_unmapped": the bases of the target's runs of Ns at depth 0.
+        "index": if index_track is given, a connectivity_index of the target's mapping
+            depths.
+        "depths_table": if table_options (see result_tables.get_table_options) is given,
+            the target's part of the per-contig depths table.
+        "source_coverage": if store_options (see source_coverage.get_store_options, with
+            the source of each of liftover_bed_files) is given, a source_coverage store of
+            the target.
+    """
     # perform a separate calculation of intervals unmapped in each liftover_bed.
     # Then, add all the intervals into a single list, sorted by first digit, and then 
     # second digit.
@@ -60,24 +49,79 @@ def calculate_mapping_depths(job, liftover_bed_files, contig_lengths):
     
     mapping_coverage_points = list()
     for bedfile in liftover_bed_files:
-        mapping_coverage_points.append(leader.addChildJobFn(calculate_bases_unmapped.get_mapping_coverage_points, bedfile).rv())
+        mapping_coverage_points.append(leader.addChildJobFn(calculate_bases_unmapped.get_mapping_coverage_points, bedfile, length_table, asm).rv())
     coverage_points_jobs = leader.encapsulate()
 
+    # the store needs the coverage of each source on its own, before they're merged.
+    source_coverage_coords = None
+    if store_options is not None:
+        source_coverage_coords = dict()
+        for source, points in zip(store_options.sources, mapping_coverage_points):
+            source_coverage_coords[source] = coverage_points_jobs.addChildJobFn(calculate_bases_unmapped.get_mapping_coverage_coordinates, points).rv()
+
     merged_mapping_coverage_points = coverage_points_jobs.addChildJobFn(calculate_bases_unmapped.merge_mapping_coverage_points, mapping_coverage_points).rv()
     merging_jobs = coverage_points_jobs.encapsulate()
 
-    mapping_depths = merging_jobs.addChildJobFn(get_mapping_depths, merged_mapping_coverage_points, contig_lengths).rv()
+    mapping_depths = merging_jobs.addChildJobFn(get_mapping_depths, merged_mapping_coverage_points, length_table, asm).rv()
+    # most targets have no runs of Ns, and don't need the job. The header of the table
+    # says so, without reading the target's contigs.
+    n_bases_unmapped = 0
+    if contig_length_table.load_asm_n_bases(job, length_table)[asm]:
+        n_bases_unmapped = merging_jobs.addChildJobFn(count_unmapped_n_bases, merged_mapping_coverage_points, length_table, asm).rv()
+    index_file = None
+    if index_track is not None:
+        index_file = merging_jobs.addChildJobFn(calculate_bases_unmapped.write_connectivity_index, merged_mapping_coverage_points, length_table, asm, index_track).rv()
+    depths_table = None
+    if table_options is not None:
+        depths_table = merging_jobs.addChildJobFn(result_tables.write_depths_table, merged_mapping_coverage_points, length_table, asm, table_options).rv()
+    store_file = None
+    if store_options is not None:
+        store_file = merging_jobs.addChildJobFn(source_coverage.write_source_coverage_store, source_coverage_coords, length_table, asm, store_options).rv()
     mapping_depths_job = merging_jobs.encapsulate()
 
-    return mapping_depths
+    return {"mapping_depths": mapping_depths, "n_bases_unmapped": n_bases_unmapped, "index": index_file, "depths_table": depths_table, "source_coverage": store_file}
 
-def calculate_all_mapping_depths(job, liftovers, contig_lengths):
+@job_metrics.instrumented
+def calculate_all_mapping_depths(job, liftovers, length_table, build_indexes=False, table_format=None, build_source_coverage=False):
+    """
+    length_table is the file ID of the contig_length_table of every assembly.
+
+    Returns dict with:
+        "mapping_depths": dict of key: assembly_id, value: output of get_mapping_depths.
+        "n_bases_unmapped": dict of key: assembly_id, value: the bases of its runs of Ns
+            at depth 0.
+        "indexes": if build_indexes, dict of key: assembly_id, value: connectivity_index of
+            that target assembly.
+        "depths_tables": if table_format (see result_tables.get_table_format) is given, dict
+            of key: assembly_id, value: that target's part of the per-contig depths table.
+        "source_coverage": if build_source_coverage, dict of key: assembly_id, value:
+            source_coverage store of that target assembly.
+    """
     #todo: implement minimum_size_gap, similar to in calculate_bases_unmapped?
     # mapping_depths has key: assembly_id value:list(bases_unmapped, bases_mapped_once, bases_mapped_twice... etc.)
     mapping_depths = dict()
+    n_bases_unmapped = dict()
+    index_files = dict() if build_indexes else None
+    depths_tables = dict() if table_format is not None else None
+    store_files = dict() if build_source_coverage else None
     for target_assembly, source_assembly_liftovers in liftovers.items():
-        mapping_depths[target_assembly] = job.addChildJobFn(calculate_mapping_depths, list(source_assembly_liftovers.values()), contig_lengths[target_assembly]).rv()
-    return mapping_depths
+        index_track = target_assembly if build_indexes else None
+        table_options = None
+        if table_format is not None:
+            table_options = result_tables.get_table_options(table_format, {"target": target_assembly})
+        store_options = None
+        if build_source_coverage:
+            store_options = source_coverage.get_store_options(target_assembly, list(source_assembly_liftovers))
+        mapping_depths_job = job.addChildJobFn(calculate_mapping_depths, list(source_assembly_liftovers.values()), length_table, target_assembly, index_track, table_options, store_options)
+        mapping_depths[target_assembly] = mapping_depths_job.rv("mapping_depths")
+        n_bases_unmapped[target_assembly] = mapping_depths_job.rv("n_bases_unmapped")
+        if build_indexes:
+            index_files[target_assembly] = mapping_depths_job.rv("index")
+        if table_format is not None:
+            depths_tables[target_assembly] = mapping_depths_job.rv("depths_table")
+        if build_source_coverage:
+            store_files[target_assembly] = mapping_depths_job.rv("source_coverage")
+    return {"mapping_depths": mapping_depths, "n_bases_unmapped": n_bases_unmapped, "indexes": index_files, "depths_tables": depths_tables, "source_coverage": store_files}
 
 
 """    
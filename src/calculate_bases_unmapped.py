@@ -1,15 +1,21 @@
 """
 Built to exclude overlap in bedfiles with lots of overlap. (e.g. the halLiftover output)
 """
+from src import connectivity_index
+from src import contig_length_table
+from src import interval_kernels
+from src import job_metrics
+from src import poor_mapping_regions
+from src import result_tables
+
 import collections as col
-import operator
+import logging
 
 from types import SimpleNamespace
 import ast
 from argparse import ArgumentParser
 
-from toil.common import Toil
-from toil.job import Job
+logger = logging.getLogger(__name__)
 
 def empty(job):
     """
@@ -17,165 +23,171 @@ def empty(job):
     """
     return
 
-def get_mapping_coverage_points(job, alignment_bed):
+@job_metrics.instrumented
+def get_mapping_coverage_points(job, alignment_bed, length_table=None, asm=None):
     """
     Returns:
     all start and stop points of lines in the bedfile, sorted by contigs.
         key: contig_id, value: list[regions in tuple(point_value, start_bool) format].
         where start_bool is true if the point is a start of a region, and false if the point is a stop of the region.
+    If length_table (the file ID of the contig_length_table) is given, contigs are keyed by
+    the contig_numbers of the target, asm, instead of their name.
     """
-    # start-points and stop-points of each line in the bedfile. 
-    # key: tuple(fasta_file, contig_id), value: list[regions in tuple(point_value, start_bool) format].
-    mapping_coverage_points = col.defaultdict(list)
-
+    contig_ids = None
+    if length_table is not None:
+        contig_ids = contig_length_table.load_contig_table(job, length_table, asm).ids
     # add all start and end points for regions that map well 
-    with open(job.fileStore.readGlobalFile(alignment_bed)) as f:
-        for line in f:
-            # parse line in map_file:
-            parsed = line.split("\t")
-            
-            contig_id = parsed[0]
-            start = int(parsed[1])
-            stop = int(parsed[2])
-
-            # add these coordinates to mapping_coverage_points
-            mapping_coverage_points[contig_id].append((start, True))
-            mapping_coverage_points[contig_id].append((stop, False))
+    alignment_bed_file = job.fileStore.readGlobalFile(alignment_bed)
+    mapping_coverage_points = interval_kernels.read_mapping_coverage_points(alignment_bed_file, contig_ids=contig_ids)
+    job_metrics.record(input_bytes=job_metrics.get_file_size(alignment_bed_file), intervals=job_metrics.count_intervals(mapping_coverage_points) // 2)
     return mapping_coverage_points
 
-# def merge_mapping_coverage_points(job, mapping_coverage_points):
-#     merged = col.defaultdict(list)
-#     for points in mapping_coverage_points:
-#         for key, values in points.items():
-#                 for value in values:
-#                     merged[key].append(value)
-#     return merged
-
+@job_metrics.instrumented
+def get_psl_coverage_points(job, alignment_psl, length_table, target_asm, source_asm):
+    """
+    Returns (target_mapping_coverage_points, source_mapping_coverage_points) from a single
+    read of a halLiftover --outPSL liftover (see interval_kernels.parse_psl_coverage_points),
+    keyed by the contig_numbers of the target's and the source's contig tables.
+    """
+    target_contig_table = contig_length_table.load_contig_table(job, length_table, target_asm)
+    source_contig_table = contig_length_table.load_contig_table(job, length_table, source_asm)
+    alignment_psl_file = job.fileStore.readGlobalFile(alignment_psl)
+    target_mapping_coverage_points, source_mapping_coverage_points = interval_kernels.read_psl_coverage_points(alignment_psl_file, target_contig_ids=target_contig_table.ids, source_contig_ids=source_contig_table.ids)
+    job_metrics.record(input_bytes=job_metrics.get_file_size(alignment_psl_file), intervals=job_metrics.count_intervals(target_mapping_coverage_points) // 2)
+    return target_mapping_coverage_points, source_mapping_coverage_points
+
+@job_metrics.instrumented
 def merge_mapping_coverage_points(job, mapping_coverage_points):
     """
-    mapping_coverage_points is a list of defaultdict(list), one for each liftover file.
-
-    This function outputs a single defaultdict(list), maintaining the keys of the input 
-    dicts, but with the internal lists appended to one another.
+    See interval_kernels.merge_mapping_coverage_points.
     """
-    merged = col.defaultdict(list)
-    for liftover_dict in mapping_coverage_points:
-        for contig_id, points in liftover_dict.items():
-                for point in points:
-                    merged[contig_id].append(point)
+    merged = interval_kernels.merge_mapping_coverage_points(mapping_coverage_points)
+    job_metrics.record(intervals=job_metrics.count_intervals(merged) // 2)
     return merged
 
+@job_metrics.instrumented
 def get_mapping_coverage_coordinates(job, mapping_coverage_points):
     """
-    Returns all the coords (defined by tuple(start,stop)) that are covered by at least one mapping in 
-    mapping_coverage_points.
+    See interval_kernels.get_mapping_coverage_coordinates.
     """
-    # mapping_coverage_coords is key: contig_id, value: list of coords: [(start, stop)]
-    mapping_coverage_coords = col.defaultdict(list)
-    for contig_id in mapping_coverage_points:
-        contig_coverage_points = sorted(mapping_coverage_points[contig_id], key=operator.itemgetter(0, 1))
-        # contig_coverage_points = sorted(mapping_coverage_points[contig_id], key=lambda point: point[0])
-        open_points = 0
-        current_region = [0, 0] # format (start, stop)
-        for i in range(len(contig_coverage_points)):
-            if open_points:
-                # then we have at least one read overlapping this region.
-                # expand the stop point of current_region
-                current_region[1] = contig_coverage_points[i][0]
-            if contig_coverage_points[i][1]:
-                # if start_bool is true, the point represents a start of mapping
-                open_points += 1
-                if open_points == 1:
-                    # that is, if we've found the starting point of a new current_region,
-                    # so we should set the start of the current_region.
-                    current_region[0] = contig_coverage_points[i][0]
-            else:
-                # if start_bool is not true, the point represents the end of a mapping.
-                open_points -= 1
-                if not open_points:
-                    # if there's no more open_points in this region, then this is the 
-                    # end of the current_region. Save current_region.
-                    mapping_coverage_coords[contig_id].append(current_region.copy())
+    mapping_coverage_coords = interval_kernels.get_mapping_coverage_coordinates(mapping_coverage_points)
+    job_metrics.record(intervals=job_metrics.count_intervals(mapping_coverage_coords))
     return mapping_coverage_coords
 
-def get_poor_mapping_coverage_coordinates(job, contig_lengths, mapping_coverage_coords, options):
+@job_metrics.instrumented
+def get_poor_mapping_coverage_coordinates(job, length_table, asm, mapping_coverage_coords, options):
     """
-    mapping_coverage_coords is a dictionary of lists of coords in (start, stop) format.
-    This function returns poor mapping coords, which is essentially the gaps between 
-        those coords.
-    example: mapping_coverage_coords{contig_1:[(3,5), (7, 9)]} would result in
-                mapping_coverage_coords{contig_1:[(0,3), (5,7), (9, 11)]}, if contig_1 had a
-                length of 11.
-    variables:
-        contig_lengths: A dictionary of the length of all the contigs in 
-            {key: contig_id value: len(contig)} format.
-        mapping_coverage_coords: a dictionary of lists of coords in 
-            {key: contig_id, value:[(start, stop)]}
-        sequence_context: an integer, representing the amount of sequence you would 
-            want to expand each of the poor_mapping_coords by, to include context
-            sequence for the poor mapping sequence. 
+    See interval_kernels.get_poor_mapping_coverage_coordinates, with the contig lengths of
+    asm.
     """
-    # poor_mapping_coords has key: contig_id, value list(tuple_of_positions(start, stop))
-    poor_mapping_coords = col.defaultdict(list)
-    for contig_id in contig_lengths:
-        if contig_id in mapping_coverage_coords:
-            if mapping_coverage_coords[contig_id][0][0] > 0:
-                # if the first mapping region for the contig doesn't start at the start of
-                # the contig, the first region is between the start of the contig and the 
-                # start of the good_mapping_region.
-                poor_mapping_stop = mapping_coverage_coords[contig_id][0][0] + options.sequence_context
-                if poor_mapping_stop > contig_lengths[contig_id]:
-                    poor_mapping_stop = contig_lengths[contig_id]
-                if poor_mapping_stop - 0 >= options.minimum_size_remap: # implement size threshold.
-                    poor_mapping_coords[contig_id].append((0, poor_mapping_stop))
-                else:
-                    pass
-            for i in range(len(mapping_coverage_coords[contig_id]) - 1):
-                # for every pair of mapping coords i and i + 1,
-                # make a pair of (stop_from_ith_region, start_from_i+1th_region) to
-                # represent the poor_mapping_coords. Include sequence_context as necessary.
-                poor_mapping_start = mapping_coverage_coords[contig_id][i][1] - options.sequence_context
-                if poor_mapping_start < 0:
-                    poor_mapping_start = 0
-                    
-                poor_mapping_stop = mapping_coverage_coords[contig_id][i + 1][0] + options.sequence_context
-                if poor_mapping_stop > contig_lengths[contig_id]:
-                    poor_mapping_stop = contig_lengths[contig_id]
-
-                if poor_mapping_stop - poor_mapping_start >= options.minimum_size_remap: # implement size threshold.
-                    poor_mapping_coords[contig_id].append((poor_mapping_start, poor_mapping_stop))
-                else:
-                    pass
-            if mapping_coverage_coords[contig_id][-1][1] < contig_lengths[contig_id]:
-                # if the last mapping region for the contig stops before the end of
-                # the contig, the last region is between the end of the mapping and the 
-                # end of the contig.
-                poor_mapping_start = mapping_coverage_coords[contig_id][-1][1] - options.sequence_context
-                if poor_mapping_start < 0:
-                    poor_mapping_start = 0
-                if contig_lengths[contig_id] - poor_mapping_start >= options.minimum_size_remap: # implement size threshold.
-                    poor_mapping_coords[contig_id].append((poor_mapping_start, contig_lengths[contig_id]))
-                else:
-                    pass
-
-        else:
-            print("no_good_mapping_regions_so_final_else")
-            # there isn't a good_mapping region for this contig. The full length of 
-            # the contig belongs in poor_mapping_coords.
-            poor_mapping_coords[contig_id].append((0, contig_lengths[contig_id]))
+    contig_lengths = contig_length_table.load_contig_table(job, length_table, asm).lengths
+    poor_mapping_coords = interval_kernels.get_poor_mapping_coverage_coordinates(contig_lengths, mapping_coverage_coords, options)
+    job_metrics.record(intervals=job_metrics.count_intervals(poor_mapping_coords))
     return poor_mapping_coords
 
+@job_metrics.instrumented
+def write_connectivity_index(job, mapping_coverage_points, length_table, asm, track):
+    contig_table = contig_length_table.load_contig_table(job, length_table, asm)
+    index_file = job.fileStore.getLocalTempFile()
+    connectivity_index.write_index(index_file, mapping_coverage_points, contig_table.lengths, track, contig_table.names)
+    job_metrics.record(output_bytes=job_metrics.get_file_size(index_file))
+    return job.fileStore.writeGlobalFile(index_file)
+
+@job_metrics.instrumented
+def count_gap_lengths(job, interval_list_dict):
+    """
+    See interval_kernels.count_gap_lengths.
+    """
+    gap_length_counts = interval_kernels.count_gap_lengths(interval_list_dict)
+    job_metrics.record(gaps=sum(gap_length_counts.values()), distinct_gap_lengths=len(gap_length_counts))
+    return gap_length_counts
+
+@job_metrics.instrumented
+def count_gap_n_bases(job, interval_list_dict, length_table, asm):
+    """
+    See interval_kernels.count_gap_n_bases, with the runs of Ns of asm.
+    """
+    n_runs = contig_length_table.load_contig_table(job, length_table, asm).n_runs
+    gap_n_base_counts = interval_kernels.count_gap_n_bases(interval_list_dict, n_runs)
+    job_metrics.record(intervals=job_metrics.count_intervals(n_runs))
+    return gap_n_base_counts
+
+@job_metrics.instrumented
 def count_interval_size(job, interval_list_dict):
-    # print("++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++ interval_list_dict:", interval_list_dict)
-    # print("++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++ typeinterval_list_dict:", type(interval_list_dict))
-    # print("++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++ leninterval_list_dict:", len(interval_list_dict))
-    unmapped_seq_len = int()
-    for i in interval_list_dict.values():
-        unmapped_seq_len += sum([int(j[1])-int(j[0]) for j in i])
-    # print("++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++ unmapped-seq len:", unmapped_seq_len)
-    return unmapped_seq_len
-
-def calculate_bases_unmapped(job, liftover_bed_files, contig_lengths, minimum_size_gap):
+    return interval_kernels.count_interval_size(interval_list_dict)
+
+def get_multiplicity_options(export_multicopy=False):
+    """
+    export_multicopy: if True, the regions of the target covered at least twice are also
+        saved as a bed.
+    """
+    options = SimpleNamespace()
+    options.export_multicopy = export_multicopy
+    return options
+
+def write_multicopy_bed(out_bed, multicopy_coords, contig_names=None):
+    with open(out_bed, "w") as outf:
+        for contig_id, coords in multicopy_coords.items():
+            contig_name = contig_id if contig_names is None else contig_names[contig_id]
+            outf.writelines(contig_name + "\t" + str(start) + "\t" + str(stop) + "\n" for start, stop in coords)
+
+@job_metrics.instrumented
+def get_target_multiplicity(job, mapping_coverage_points, length_table, asm, multiplicity_options):
+    """
+    asm is the target.
+
+    Returns dict with:
+        "multiplicity": the output of interval_kernels.get_multiplicity.
+        "multicopy_bed": if multiplicity_options.export_multicopy, a bed of the regions of
+            the target covered at least twice.
+    """
+    contig_table = contig_length_table.load_contig_table(job, length_table, asm)
+    multicopy_coords = dict() if multiplicity_options.export_multicopy else None
+    multiplicity = interval_kernels.get_multiplicity(mapping_coverage_points, contig_table.lengths, multicopy_coords)
+    multicopy_bed = None
+    if multicopy_coords is not None:
+        out_bed = job.fileStore.getLocalTempFile()
+        write_multicopy_bed(out_bed, multicopy_coords, contig_table.names)
+        job_metrics.record(output_bytes=job_metrics.get_file_size(out_bed), intervals=job_metrics.count_intervals(multicopy_coords))
+        multicopy_bed = job.fileStore.writeGlobalFile(out_bed)
+    return {"multiplicity": multiplicity, "multicopy_bed": multicopy_bed}
+
+@job_metrics.instrumented
+def calculate_bases_unmapped(job, liftover_bed_files, length_table, asm, index_track=None, poor_mapping_options=None, table_options=None, liftover_coverage_points=None, multiplicity_options=None):
+    """
+    asm is the target, and length_table the file ID of the contig_length_table. Only the
+    file ID and asm are passed down; each child loads asm's contig table (see
+    contig_length_table.intern_contigs) itself, and everything in between parsing the
+    liftovers and writing the outputs is keyed by contig_number. If liftover_coverage_points (list of mapping_coverage_points already
+    parsed from the liftovers, e.g. by get_psl_coverage_points) is given, it's used in place
+    of parsing liftover_bed_files.
+
+    Returns dict with:
+        "gap_length_counts": the length distribution of the gaps (i.e. runs of bases in the
+            target of the liftovers that aren't covered by any of them), as a col.Counter of
+            key: gap length, value: number of gaps of that length. The bases unmapped for
+            any minimum_size_gap then come from interval_kernels.get_bases_unmapped, without
+            redoing the sweep.
+        "gap_n_base_counts": the N bases of the target in those gaps, as a col.Counter of
+            key: gap length, value: N bases in gaps of that length (see
+            interval_kernels.get_n_bases_unmapped).
+        "index": if index_track is given, a connectivity_index of the target's mapping
+            depths.
+        "poor_mapping_bed": if poor_mapping_options (see
+            interval_kernels.get_poor_mapping_options) is given, a bed of the poor mapping
+            regions, expanded by their sequence_context and merged (see poor_mapping_regions).
+        "unmapped_table": if table_options (see result_tables.get_table_options) is given,
+            this target's part of the per-contig unmapped table.
+        "mapping_coverage_coords": the coords of the target covered by the liftovers (see
+            get_mapping_coverage_coordinates), e.g. for a source_coverage store.
+        "gaps_unmapped": the gaps between them (see get_poor_mapping_coverage_coordinates),
+            e.g. for mask_intersection.
+        "multiplicity": if multiplicity_options (see get_multiplicity_options) is given, the
+            bases of the target covered 0, 1, 2 and >= 3 times (see
+            interval_kernels.get_multiplicity), from the same depth sweep as get_mapping_depths.
+        "multicopy_bed": if multiplicity_options.export_multicopy, a bed of the regions of
+            the target covered at least twice.
+    """
     print("in_fxn_start")
     #todo: remove debug: #note to self: looks reasonable
     # print("calculate_bases_ummapped-before_print_contig_lengths")
@@ -200,8 +212,11 @@ def calculate_bases_unmapped(job, liftover_bed_files, contig_lengths, minimum_si
     leader = job.addChildJobFn(empty)
     
     mapping_coverage_points = list()
-    for bedfile in liftover_bed_files:
-        mapping_coverage_points.append(leader.addChildJobFn(get_mapping_coverage_points, bedfile).rv())
+    if liftover_coverage_points is not None:
+        mapping_coverage_points = list(liftover_coverage_points)
+    else:
+        for bedfile in liftover_bed_files:
+            mapping_coverage_points.append(leader.addChildJobFn(get_mapping_coverage_points, bedfile, length_table, asm).rv())
     coverage_points_jobs = leader.encapsulate()
 
     #todo: delete debug: #note to self: reasonable output.
@@ -210,31 +225,57 @@ def calculate_bases_unmapped(job, liftover_bed_files, contig_lengths, minimum_si
     merged_mapping_coverage_points = coverage_points_jobs.addChildJobFn(merge_mapping_coverage_points, mapping_coverage_points).rv()
     merging_jobs = coverage_points_jobs.encapsulate()
 
+    index_file = None
+    if index_track is not None:
+        index_file = merging_jobs.addChildJobFn(write_connectivity_index, merged_mapping_coverage_points, length_table, asm, index_track).rv()
+    multiplicity = None
+    multicopy_bed = None
+    if multiplicity_options is not None:
+        multiplicity_job = merging_jobs.addChildJobFn(get_target_multiplicity, merged_mapping_coverage_points, length_table, asm, multiplicity_options)
+        multiplicity = multiplicity_job.rv("multiplicity")
+        multicopy_bed = multiplicity_job.rv("multicopy_bed")
+
+    # the print_debug jobs dump entire dicts of coordinates, so they only happen at --logDebug.
+    debugging = logger.isEnabledFor(logging.DEBUG)
+
     #todo: delete debug: #note to self: reasonable output.
-    merging_jobs.addChildJobFn(print_debug, "merge_mapping_coverage_points_incoming!", merged_mapping_coverage_points)
+    if debugging:
+        merging_jobs.addChildJobFn(print_debug, "merge_mapping_coverage_points_incoming!", merged_mapping_coverage_points)
     
     mapping_coverage_coordinates = merging_jobs.addChildJobFn(get_mapping_coverage_coordinates, merged_mapping_coverage_points).rv()
     mapping_coverage_coordinates_job = merging_jobs.encapsulate()
 
     #todo: delete debug: #note to self: reasonable output.
-    mapping_coverage_coordinates_job.addChildJobFn(print_debug, "mapping_coverage_coords_incoming!", mapping_coverage_coordinates)
+    if debugging:
+        mapping_coverage_coordinates_job.addChildJobFn(print_debug, "mapping_coverage_coords_incoming!", mapping_coverage_coordinates)
 
-    #generate a namespace for poor_mapping_coverage_coordinates, which was developed in the ref-based mapper pipeline.
-    options = SimpleNamespace()
-    options.sequence_context = 0 #The nonzero default used in ref-based pipeline (origin of get_poor_map... fxn) doesn't make sense in this context. 
-    options.minimum_size_remap = minimum_size_gap
+    poor_mapping_bed = None
+    if poor_mapping_options is not None:
+        poor_mapping_bed = mapping_coverage_coordinates_job.addChildJobFn(poor_mapping_regions.write_poor_mapping_bed, length_table, asm, mapping_coverage_coordinates, poor_mapping_options).rv()
 
-    poor_mapping_coverage_coordinates = mapping_coverage_coordinates_job.addChildJobFn(get_poor_mapping_coverage_coordinates, contig_lengths, mapping_coverage_coordinates, options).rv()
+    # every gap is kept here, however small; minimum_size_gap is applied to the gap lengths.
+    options = interval_kernels.get_poor_mapping_options(0)
+
+    poor_mapping_coverage_coordinates = mapping_coverage_coordinates_job.addChildJobFn(get_poor_mapping_coverage_coordinates, length_table, asm, mapping_coverage_coordinates, options).rv()
     poor_mapping_coverage_coordinates_job = mapping_coverage_coordinates_job.encapsulate()
 
     #todo: delete debug: #note to self: NOT REASONABLE output.
-    poor_mapping_coverage_coordinates_job.addChildJobFn(print_debug, "poor_mapping_coverage_coordinates_incoming!", poor_mapping_coverage_coordinates)
-
-    unmapped_seq_len = poor_mapping_coverage_coordinates_job.addChildJobFn(count_interval_size, poor_mapping_coverage_coordinates).rv()
+    if debugging:
+        poor_mapping_coverage_coordinates_job.addChildJobFn(print_debug, "poor_mapping_coverage_coordinates_incoming!", poor_mapping_coverage_coordinates)
+
+    gap_length_counts = poor_mapping_coverage_coordinates_job.addChildJobFn(count_gap_lengths, poor_mapping_coverage_coordinates).rv()
+    # most targets have no runs of Ns, and don't need the job. The header of the table
+    # says so, without reading the target's contigs.
+    gap_n_base_counts = col.Counter()
+    if contig_length_table.load_asm_n_bases(job, length_table)[asm]:
+        gap_n_base_counts = poor_mapping_coverage_coordinates_job.addChildJobFn(count_gap_n_bases, poor_mapping_coverage_coordinates, length_table, asm).rv()
+    unmapped_table = None
+    if table_options is not None:
+        unmapped_table = poor_mapping_coverage_coordinates_job.addChildJobFn(result_tables.write_unmapped_table, poor_mapping_coverage_coordinates, length_table, asm, table_options).rv()
     debug = poor_mapping_coverage_coordinates_job.encapsulate()
     # debug.addChildJobFn(print_debug, "print debug unmapped_seq_len from inside calc_bases_unmapped:", unmapped_seq_len)
     print("in_fxn_end")
-    return unmapped_seq_len
+    return {"gap_length_counts": gap_length_counts, "gap_n_base_counts": gap_n_base_counts, "index": index_file, "poor_mapping_bed": poor_mapping_bed, "unmapped_table": unmapped_table, "mapping_coverage_coords": mapping_coverage_coordinates, "gaps_unmapped": poor_mapping_coverage_coordinates, "multiplicity": multiplicity, "multicopy_bed": multicopy_bed}
     # print("bases in target of liftover bed that are unaligned to the source sequence (with gaps between alignments <" + str(minimum_size_gap) + " bases in size still counted as aligned):")
     # print(str(unmapped_seq_len) + " (" + str(round((unmapped_seq_len/seq_len_tot)*100, 2)) + "%)")
 
@@ -256,23 +297,27 @@ def print_debug(job, message, thing):
     print("++s++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++", thing, message)
     print("++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++type of thing:", type(thing))
 
-def calculate_all_bases_unmapped(job, liftovers, contig_lengths, minimum_size_gap):
+@job_metrics.instrumented
+def calculate_all_bases_unmapped(job, liftovers, length_table):
     """
     Given a dictionary that contains addresses of all possible pairwise combinations of
     liftovers in a cactus graph, organized like so: 
     key:(target_asm), value:<dict, with key:source_asm, value:<list of liftover_files with target_asm as target> >
 
     Determines which regions of each assembly are unmapped to any of the other assemblies.
+    length_table is the file ID of the contig_length_table of every assembly.
     """
-    # bases_unmapped has key: assembly_id value:int_of_bases_unmapped
-    bases_unmapped = dict()
+    # gap_length_counts has key: assembly_id value:col.Counter(key: gap length, value: number of gaps)
+    gap_length_counts = dict()
     for target_assembly, source_assembly_liftovers in liftovers.items():
-        bases_unmapped[target_assembly] = job.addChildJobFn(calculate_bases_unmapped, list(source_assembly_liftovers.values()), contig_lengths[target_assembly], minimum_size_gap).rv()
-    return bases_unmapped
+        gap_length_counts[target_assembly] = job.addChildJobFn(calculate_bases_unmapped, list(source_assembly_liftovers.values()), length_table, target_assembly).rv("gap_length_counts")
+    return gap_length_counts
 
 def main():
     # if I wanted to make this into a true command line tool, I'd fill out the parser.
     # Instead, I'm just going to add the bare minimum for making a workflow. 
+    from toil.common import Toil
+    from toil.job import Job
     parser = ArgumentParser()
     Job.Runner.addToilOptions(parser)
     # parser.add_argument(
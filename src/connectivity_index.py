@@ -0,0 +1,227 @@
+"""
+A persisted, memory-mapped index of the mapping depth along every contig of a target
+genome, built from the same mapping_coverage_points sweep as get_mapping_depths, so that
+arbitrary regions can be looked up later without redoing any liftovers.
+
+The depth along each contig is stored as runs: the start of each run, and the depth of the
+run (runs extend to the start of the next run, or the end of the contig). Alongside them
+are running totals (from the start of the contig) of the covered bases (depth >= 1) and of
+depth * bases, so that the depth and covered fraction of any region take two binary
+searches, no matter how big the region is.
+
+File layout (native byte order):
+    8 bytes: header length, then a json header (padded to a multiple of 8 bytes) with the
+    track name, and key: contig_id, value: [length, first_run, num_runs] for each contig.
+    Then, for all runs of all contigs, concatenated: run starts (uint64), covered bases
+    before the run (uint64), depth * bases before the run (uint64), run depths (uint32).
+
+Query from the command line with, e.g.:
+python src/connectivity_index.py hg38.ccidx chr21:5000000-6000000
+python src/connectivity_index.py hg38.ccidx --bed regions.bed --unmapped
+Regions are 0-based and half-open, as in a bed file.
+"""
+from argparse import ArgumentParser
+from array import array
+from types import SimpleNamespace
+import bisect
+import json
+import mmap
+import operator
+import os
+import sys
+
+INDEX_VERSION = 1
+
+def get_index_file(index_dir, track):
+    return os.path.join(index_dir, track + ".ccidx")
+
+def get_depth_runs(contig_coverage_points, contig_length):
+    """
+    Given the list of (point_value, start_bool) for one contig (see
+    get_mapping_coverage_points), returns (run_starts, run_depths). Neighbouring runs
+    always have different depths, and the first run starts at 0.
+    """
+    points = sorted(contig_coverage_points, key=operator.itemgetter(0, 1))
+    run_starts = [0]
+    run_depths = [0]
+    depth = 0
+    i = 0
+    while i < len(points):
+        position = points[i][0]
+        # apply every point at this position before deciding on the depth from it onwards.
+        while i < len(points) and points[i][0] == position:
+            if points[i][1]:
+                depth += 1
+            else:
+                depth -= 1
+            i += 1
+        if position >= contig_length:
+            break
+        if run_starts[-1] == position:
+            run_depths[-1] = depth
+        elif run_depths[-1] != depth:
+            run_starts.append(position)
+            run_depths.append(depth)
+    return run_starts, run_depths
+
+def write_index(index_file, mapping_coverage_points, contig_lengths, track, contig_names=None):
+    """
+    Writes the index of one target genome. mapping_coverage_points has the (merged) points
+    of every liftover onto the target; contigs without any are stored as a single run at
+    depth 0. If the contigs are keyed by contig_number, contig_names (from the target's
+    contig table) gives their names, which are what the index is queried by.
+    """
+    contigs = dict()
+    starts = array("Q")
+    covered_prefix = array("Q")
+    depth_prefix = array("Q")
+    depths = array("I")
+    for contig_id, length in contig_lengths.items():
+        run_starts, run_depths = get_depth_runs(mapping_coverage_points.get(contig_id, list()), length)
+        contigs[contig_id if contig_names is None else contig_names[contig_id]] = [length, len(starts), len(run_starts)]
+        covered = 0
+        depth_bases = 0
+        for i in range(len(run_starts)):
+            starts.append(run_starts[i])
+            covered_prefix.append(covered)
+            depth_prefix.append(depth_bases)
+            depths.append(run_depths[i])
+            run_stop = run_starts[i + 1] if i + 1 < len(run_starts) else length
+            if run_depths[i] > 0:
+                covered += run_stop - run_starts[i]
+            depth_bases += run_depths[i] * (run_stop - run_starts[i])
+
+    header = json.dumps({"version": INDEX_VERSION, "byteorder": sys.byteorder, "track": track, "num_runs": len(starts), "contigs": contigs}).encode()
+    header += b" " * (-len(header) % 8)
+    with open(index_file, "wb") as outf:
+        outf.write(len(header).to_bytes(8, "little"))
+        outf.write(header)
+        for values in (starts, covered_prefix, depth_prefix, depths):
+            values.tofile(outf)
+    return index_file
+
+def open_index(index_file):
+    """
+    Memory-maps the index, so opening it is instant however big it is, and only the pages
+    touched by queries are read. Close with close_index.
+    """
+    with open(index_file, "rb") as inf:
+        index_map = mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ)
+    header_length = int.from_bytes(index_map[:8], "little")
+    header = json.loads(index_map[8:8 + header_length])
+    if header["version"] != INDEX_VERSION or header["byteorder"] != sys.byteorder:
+        index_map.close()
+        raise ValueError(index_file + " was written by an incompatible version of connectivity_index, or on a machine with a different byte order.")
+
+    num_runs = header["num_runs"]
+    offset = 8 + header_length
+    index = SimpleNamespace(track=header["track"], contigs=header["contigs"], map=index_map)
+    index.buffer = memoryview(index_map)
+    index.starts = index.buffer[offset:offset + 8 * num_runs].cast("Q")
+    index.covered_prefix = index.buffer[offset + 8 * num_runs:offset + 16 * num_runs].cast("Q")
+    index.depth_prefix = index.buffer[offset + 16 * num_runs:offset + 24 * num_runs].cast("Q")
+    index.depths = index.buffer[offset + 24 * num_runs:offset + 28 * num_runs].cast("I")
+    return index
+
+def close_index(index):
+    for view in (index.starts, index.covered_prefix, index.depth_prefix, index.depths, index.buffer):
+        view.release()
+    index.map.close()
+
+def get_contig_runs(index, contig_id):
+    """
+    Returns (length, first_run, last_run + 1) of the contig's runs.
+    """
+    if contig_id not in index.contigs:
+        raise KeyError("contig " + contig_id + " isn't in the index for " + index.track)
+    length, first_run, num_runs = index.contigs[contig_id]
+    return length, first_run, first_run + num_runs
+
+def get_totals_before(index, first_run, end_run, position):
+    """
+    Returns (covered bases, depth * bases) from the start of the contig up to position.
+    """
+    i = bisect.bisect_right(index.starts, position, first_run, end_run) - 1
+    bases_into_run = position - index.starts[i]
+    covered = index.covered_prefix[i] + (bases_into_run if index.depths[i] > 0 else 0)
+    return covered, index.depth_prefix[i] + index.depths[i] * bases_into_run
+
+def query_depth(index, contig_id, start, stop):
+    """
+    Returns dict with the mean depth and covered fraction (bases at depth >= 1) of the
+    region, in O(log n). The region is clipped to the contig.
+    """
+    length, first_run, end_run = get_contig_runs(index, contig_id)
+    start = min(max(start, 0), length)
+    stop = min(max(stop, start), length)
+    if start == stop:
+        return {"bases": 0, "mean_depth": 0.0, "covered_fraction": 0.0}
+    covered_start, depth_start = get_totals_before(index, first_run, end_run, start)
+    covered_stop, depth_stop = get_totals_before(index, first_run, end_run, stop)
+    return {"bases": stop - start, "mean_depth": (depth_stop - depth_start) / (stop - start), "covered_fraction": (covered_stop - covered_start) / (stop - start)}
+
+def query_unmapped(index, contig_id, start, stop):
+    """
+    Returns list of (start, stop) of the unmapped (depth 0) intervals overlapping the
+    region, clipped to the region. O(log n + the number of runs in the region). The region
+    is clipped to the contig, as in query_depth.
+    """
+    length, first_run, end_run = get_contig_runs(index, contig_id)
+    start = min(max(start, 0), length)
+    stop = min(max(stop, start), length)
+    if start == stop:
+        return list()
+    unmapped = list()
+    i = max(first_run, bisect.bisect_right(index.starts, start, first_run, end_run) - 1)
+    while i < end_run and index.starts[i] < stop:
+        if index.depths[i] == 0:
+            run_stop = index.starts[i + 1] if i + 1 < end_run else length
+            unmapped.append((max(start, index.starts[i]), min(stop, run_stop)))
+        i += 1
+    return unmapped
+
+def parse_region(region):
+    """
+    "contig:start-stop" -> (contig, start, stop). Contig names may contain colons.
+    """
+    contig_id, coords = region.rsplit(":", 1)
+    start, stop = coords.replace(",", "").split("-")
+    return contig_id, int(start), int(stop)
+
+def get_bed_regions(bed_file):
+    with open(bed_file) as inf:
+        for line in inf:
+            if line.strip() and not line.startswith(("#", "track", "browser")):
+                parsed = line.split()
+                yield parsed[0], int(parsed[1]), int(parsed[2])
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument(
+        'index_file', help='A connectivity index, as saved by cactus_connectivity.py --index_dir.', type=str)
+    parser.add_argument(
+        'regions', help='Regions to look up, in contig:start-stop format (0-based, half-open, as in a bed file).', nargs='*', type=str)
+    parser.add_argument(
+        '--bed', help='A bed file of regions to look up, in addition to any given as arguments.', type=str)
+    parser.add_argument(
+        '--unmapped', help='Output the unmapped intervals overlapping each region (as bed lines, with the region in the 4th column), rather than its depth and covered fraction.', action='store_true')
+    options = parser.parse_args()
+
+    regions = [parse_region(region) for region in options.regions]
+    if options.bed:
+        regions = list(regions) + list(get_bed_regions(options.bed))
+
+    index = open_index(options.index_file)
+    if not options.unmapped:
+        print("contig\tstart\tstop\tmean_depth\tcovered_fraction")
+    for contig_id, start, stop in regions:
+        if options.unmapped:
+            for unmapped_start, unmapped_stop in query_unmapped(index, contig_id, start, stop):
+                print(contig_id + "\t" + str(unmapped_start) + "\t" + str(unmapped_stop) + "\t" + contig_id + ":" + str(start) + "-" + str(stop))
+        else:
+            result = query_depth(index, contig_id, start, stop)
+            print(contig_id + "\t" + str(start) + "\t" + str(stop) + "\t" + str(result["mean_depth"]) + "\t" + str(result["covered_fraction"]))
+    close_index(index)
+
+if __name__ == "__main__":
+    main()
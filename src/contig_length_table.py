@@ -0,0 +1,271 @@
+"""
+A compact, memory-mapped table of the contig lengths of every assembly, written once to
+the job store after the fastas are read, so that jobs are given its file ID rather than a
+pickled dict of key: contig_id, value: length for every assembly they touch. For very
+fragmented assemblies those dicts are large, and were otherwise pickled into the
+description of every liftover, sweep and output job that used them. With the table, each
+job loads only the assemblies it needs, and the output jobs, which only need the total
+length of each assembly, read nothing but the header. The runs of Ns in each contig (see
+fasta_scan) are stored with the lengths, so they come from the same one pass over the
+fastas.
+
+File layout (native byte order):
+    8 bytes: header length, then a json header (padded to a multiple of 8 bytes) with
+    key: asm, value: [first_contig, num_contigs, asm_length, asm_n_bases] for each
+    assembly, in the order of the seq_file.
+    Then, for all contigs of all assemblies, concatenated in fasta order: contig lengths
+    (int64), the offset of each contig's name in the names (uint64, with one more offset
+    for the end of the last name), the index of each contig's first run of Ns in the runs
+    (uint64, with one more for the end of the last contig's), the runs of Ns as (start,
+    stop) pairs (int64), and the utf-8 names themselves.
+"""
+from src import fasta_scan
+from src import job_metrics
+
+from array import array
+from types import SimpleNamespace
+import json
+import mmap
+import sys
+
+TABLE_VERSION = 2
+
+def write_length_table(table_file, contig_lengths, n_runs=None):
+    """
+    contig_lengths is dict of key: asm, value: dict of key: contig_id, value: length of
+    contig (as from all_to_all_liftovers.read_contig_lengths). n_runs, if given, is dict of
+    key: asm, value: its runs of Ns (as from fasta_scan.scan_fasta).
+    """
+    assemblies = dict()
+    lengths = array("q")
+    name_offsets = array("Q", [0])
+    n_run_offsets = array("Q", [0])
+    n_run_coords = array("q")
+    names = bytearray()
+    for asm, asm_contig_lengths in contig_lengths.items():
+        asm_n_runs = n_runs.get(asm, dict()) if n_runs is not None else dict()
+        assemblies[asm] = [len(lengths), len(asm_contig_lengths), sum(asm_contig_lengths.values()), fasta_scan.count_n_bases(asm_n_runs)]
+        for contig_id, length in asm_contig_lengths.items():
+            lengths.append(length)
+            names += contig_id.encode()
+            name_offsets.append(len(names))
+            for start, stop in asm_n_runs.get(contig_id, ()):
+                n_run_coords.append(start)
+                n_run_coords.append(stop)
+            n_run_offsets.append(len(n_run_coords) // 2)
+
+    header = json.dumps({"version": TABLE_VERSION, "byteorder": sys.byteorder, "num_contigs": len(lengths), "num_n_runs": len(n_run_coords) // 2, "assemblies": assemblies}).encode()
+    header += b" " * (-len(header) % 8)
+    with open(table_file, "wb") as outf:
+        outf.write(len(header).to_bytes(8, "little"))
+        outf.write(header)
+        lengths.tofile(outf)
+        name_offsets.tofile(outf)
+        n_run_offsets.tofile(outf)
+        n_run_coords.tofile(outf)
+        outf.write(names)
+    return table_file
+
+def open_length_table(table_file):
+    """
+    Memory-maps the table, so only the pages of the assemblies that are looked up are ever
+    read. Close with close_length_table.
+    """
+    with open(table_file, "rb") as inf:
+        table_map = mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ)
+    header_length = int.from_bytes(table_map[:8], "little")
+    header = json.loads(table_map[8:8 + header_length])
+    if header["version"] != TABLE_VERSION or header["byteorder"] != sys.byteorder:
+        table_map.close()
+        raise ValueError(table_file + " was written by an incompatible version of contig_length_table, or on a machine with a different byte order.")
+
+    num_contigs = header["num_contigs"]
+    num_n_runs = header["num_n_runs"]
+    offset = 8 + header_length
+    table = SimpleNamespace(assemblies=header["assemblies"], map=table_map)
+    table.buffer = memoryview(table_map)
+    table.lengths = table.buffer[offset:offset + 8 * num_contigs].cast("q")
+    offset += 8 * num_contigs
+    table.name_offsets = table.buffer[offset:offset + 8 * (num_contigs + 1)].cast("Q")
+    offset += 8 * (num_contigs + 1)
+    table.n_run_offsets = table.buffer[offset:offset + 8 * (num_contigs + 1)].cast("Q")
+    offset += 8 * (num_contigs + 1)
+    table.n_run_coords = table.buffer[offset:offset + 16 * num_n_runs].cast("q")
+    table.names_start = offset + 16 * num_n_runs
+    return table
+
+def close_length_table(table):
+    # the memoryviews have to be released before the mmap can be closed.
+    for view in (table.lengths, table.name_offsets, table.n_run_offsets, table.n_run_coords, table.buffer):
+        view.release()
+    table.map.close()
+
+def get_contig_ids(table, asm):
+    """
+    Returns list of the contig names of asm, in fasta order.
+    """
+    if asm not in table.assemblies:
+        raise KeyError(asm + " isn't in the contig length table.")
+    first_contig, num_contigs = table.assemblies[asm][:2]
+    name_offsets = table.name_offsets[first_contig:first_contig + num_contigs + 1].tolist()
+    names = bytes(table.buffer[table.names_start + name_offsets[0]:table.names_start + name_offsets[-1]])
+    return [names[start - name_offsets[0]:stop - name_offsets[0]].decode() for start, stop in zip(name_offsets, name_offsets[1:])]
+
+def get_contig_lengths(table, asm):
+    """
+    Returns dict of key: contig_id, value: length of contig for asm, in fasta order, i.e.
+    the same dict as all_to_all_liftovers.read_contig_lengths gave for it.
+    """
+    contig_ids = get_contig_ids(table, asm)
+    first_contig = table.assemblies[asm][0]
+    return dict(zip(contig_ids, table.lengths[first_contig:first_contig + len(contig_ids)].tolist()))
+
+def get_n_runs(table, asm):
+    """
+    Returns dict of key: contig_id, value: list of (start, stop) of its runs of Ns, for the
+    contigs of asm that have any, i.e. the same dict as fasta_scan.scan_fasta gave for it.
+    """
+    contig_ids = get_contig_ids(table, asm)
+    first_contig = table.assemblies[asm][0]
+    n_run_offsets = table.n_run_offsets[first_contig:first_contig + len(contig_ids) + 1].tolist()
+    n_run_coords = table.n_run_coords[2 * n_run_offsets[0]:2 * n_run_offsets[-1]].tolist()
+    n_runs = dict()
+    for contig_id, start, stop in zip(contig_ids, n_run_offsets, n_run_offsets[1:]):
+        if stop > start:
+            contig_coords = n_run_coords[2 * (start - n_run_offsets[0]):2 * (stop - n_run_offsets[0])]
+            n_runs[contig_id] = list(zip(contig_coords[::2], contig_coords[1::2]))
+    return n_runs
+
+def get_asm_lengths(table):
+    """
+    Returns dict of key: asm, value: sum of the lengths of its contigs, from the header
+    alone.
+    """
+    return {asm: asm_length for asm, (_, _, asm_length, _) in table.assemblies.items()}
+
+def get_asm_n_bases(table):
+    """
+    Returns dict of key: asm, value: the bases in its runs of Ns, from the header alone.
+    """
+    return {asm: asm_n_bases for asm, (_, _, _, asm_n_bases) in table.assemblies.items()}
+
+def get_asm_sizes(table):
+    """
+    Returns dict of key: asm, value: (sum of the lengths of its contigs, number of
+    contigs), from the header alone.
+    """
+    return {asm: (asm_length, num_contigs) for asm, (_, num_contigs, asm_length, _) in table.assemblies.items()}
+
+def intern_contigs(contig_lengths, n_runs=None):
+    """
+    Given dict of key: contig_id, value: length of contig (as from get_contig_lengths), and
+    optionally the contig's runs of Ns (as from fasta_scan.scan_fasta), returns the
+    assembly's contig table, a namespace of:
+        names: list of contig names, so that names[contig_number] is the contig's name.
+        ids: dict of key: contig name, value: contig_number.
+        lengths: dict of key: contig_number, value: length of contig.
+        n_runs: dict of key: contig_number, value: list of (start, stop) of its runs of
+            Ns, for the contigs that have any.
+    The contig_numbers are dense ints, in the order of the fasta. The parsers and sweeps key
+    everything by contig_number, which is much cheaper to hash, store and send between jobs
+    than the names are for fragmented assemblies; names are only looked up again when 
+    writing outputs.
+    """
+    contig_table = SimpleNamespace()
+    contig_table.names = list(contig_lengths)
+    contig_table.ids = {contig_id: contig_number for contig_number, contig_id in enumerate(contig_table.names)}
+    contig_table.lengths = {contig_number: contig_lengths[contig_id] for contig_number, contig_id in enumerate(contig_table.names)}
+    contig_table.n_runs = dict()
+    if n_runs is not None:
+        contig_table.n_runs = {contig_table.ids[contig_id]: contig_n_runs for contig_id, contig_n_runs in n_runs.items()}
+    return contig_table
+
+def read_contig_lengths(table_file, asms):
+    """
+    Returns dict of key: asm, value: output of get_contig_lengths, for each asm in asms.
+    """
+    table = open_length_table(table_file)
+    try:
+        return {asm: get_contig_lengths(table, asm) for asm in asms}
+    finally:
+        close_length_table(table)
+
+def read_n_runs(table_file, asms):
+    """
+    Returns dict of key: asm, value: output of get_n_runs, for each asm in asms.
+    """
+    table = open_length_table(table_file)
+    try:
+        return {asm: get_n_runs(table, asm) for asm in asms}
+    finally:
+        close_length_table(table)
+
+def read_contig_table(table_file, asm):
+    """
+    Returns the contig table (see intern_contigs) of the one assembly asm.
+    """
+    table = open_length_table(table_file)
+    try:
+        return intern_contigs(get_contig_lengths(table, asm), get_n_runs(table, asm))
+    finally:
+        close_length_table(table)
+
+def read_asm_lengths(table_file):
+    table = open_length_table(table_file)
+    try:
+        return get_asm_lengths(table)
+    finally:
+        close_length_table(table)
+
+def read_asm_n_bases(table_file):
+    table = open_length_table(table_file)
+    try:
+        return get_asm_n_bases(table)
+    finally:
+        close_length_table(table)
+
+def read_asm_sizes(table_file):
+    table = open_length_table(table_file)
+    try:
+        return get_asm_sizes(table)
+    finally:
+        close_length_table(table)
+
+@job_metrics.instrumented
+def write_contig_length_table(job, contig_lengths, n_runs=None):
+    """
+    contig_lengths and n_runs are dicts of key: asm, value: the "lengths" and "n_runs" of
+    all_to_all_liftovers.get_contig_lengths. This is the only job that's given the lengths
+    as dicts; it returns the file ID of the table, which every job downstream is given
+    instead.
+    """
+    table_file = job.fileStore.getLocalTempFile()
+    write_length_table(table_file, contig_lengths, n_runs)
+    job_metrics.record(output_bytes=job_metrics.get_file_size(table_file), contigs=sum(len(asm_contig_lengths) for asm_contig_lengths in contig_lengths.values()))
+    return job.fileStore.writeGlobalFile(table_file)
+
+def load_contig_lengths(job, length_table, asm):
+    """
+    Reads the one assembly asm from the table with file ID length_table, within a job.
+    """
+    return read_contig_lengths(job.fileStore.readGlobalFile(length_table), [asm])[asm]
+
+def load_n_runs(job, length_table, asm):
+    return read_n_runs(job.fileStore.readGlobalFile(length_table), [asm])[asm]
+
+def load_contig_table(job, length_table, asm):
+    """
+    Interns the one assembly asm from the table with file ID length_table, within a job.
+    Jobs build the contig table they need themselves, so none is ever pickled into a job's
+    description.
+    """
+    return read_contig_table(job.fileStore.readGlobalFile(length_table), asm)
+
+def load_asm_lengths(job, length_table):
+    return read_asm_lengths(job.fileStore.readGlobalFile(length_table))
+
+def load_asm_n_bases(job, length_table):
+    return read_asm_n_bases(job.fileStore.readGlobalFile(length_table))
+
+def load_asm_sizes(job, length_table):
+    return read_asm_sizes(job.fileStore.readGlobalFile(length_table))
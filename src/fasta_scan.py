@@ -0,0 +1,110 @@
+"""
+Reads the contig lengths of an assembly, and the runs of Ns in each contig, in a single
+pass over its fasta.
+
+Scaffolded assemblies have runs of Ns standing in for the gaps between their contigs. No
+alignment covers them, so they'd otherwise count as bases left unmapped, which makes
+gap-rich assemblies look poorly connected. The runs found here are stored alongside the
+lengths (see contig_length_table), and the outputs report the N bases in the unmapped
+counts, and the ratios with them taken out.
+
+The fasta is read in large chunks of bytes rather than a record at a time. Each chunk's
+sequence has its line breaks (and any other whitespace) stripped with bytes.translate, and
+its Ns found with a regex over those bytes, so the work per base is done in C. Runs of Ns
+that span lines or chunks are joined into one run.
+"""
+import gzip
+import re
+
+CHUNK_SIZE = 1 << 24
+WHITESPACE = b" \t\r\n"
+N_RUN = re.compile(rb"[Nn]+")
+
+def open_fasta(assembly_file):
+    """
+    Opens a fasta for reading as bytes, gzipped or not.
+    """
+    if assembly_file.endswith(".gz"):
+        return gzip.open(assembly_file, "rb")
+    return open(assembly_file, "rb")
+
+def scan_fasta(assembly_file, chunk_size=CHUNK_SIZE):
+    """
+    Given a local fasta file, returns (contig_lengths, n_runs), where contig_lengths is
+    dict of key: contig_id, value: length of contig (in fasta order, and named by the first
+    word of each header, as with Bio.SeqIO), and n_runs is dict of key: contig_id, value:
+    list of the sorted, non-overlapping (start, stop) of its runs of Ns, for the contigs
+    that have any. Raises ValueError for a contig_id that's in the fasta twice.
+    """
+    contig_lengths = dict()
+    n_runs = dict()
+    contig_id = None
+    contig_length = 0
+    contig_n_runs = list()
+    # the header being read, if the last chunk stopped in the middle of it.
+    header = None
+    at_line_start = True
+
+    def finish_contig():
+        if contig_id is not None:
+            contig_lengths[contig_id] = contig_length
+            if contig_n_runs:
+                n_runs[contig_id] = contig_n_runs
+
+    def start_contig(header):
+        nonlocal contig_id, contig_length, contig_n_runs
+        finish_contig()
+        parsed = header.split(None, 1)
+        contig_id = parsed[0].decode() if parsed else ""
+        if contig_id in contig_lengths:
+            raise ValueError("contig " + contig_id + " is in " + assembly_file + " more than once.")
+        contig_length = 0
+        contig_n_runs = list()
+
+    with open_fasta(assembly_file) as inf:
+        while True:
+            chunk = inf.read(chunk_size)
+            if not chunk:
+                break
+            position = 0
+            while position < len(chunk):
+                if header is not None:
+                    header_stop = chunk.find(b"\n", position)
+                    if header_stop == -1:
+                        header += chunk[position:]
+                        break
+                    header += chunk[position:header_stop]
+                    start_contig(header)
+                    header = None
+                    position = header_stop + 1
+                    at_line_start = True
+                elif at_line_start and chunk[position] == ord(">"):
+                    header = bytearray()
+                    position += 1
+                else:
+                    # the sequence runs up to the next header, or the end of the chunk.
+                    sequence_stop = chunk.find(b"\n>", position)
+                    sequence_stop = len(chunk) if sequence_stop == -1 else sequence_stop + 1
+                    if contig_id is not None:
+                        sequence = chunk[position:sequence_stop].translate(None, WHITESPACE)
+                        for match in N_RUN.finditer(sequence):
+                            start = contig_length + match.start()
+                            stop = contig_length + match.end()
+                            if contig_n_runs and contig_n_runs[-1][1] == start:
+                                contig_n_runs[-1] = (contig_n_runs[-1][0], stop)
+                            else:
+                                contig_n_runs.append((start, stop))
+                        contig_length += len(sequence)
+                    at_line_start = chunk[sequence_stop - 1] == ord("\n")
+                    position = sequence_stop
+    if header is not None:
+        # a header on the last line, with no newline after it.
+        start_contig(header)
+    finish_contig()
+    return contig_lengths, n_runs
+
+def count_n_bases(n_runs):
+    """
+    The total bases in the runs of Ns of n_runs (from scan_fasta).
+    """
+    return sum(stop - start for contig_n_runs in n_runs.values() for start, stop in contig_n_runs)
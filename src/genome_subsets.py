@@ -0,0 +1,143 @@
+"""
+Restricts the liftovers to the targets and sources that matter (e.g. the connectivity
+within a clade or population, or between a panel and a few references), rather than every
+ordered pair of assemblies in the seq_file.
+
+The targets and the sources can each be restricted by an explicit list of assemblies, by a
+regex (matched against the whole name), and by a subtree of the hal's phylogeny (every
+genome under an ancestor, from the tree read once with halStats --tree). Each restriction
+that's given narrows the selection further. Only the pairs left are scheduled, and every
+pair that isn't is reported, with why.
+"""
+from types import SimpleNamespace
+import re
+import subprocess
+
+def get_subset_options(names=None, regex=None, subtree=None):
+    """
+    Generate a namespace of the restrictions on the targets (or sources). Any left as None
+    don't restrict anything.
+        names: list of assemblies.
+        regex: a regex that the whole assembly name must match.
+        subtree: an ancestor in the hal's phylogeny, so that only the genomes under it
+            are selected.
+    """
+    options = SimpleNamespace()
+    options.names = names
+    options.regex = regex
+    options.subtree = subtree
+    return options
+
+def read_hal_tree(hal_file):
+    """
+    Returns the phylogeny of the hal, in newick format, from halStats --tree.
+    """
+    return subprocess.run(["halStats", "--tree", hal_file], stdout=subprocess.PIPE, check=True, text=True).stdout.strip()
+
+def parse_newick(newick):
+    """
+    Returns dict of key: node name, value: list of the names of its children, for every
+    node of the newick tree (hal trees name every ancestor). Branch lengths are ignored.
+    """
+    tree = dict()
+    position = 0
+
+    def parse_node():
+        nonlocal position
+        children = list()
+        if newick[position] == "(":
+            position += 1
+            children.append(parse_node())
+            while newick[position] == ",":
+                position += 1
+                children.append(parse_node())
+            if newick[position] != ")":
+                raise ValueError("malformed newick tree, at position " + str(position) + ": " + newick)
+            position += 1
+        name_start = position
+        while position < len(newick) and newick[position] not in ":,();":
+            position += 1
+        name = newick[name_start:position].strip()
+        if position < len(newick) and newick[position] == ":":
+            while position < len(newick) and newick[position] not in ",();":
+                position += 1
+        tree[name] = children
+        return name
+
+    parse_node()
+    return tree
+
+def get_subtree_genomes(tree, root):
+    """
+    Returns set of root and every genome under it in tree (from parse_newick).
+    """
+    if root not in tree:
+        raise ValueError(root + " isn't in the hal's tree. Its genomes are: " + ", ".join(name for name in tree if name))
+    genomes = set()
+    stack = [root]
+    while stack:
+        genome = stack.pop()
+        genomes.add(genome)
+        stack.extend(tree[genome])
+    return genomes
+
+def select_genomes(genomes, subset_options, tree=None):
+    """
+    Returns list of the genomes (in their order) that pass every restriction in
+    subset_options (from get_subset_options). tree (from parse_newick) is needed if
+    subset_options.subtree is given. Raises ValueError for names that aren't in genomes.
+    """
+    selected = list(genomes)
+    if subset_options.names is not None:
+        unknown = [name for name in subset_options.names if name not in genomes]
+        if unknown:
+            raise ValueError("these assemblies aren't in the seq_file: " + ", ".join(unknown))
+        selected = [genome for genome in selected if genome in subset_options.names]
+    if subset_options.regex is not None:
+        pattern = re.compile(subset_options.regex)
+        selected = [genome for genome in selected if pattern.fullmatch(genome)]
+    if subset_options.subtree is not None:
+        subtree_genomes = get_subtree_genomes(tree, subset_options.subtree)
+        selected = [genome for genome in selected if genome in subtree_genomes]
+    return selected
+
+def get_pair_selection(genomes, target_options, source_options, ref_id=None, tree=None):
+    """
+    Returns a namespace of:
+        targets: list of the targets selected (just ref_id, if it's given).
+        sources: list of the sources selected.
+        pairs: list of (source_asm, target_asm) for every liftover to run.
+        pruned: list of (source_asm, target_asm, reason) for every other ordered pair of
+            genomes, including each genome with itself.
+    """
+    selection = SimpleNamespace()
+    if ref_id is not None:
+        selection.targets = [ref_id]
+    else:
+        selection.targets = select_genomes(genomes, target_options, tree)
+    selection.sources = select_genomes(genomes, source_options, tree)
+    selection.pairs = [(source_asm, target_asm) for target_asm in selection.targets for source_asm in selection.sources if source_asm != target_asm]
+
+    targets = set(selection.targets)
+    sources = set(selection.sources)
+    selection.pruned = list()
+    for target_asm in genomes:
+        for source_asm in genomes:
+            if source_asm == target_asm:
+                reason = "source and target are the same assembly"
+            elif target_asm not in targets and source_asm not in sources:
+                reason = "neither the target nor the source is selected"
+            elif target_asm not in targets:
+                reason = "the target isn't selected"
+            elif source_asm not in sources:
+                reason = "the source isn't selected"
+            else:
+                continue
+            selection.pruned.append((source_asm, target_asm, reason))
+    return selection
+
+def write_pruned_pairs(output, pruned):
+    with open(output, "w") as outf:
+        outf.write("source\ttarget\treason\n")
+        for source_asm, target_asm, reason in pruned:
+            outf.write(source_asm + "\t" + target_asm + "\t" + reason + "\n")
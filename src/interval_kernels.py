@@ -0,0 +1,398 @@
+"""
+The job-free core of cactus-connectivity: the parsers, interval sweeps and depth histograms
+that calculate_bases_unmapped and calculate_asm_mapping_depths run inside toil.
+
+Nothing in here takes a toil job or touches a fileStore. Everything works on in-memory
+dicts of points and coords, or on local paths, so it can be called from local_liftovers,
+cactus_connectivity_cli.py, the benchmarks and the jupyter drafts just as well as from the
+workflow. The toil jobs of the same names are thin adapters: they read their input from
+the fileStore, call the kernel here, and record job_metrics.
+
+The formats shared by every kernel:
+    mapping_coverage_points: key: contig_id, value: list of (point_value, start_bool), the
+        start (start_bool True) and stop (False) of every interval of one or more liftovers.
+    coords: key: contig_id, value: list of (start, stop), sorted and non-overlapping.
+    contig_lengths: key: contig_id, value: len(contig).
+contig_id is the contig's name, or its contig_number if the parser was given the contig
+ids of a contig table (see contig_length_table.intern_contigs).
+"""
+from src import connectivity_index
+
+from types import SimpleNamespace
+import bisect
+import collections as col
+import operator
+
+# the multiplicity of a target is reported as the bases covered 0, 1, 2 and >= 3 times.
+MULTIPLICITY_LEVELS = 4
+
+def parse_mapping_coverage_points(bed_lines, mapping_coverage_points=None, contig_ids=None):
+    """
+    Adds the start and stop points of every line in bed_lines to mapping_coverage_points,
+    and returns it.
+
+    bed_lines can be any iterable of bed lines, so an open file works just as well as a
+    batch of lines streamed from halLiftover. If mapping_coverage_points is given, points
+    are accumulated into it, so a liftover can be parsed a chunk at a time. If contig_ids
+    is given, contigs are keyed by contig_ids[contig name].
+    """
+    if mapping_coverage_points is None:
+        mapping_coverage_points = col.defaultdict(list)
+
+    # halLiftover's output comes in runs of lines on the same contig, so the contig's name is
+    # only looked up when it changes.
+    contig_name = None
+    for line in bed_lines:
+        # parse line in map_file:
+        parsed = line.split("\t")
+
+        if parsed[0] != contig_name:
+            contig_name = parsed[0]
+            contig_points = mapping_coverage_points[contig_name if contig_ids is None else contig_ids[contig_name]]
+        start = int(parsed[1])
+        stop = int(parsed[2])
+
+        # add these coordinates to mapping_coverage_points
+        contig_points.append((start, True))
+        contig_points.append((stop, False))
+    return mapping_coverage_points
+
+def read_mapping_coverage_points(bed_file, mapping_coverage_points=None, contig_ids=None):
+    """
+    parse_mapping_coverage_points, for a bed at a local path.
+    """
+    with open(bed_file) as inf:
+        return parse_mapping_coverage_points(inf, mapping_coverage_points, contig_ids)
+
+def parse_psl_coverage_points(psl_lines, target_mapping_coverage_points=None, source_mapping_coverage_points=None, target_contig_ids=None, source_contig_ids=None):
+    """
+    The psl equivalent of parse_mapping_coverage_points. Each psl line has the coords of
+    its aligned blocks in both the source (the psl's query) and the target of the
+    liftover, so the blocks go into two accumulators at once: target_mapping_coverage_points
+    (the coverage of the target by the source, as from a bed liftover), and
+    source_mapping_coverage_points (the coverage of the source by the target, as from the
+    liftover in the other direction). Returns (target_mapping_coverage_points,
+    source_mapping_coverage_points).
+
+    Blocks on the reverse strand have psl block starts counted from the end of their
+    sequence, so they're flipped back to forward strand coords.
+    """
+    if target_mapping_coverage_points is None:
+        target_mapping_coverage_points = col.defaultdict(list)
+    if source_mapping_coverage_points is None:
+        source_mapping_coverage_points = col.defaultdict(list)
+
+    target_name = None
+    source_name = None
+    for line in psl_lines:
+        parsed = line.split("\t")
+        if len(parsed) < 21:
+            # e.g. the blank line at the end of a chunk, or a psl header.
+            continue
+        if parsed[13] != target_name:
+            target_name = parsed[13]
+            target_points = target_mapping_coverage_points[target_name if target_contig_ids is None else target_contig_ids[target_name]]
+        if parsed[9] != source_name:
+            source_name = parsed[9]
+            source_points = source_mapping_coverage_points[source_name if source_contig_ids is None else source_contig_ids[source_name]]
+
+        # the strand is the query's (i.e. source's) strand, optionally followed by the
+        # target's.
+        strand = parsed[8]
+        source_size = int(parsed[10])
+        target_size = int(parsed[14])
+        for block_size, source_start, target_start in zip(parsed[18].split(","), parsed[19].split(","), parsed[20].split(",")):
+            if not block_size:
+                continue
+            block_size = int(block_size)
+            source_start = int(source_start)
+            target_start = int(target_start)
+            if strand[0] == "-":
+                source_start = source_size - source_start - block_size
+            if len(strand) > 1 and strand[1] == "-":
+                target_start = target_size - target_start - block_size
+            target_points.append((target_start, True))
+            target_points.append((target_start + block_size, False))
+            source_points.append((source_start, True))
+            source_points.append((source_start + block_size, False))
+    return target_mapping_coverage_points, source_mapping_coverage_points
+
+def read_psl_coverage_points(psl_file, target_mapping_coverage_points=None, source_mapping_coverage_points=None, target_contig_ids=None, source_contig_ids=None):
+    """
+    parse_psl_coverage_points, for a psl at a local path.
+    """
+    with open(psl_file) as inf:
+        return parse_psl_coverage_points(inf, target_mapping_coverage_points, source_mapping_coverage_points, target_contig_ids, source_contig_ids)
+
+def merge_mapping_coverage_points(mapping_coverage_points):
+    """
+    mapping_coverage_points is a list of defaultdict(list), one for each liftover file.
+
+    This function outputs a single defaultdict(list), maintaining the keys of the input
+    dicts, but with the internal lists appended to one another.
+    """
+    merged = col.defaultdict(list)
+    for liftover_dict in mapping_coverage_points:
+        for contig_id, points in liftover_dict.items():
+            merged[contig_id].extend(points)
+    return merged
+
+def get_mapping_coverage_coordinates(mapping_coverage_points):
+    """
+    Returns all the coords (defined by tuple(start,stop)) that are covered by at least one mapping in
+    mapping_coverage_points.
+    """
+    # mapping_coverage_coords is key: contig_id, value: list of coords: [(start, stop)]
+    mapping_coverage_coords = col.defaultdict(list)
+    for contig_id in mapping_coverage_points:
+        contig_coverage_points = sorted(mapping_coverage_points[contig_id], key=operator.itemgetter(0, 1))
+        open_points = 0
+        current_region = [0, 0] # format (start, stop)
+        for i in range(len(contig_coverage_points)):
+            if open_points:
+                # then we have at least one read overlapping this region.
+                # expand the stop point of current_region
+                current_region[1] = contig_coverage_points[i][0]
+            if contig_coverage_points[i][1]:
+                # if start_bool is true, the point represents a start of mapping
+                open_points += 1
+                if open_points == 1:
+                    # that is, if we've found the starting point of a new current_region,
+                    # so we should set the start of the current_region.
+                    current_region[0] = contig_coverage_points[i][0]
+            else:
+                # if start_bool is not true, the point represents the end of a mapping.
+                open_points -= 1
+                if not open_points:
+                    # if there's no more open_points in this region, then this is the
+                    # end of the current_region. Save current_region.
+                    mapping_coverage_coords[contig_id].append(current_region.copy())
+    return mapping_coverage_coords
+
+def get_poor_mapping_options(minimum_size_gap, sequence_context=0):
+    #generate a namespace for poor_mapping_coverage_coordinates, which was developed in the ref-based mapper pipeline.
+    options = SimpleNamespace()
+    options.sequence_context = sequence_context #The nonzero default used in ref-based pipeline (origin of get_poor_map... fxn) doesn't make sense for counting bases unmapped, but does for exporting regions to remap.
+    options.minimum_size_remap = minimum_size_gap
+    return options
+
+def get_poor_mapping_coverage_coordinates(contig_lengths, mapping_coverage_coords, options):
+    """
+    mapping_coverage_coords is a dictionary of lists of coords in (start, stop) format.
+    This function returns poor mapping coords, which is essentially the gaps between
+        those coords.
+    example: mapping_coverage_coords{contig_1:[(3,5), (7, 9)]} would result in
+                mapping_coverage_coords{contig_1:[(0,3), (5,7), (9, 11)]}, if contig_1 had a
+                length of 11.
+    variables:
+        contig_lengths: A dictionary of the length of all the contigs in
+            {key: contig_id value: len(contig)} format.
+        mapping_coverage_coords: a dictionary of lists of coords in
+            {key: contig_id, value:[(start, stop)]}
+        options: from get_poor_mapping_options. sequence_context is the amount of sequence
+            to expand each of the poor_mapping_coords by, to include context sequence for
+            the poor mapping sequence, and minimum_size_remap the smallest gap kept.
+    """
+    # poor_mapping_coords has key: contig_id, value list(tuple_of_positions(start, stop))
+    poor_mapping_coords = col.defaultdict(list)
+    for contig_id in contig_lengths:
+        if contig_id in mapping_coverage_coords:
+            if mapping_coverage_coords[contig_id][0][0] > 0:
+                # if the first mapping region for the contig doesn't start at the start of
+                # the contig, the first region is between the start of the contig and the
+                # start of the good_mapping_region.
+                poor_mapping_stop = mapping_coverage_coords[contig_id][0][0] + options.sequence_context
+                if poor_mapping_stop > contig_lengths[contig_id]:
+                    poor_mapping_stop = contig_lengths[contig_id]
+                if poor_mapping_stop - 0 >= options.minimum_size_remap: # implement size threshold.
+                    poor_mapping_coords[contig_id].append((0, poor_mapping_stop))
+            for i in range(len(mapping_coverage_coords[contig_id]) - 1):
+                # for every pair of mapping coords i and i + 1,
+                # make a pair of (stop_from_ith_region, start_from_i+1th_region) to
+                # represent the poor_mapping_coords. Include sequence_context as necessary.
+                poor_mapping_start = mapping_coverage_coords[contig_id][i][1] - options.sequence_context
+                if poor_mapping_start < 0:
+                    poor_mapping_start = 0
+
+                poor_mapping_stop = mapping_coverage_coords[contig_id][i + 1][0] + options.sequence_context
+                if poor_mapping_stop > contig_lengths[contig_id]:
+                    poor_mapping_stop = contig_lengths[contig_id]
+
+                if poor_mapping_stop - poor_mapping_start >= options.minimum_size_remap: # implement size threshold.
+                    poor_mapping_coords[contig_id].append((poor_mapping_start, poor_mapping_stop))
+            if mapping_coverage_coords[contig_id][-1][1] < contig_lengths[contig_id]:
+                # if the last mapping region for the contig stops before the end of
+                # the contig, the last region is between the end of the mapping and the
+                # end of the contig.
+                poor_mapping_start = mapping_coverage_coords[contig_id][-1][1] - options.sequence_context
+                if poor_mapping_start < 0:
+                    poor_mapping_start = 0
+                if contig_lengths[contig_id] - poor_mapping_start >= options.minimum_size_remap: # implement size threshold.
+                    poor_mapping_coords[contig_id].append((poor_mapping_start, contig_lengths[contig_id]))
+        else:
+            # there isn't a good_mapping region for this contig. The full length of
+            # the contig belongs in poor_mapping_coords.
+            poor_mapping_coords[contig_id].append((0, contig_lengths[contig_id]))
+    return poor_mapping_coords
+
+def get_gaps_unmapped(mapping_coverage_coordinates, contig_lengths):
+    """
+    Every gap (i.e. run of bases of the target not covered by mapping_coverage_coordinates),
+    however small, in the same format as get_poor_mapping_coverage_coordinates. Pass them to
+    count_gap_lengths for the gap_length_counts.
+    """
+    return get_poor_mapping_coverage_coordinates(contig_lengths, mapping_coverage_coordinates, get_poor_mapping_options(0))
+
+def count_gap_lengths(interval_list_dict):
+    """
+    Returns col.Counter of key: interval length, value: number of intervals of that length.
+    Empty intervals are left out.
+    """
+    gap_length_counts = col.Counter()
+    for intervals in interval_list_dict.values():
+        for start, stop in intervals:
+            if stop > start:
+                gap_length_counts[stop - start] += 1
+    return gap_length_counts
+
+def count_interval_size(interval_list_dict):
+    """
+    The total bases in the intervals of interval_list_dict.
+    """
+    unmapped_seq_len = int()
+    for i in interval_list_dict.values():
+        unmapped_seq_len += sum([int(j[1])-int(j[0]) for j in i])
+    return unmapped_seq_len
+
+def get_bases_unmapped(gap_length_counts, minimum_size_gap=0):
+    """
+    The bases in gaps at least minimum_size_gap long (the same threshold as
+    get_poor_mapping_coverage_coordinates' minimum_size_remap).
+    """
+    return sum(length * count for length, count in gap_length_counts.items() if length >= minimum_size_gap)
+
+def get_threshold_curve(gap_length_counts, thresholds):
+    """
+    Returns list of (threshold, bases_unmapped, gaps_counted), for each minimum_size_gap in
+    thresholds. Sorts the gap lengths once, so each threshold is a single binary search.
+    """
+    lengths = sorted(gap_length_counts)
+    # suffix sums, so that bases_suffix[i] is the bases in all gaps of length >= lengths[i].
+    bases_suffix = [0] * (len(lengths) + 1)
+    gaps_suffix = [0] * (len(lengths) + 1)
+    for i in range(len(lengths) - 1, -1, -1):
+        bases_suffix[i] = bases_suffix[i + 1] + lengths[i] * gap_length_counts[lengths[i]]
+        gaps_suffix[i] = gaps_suffix[i + 1] + gap_length_counts[lengths[i]]
+    curve = list()
+    for threshold in thresholds:
+        i = bisect.bisect_left(lengths, threshold)
+        curve.append((threshold, bases_suffix[i], gaps_suffix[i]))
+    return curve
+
+def count_gap_n_bases(gaps, n_runs):
+    """
+    Given the gaps (as from get_gaps_unmapped) and the runs of Ns of the same contigs (dict
+    of key: contig_id, value: sorted list of (start, stop), as in the contig table), returns
+    col.Counter of key: gap length, value: the N bases in gaps of that length. Like
+    gap_length_counts, so minimum_size_gap can be applied afterwards, with
+    get_n_bases_unmapped. Both are sorted, so each contig is one merge of the two lists.
+    """
+    gap_n_base_counts = col.Counter()
+    for contig_id, contig_n_runs in n_runs.items():
+        i = 0
+        for start, stop in gaps.get(contig_id, ()):
+            while i < len(contig_n_runs) and contig_n_runs[i][1] <= start:
+                i += 1
+            n_bases = 0
+            j = i
+            while j < len(contig_n_runs) and contig_n_runs[j][0] < stop:
+                n_bases += min(stop, contig_n_runs[j][1]) - max(start, contig_n_runs[j][0])
+                j += 1
+            if n_bases:
+                gap_n_base_counts[stop - start] += n_bases
+    return gap_n_base_counts
+
+def get_n_bases_unmapped(gap_n_base_counts, minimum_size_gap=0):
+    """
+    The N bases in gaps at least minimum_size_gap long, i.e. the part of get_bases_unmapped
+    that's runs of Ns.
+    """
+    return sum(n_bases for length, n_bases in gap_n_base_counts.items() if length >= minimum_size_gap)
+
+def count_unmapped_n_bases(mapping_coverage_points, contig_lengths, n_runs):
+    """
+    The N bases of the target (n_runs as in count_gap_n_bases) that none of
+    mapping_coverage_points cover, i.e. those at depth 0 in get_mapping_depths. Only the
+    contigs with runs of Ns are swept.
+    """
+    n_contig_lengths = {contig_id: contig_lengths[contig_id] for contig_id in n_runs}
+    n_contig_points = {contig_id: mapping_coverage_points[contig_id] for contig_id in n_runs if contig_id in mapping_coverage_points}
+    gaps = get_gaps_unmapped(get_mapping_coverage_coordinates(n_contig_points), n_contig_lengths)
+    return get_n_bases_unmapped(count_gap_n_bases(gaps, n_runs))
+
+def get_mapping_depths(mapping_coverage_points, contig_lengths):
+    """
+    Based on get_mapping_coverage_coordinates algorithm.
+    Returns (mapping_depths, debug_1_if, debug_2_if), where mapping_depths is the number of
+    bases covered at each depth level. Contigs with no coverage points are all at depth 0.
+    """
+    # mapping_depths is key: depth_level (int); value:bases_covered_at_depth_level
+    # it measure the number of bases involved in an alignment, segregated by the number of
+    # times each base is involved in an alignment.
+    mapping_depths = col.defaultdict(int)
+    debug_1_if = int()
+    debug_2_if = int()
+
+    for contig_id in contig_lengths:
+        liftover_coverage_points = sorted(mapping_coverage_points.get(contig_id, ()), key=operator.itemgetter(0, 1))
+
+        depth_coverage = 0
+        last_base = 0 # The "previous" bases we measured ended at the beginning of the sequence. So, last_base is at 0.
+        debug_1_if = int()
+        debug_2_if = int()
+        for point in liftover_coverage_points:
+            # first, check to see if we've actually moved anywhere along the seq:
+            if point[0] == last_base:
+                if point[1]:
+                    depth_coverage += 1
+                else:
+                    depth_coverage -= 1
+                debug_1_if += 1
+            else:
+                # We've reached a point that's further along the seq.
+                mapping_depths[depth_coverage] += (point[0] - last_base)
+                if point[1]:
+                    depth_coverage += 1
+                else:
+                    depth_coverage -= 1
+                last_base = point[0]
+                debug_2_if += 1
+
+        # check to make sure that any sequence after the last coverage point is included
+        # in the mapping_depths dict at depth = 0.
+        if last_base < contig_lengths[contig_id]:
+            mapping_depths[0] += contig_lengths[contig_id] - last_base
+
+    return (mapping_depths, debug_1_if, debug_2_if)
+
+def get_multiplicity(mapping_coverage_points, contig_lengths, multicopy_coords=None):
+    """
+    Returns list of the bases of the target covered 0, 1, 2 and >= 3 times by the liftovers
+    in mapping_coverage_points (e.g. where one asm maps to several places in ref). If
+    multicopy_coords (a dict) is given, the regions covered at least twice are added to it,
+    as key: contig_id, value: list of (start, stop).
+    """
+    multiplicity = [0] * MULTIPLICITY_LEVELS
+    for contig_id, length in contig_lengths.items():
+        run_starts, run_depths = connectivity_index.get_depth_runs(mapping_coverage_points.get(contig_id, list()), length)
+        for i in range(len(run_starts)):
+            run_stop = run_starts[i + 1] if i + 1 < len(run_starts) else length
+            multiplicity[min(run_depths[i], MULTIPLICITY_LEVELS - 1)] += run_stop - run_starts[i]
+            if multicopy_coords is not None and run_depths[i] >= 2:
+                contig_multicopy_coords = multicopy_coords.setdefault(contig_id, list())
+                # neighbouring runs at depth 2 and 3 (say) make one multicopy region.
+                if contig_multicopy_coords and contig_multicopy_coords[-1][1] == run_starts[i]:
+                    contig_multicopy_coords[-1] = (contig_multicopy_coords[-1][0], run_stop)
+                else:
+                    contig_multicopy_coords.append((run_starts[i], run_stop))
+    return multiplicity
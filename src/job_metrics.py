@@ -0,0 +1,193 @@
+"""
+Structured per-job instrumentation (wall time, cpu time, peak RSS, bytes in/out, interval
+counts, halLiftover exit statuses), written to a machine-readable metrics file next to the
+output.
+
+Each instrumented job sends its metrics record back to the leader through toil's own
+logging channel (job.fileStore.logToMaster), and a MetricsCollector attached to the leader's
+logging picks the records back out. That way, no job has to change what it returns. The
+records are sent at INFO, so the collector keeps the logger they're replayed on at INFO
+whatever toil's log level is (e.g. --logWarning), and only lets through to the log what
+that level would have shown.
+"""
+from src import liftover_costs
+
+import collections as col
+import functools
+import json
+import logging
+import os
+import resource
+import subprocess
+import time
+
+METRICS_TAG = "cactus_connectivity_job_metrics:"
+
+# the records of the instrumented jobs currently running in this process. A stack, since a
+# worker runs its jobs one at a time, but instrumented functions can call each other.
+_current_records = list()
+
+def get_cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def get_peak_rss_kb():
+    """
+    Peak RSS of this process, or of its largest finished child process (e.g. halLiftover),
+    whichever is bigger. Note that toil workers can run several jobs in a row, so this is
+    the peak over the life of the worker so far, rather than just the current job.
+    """
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+def run_measured(command, **popen_kwargs):
+    """
+    Runs command (with popen_kwargs, as for subprocess.Popen) to completion, and returns
+    (returncode, peak_rss_kb), where peak_rss_kb is the peak RSS of that process alone,
+    rather than of every child the worker has run so far.
+    """
+    with subprocess.Popen(command, **popen_kwargs) as process:
+        pid, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, usage.ru_maxrss
+
+def record(**fields):
+    """
+    Adds fields (e.g. source=..., output_bytes=...) to the metrics of the instrumented job
+    that's currently running. Does nothing if called outside an instrumented job.
+    """
+    if _current_records:
+        _current_records[-1].update(fields)
+
+def add_to_record(**fields):
+    """
+    Like record, but adds each value to any existing value of that field.
+    """
+    if _current_records:
+        for field, value in fields.items():
+            _current_records[-1][field] = _current_records[-1].get(field, 0) + value
+
+def get_file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def count_intervals(interval_list_dict):
+    """
+    Given dict of key: contig_id, value: list of intervals (or points), returns total length
+    of all the lists.
+    """
+    return sum(len(intervals) for intervals in interval_list_dict.values())
+
+def instrumented(job_function):
+    """
+    Decorator for toil job functions (i.e. functions that take job as their first argument).
+    Records the job's wall time, cpu time and peak RSS, plus anything the job adds with
+    record(), and sends it to the leader.
+
+    If the job isn't running under toil (e.g. job is None, as in local_liftovers, or a stub
+    job, as in the benchmarks), the function runs unchanged.
+    """
+    @functools.wraps(job_function)
+    def wrapper(job, *args, **kwargs):
+        if job is None or not hasattr(job.fileStore, "logToMaster"):
+            return job_function(job, *args, **kwargs)
+        metrics = {"stage": job_function.__name__}
+        _current_records.append(metrics)
+        wall_start = time.time()
+        cpu_start = get_cpu_seconds()
+        try:
+            return job_function(job, *args, **kwargs)
+        finally:
+            _current_records.pop()
+            metrics["wall_seconds"] = time.time() - wall_start
+            metrics["cpu_seconds"] = get_cpu_seconds() - cpu_start
+            metrics["peak_rss_kb"] = get_peak_rss_kb()
+            job.fileStore.logToMaster(METRICS_TAG + json.dumps(metrics), logging.INFO)
+    return wrapper
+
+# the logger on which toil's leader replays the messages jobs send with logToMaster.
+TOIL_JOB_MESSAGES_LOGGER = "toil.statsAndLogging"
+
+class MetricsCollector(logging.Filter):
+    """
+    Attach to the leader (see attach) to collect the metrics records sent by instrumented
+    jobs.
+    """
+    def __init__(self):
+        super().__init__()
+        self.records = list()
+        self.log_level = logging.INFO
+
+    def attach(self, log_level):
+        """
+        log_level is toil's log level (e.g. "WARNING", as from --logWarning). If it's above
+        INFO, the records would be dropped before any handler saw them, so the logger of the
+        jobs' messages is lowered to INFO, and this filter drops whatever's below log_level
+        once it's been collected.
+        """
+        self.log_level = logging.getLevelName("CRITICAL" if log_level.upper() == "OFF" else log_level.upper())
+        if not isinstance(self.log_level, int):
+            # a level more verbose than logging knows of (e.g. toil's TRACE).
+            self.log_level = logging.NOTSET
+        job_messages_logger = logging.getLogger(TOIL_JOB_MESSAGES_LOGGER)
+        if self.log_level > logging.INFO:
+            job_messages_logger.setLevel(logging.INFO)
+        job_messages_logger.addFilter(self)
+
+    def filter(self, log_record):
+        # the filter is only on the logger of the messages passed on from jobs. When a job
+        # fails, toil also replays the job's whole log (from toil.leader), which would
+        # double count its record.
+        message = log_record.getMessage()
+        tag_position = message.find(METRICS_TAG)
+        if tag_position != -1:
+            metrics, end = json.JSONDecoder().raw_decode(message, tag_position + len(METRICS_TAG))
+            self.records.append(metrics)
+        return log_record.levelno >= self.log_level
+
+def summarize_metrics(records, num_slowest=10):
+    """
+    Returns dict with per-stage totals (slowest stage first), the num_slowest slowest
+    liftovers, any liftovers where halLiftover failed, and the predicted vs actual critical
+    path of the liftovers (see liftover_costs.get_critical_path).
+    """
+    stages = col.defaultdict(lambda: {"jobs": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "max_wall_seconds": 0.0, "max_peak_rss_kb": 0})
+    for metrics in records:
+        stage = stages[metrics["stage"]]
+        stage["jobs"] += 1
+        stage["wall_seconds"] += metrics.get("wall_seconds", 0.0)
+        stage["cpu_seconds"] += metrics.get("cpu_seconds", 0.0)
+        stage["max_wall_seconds"] = max(stage["max_wall_seconds"], metrics.get("wall_seconds", 0.0))
+        stage["max_peak_rss_kb"] = max(stage["max_peak_rss_kb"], metrics.get("peak_rss_kb", 0))
+
+    liftovers = [metrics for metrics in records if metrics["stage"] == "liftover"]
+    return {
+        "stages": dict(sorted(stages.items(), key=lambda item: -item[1]["wall_seconds"])),
+        "slowest_liftovers": sorted(liftovers, key=lambda metrics: -metrics.get("wall_seconds", 0.0))[:num_slowest],
+        "failed_liftovers": [metrics for metrics in liftovers if metrics.get("halLiftover_exit_status", 0) != 0 or "failure" in metrics],
+        "liftover_critical_path": liftover_costs.get_critical_path(liftovers)}
+
+def write_metrics(metrics_file, records):
+    summary = summarize_metrics(records)
+    with open(metrics_file, "w") as outf:
+        json.dump({"summary": summary, "jobs": records}, outf, indent=1)
+
+    print("job metrics written to", metrics_file)
+    print("slowest stages (total wall seconds):")
+    for stage, stage_metrics in list(summary["stages"].items())[:5]:
+        print("\t" + stage + "\t" + str(round(stage_metrics["wall_seconds"], 2)) + "\t(" + str(stage_metrics["jobs"]) + " jobs)")
+    if summary["slowest_liftovers"]:
+        print("slowest liftovers (wall seconds):")
+        for metrics in summary["slowest_liftovers"][:5]:
+            print("\t" + str(metrics.get("source")) + " -> " + str(metrics.get("target")) + "\t" + str(round(metrics["wall_seconds"], 2)))
+    critical_path = summary["liftover_critical_path"]
+    if critical_path is not None:
+        print("liftover critical path (wall seconds, predicted vs actual):")
+        for label in ("predicted", "actual"):
+            pair = critical_path[label]
+            print("\tlongest " + label + ":\t" + str(pair["source"]) + " -> " + str(pair["target"]) + "\t" + str(round(pair["predicted_seconds"], 2)) + "\t" + str(round(pair["actual_seconds"], 2)))
+        print("\tall liftovers:\t" + str(round(critical_path["total_predicted_seconds"], 2)) + "\t" + str(round(critical_path["total_actual_seconds"], 2)))
+    for metrics in summary["failed_liftovers"]:
+        print("WARNING: liftover " + str(metrics.get("source")) + " -> " + str(metrics.get("target")) + " failed on attempt " + str(metrics.get("attempt", 1)) + ": " + str(metrics.get("failure", "halLiftover exited with status " + str(metrics.get("halLiftover_exit_status")))))
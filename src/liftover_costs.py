@@ -0,0 +1,142 @@
+"""
+Estimates what each liftover will cost, so that the liftovers are submitted longest-first.
+
+The liftovers are all independent, so the makespan of the liftover stage is set by how
+they're packed onto the workers. Submitted in dict order, the biggest pairs can start last
+and leave the rest of the cluster idle while they finish. Submitted longest-first (the LPT
+rule), the long liftovers start right away and the short ones fill in around them. toil
+issues a job's children in the order they were added, and local_liftovers starts its
+halLiftovers in the order of its pairs, so ordering the pairs is all it takes.
+
+halLiftover's time is in walking the source's full bed through the graph, and in mapping
+it onto the target, so a pair's cost is modelled from the lengths and contig counts of both
+its source and its target. If the job metrics of an earlier run are given (see
+read_liftover_timings), the pairs it timed are predicted from their own timings, the model
+is scaled to fit the timings, and each timed liftover asks for the memory its halLiftover
+actually needed.
+
+Each liftover's predicted_seconds goes into its job metrics record, and
+job_metrics.summarize_metrics compares the predicted and actual critical paths.
+"""
+from types import SimpleNamespace
+import json
+
+# rough guesses. Only their ratio matters for the order; they're scaled to fit the timings
+# of an earlier run, when one is given.
+SECONDS_PER_BASE = 1e-6
+SECONDS_PER_CONTIG = 1e-3
+# the memory asked for, relative to the peak RSS of halLiftover in an earlier run.
+MEMORY_HEADROOM = 1.5
+
+def get_cost_options(liftover_timings=None, seconds_per_base=SECONDS_PER_BASE, seconds_per_contig=SECONDS_PER_CONTIG):
+    """
+    liftover_timings is the output of read_liftover_timings, or None to use the model alone.
+    """
+    options = SimpleNamespace()
+    options.liftover_timings = liftover_timings if liftover_timings is not None else dict()
+    options.seconds_per_base = seconds_per_base
+    options.seconds_per_contig = seconds_per_contig
+    return options
+
+def read_liftover_timings(metrics_file):
+    """
+    Given the job_metrics json of an earlier run, returns dict of key: (source_asm,
+    target_asm), value: (wall_seconds, memory) for every liftover it ran. wall_seconds is
+    summed over the retries of a pair, and memory is the bytes to ask for: halLiftover's
+    own peak RSS with MEMORY_HEADROOM, or the memory of the retry that succeeded, whichever
+    is bigger (None if neither was recorded, e.g. in --local runs).
+
+    The job's peak_rss_kb isn't used, since it's the peak over the life of the toil worker,
+    which may have run bigger jobs (e.g. another pair's liftover) before this one.
+    """
+    with open(metrics_file) as inf:
+        records = json.load(inf)["jobs"]
+    timings = dict()
+    for metrics in records:
+        if metrics["stage"] != "liftover" or "source" not in metrics:
+            continue
+        pair = (metrics["source"], metrics["target"])
+        wall_seconds, memory = timings.get(pair, (0.0, None))
+        if "halLiftover_peak_rss_kb" in metrics:
+            memory = max(memory or 0, int(metrics["halLiftover_peak_rss_kb"] * 1024 * MEMORY_HEADROOM))
+        if "failure" not in metrics and "memory" in metrics:
+            memory = max(memory or 0, metrics["memory"])
+        timings[pair] = (wall_seconds + metrics.get("wall_seconds", 0.0), memory)
+    return timings
+
+def get_model_seconds(asm_sizes, source_asm, target_asm, cost_options):
+    """
+    asm_sizes is dict of key: asm, value: (asm_length, num_contigs), as from
+    contig_length_table.get_asm_sizes.
+    """
+    source_length, source_contigs = asm_sizes[source_asm]
+    target_length, target_contigs = asm_sizes[target_asm]
+    return (source_length + target_length) * cost_options.seconds_per_base + (source_contigs + target_contigs) * cost_options.seconds_per_contig
+
+def get_liftover_costs(pairs, asm_sizes, cost_options):
+    """
+    Returns dict of key: (source_asm, target_asm), value: predicted seconds, for each pair
+    in pairs. Pairs timed in cost_options.liftover_timings are predicted from their timing,
+    and the rest from the model, scaled by the ratio of the timings to the model's
+    predictions for the timed pairs.
+    """
+    timings = cost_options.liftover_timings
+    timed_pairs = [pair for pair in timings if pair[0] in asm_sizes and pair[1] in asm_sizes]
+    timed_model_seconds = sum(get_model_seconds(asm_sizes, source_asm, target_asm, cost_options) for source_asm, target_asm in timed_pairs)
+    timed_seconds = sum(timings[pair][0] for pair in timed_pairs)
+    scale = timed_seconds / timed_model_seconds if timed_model_seconds and timed_seconds else 1.0
+
+    costs = dict()
+    for pair in pairs:
+        if pair in timings:
+            costs[pair] = timings[pair][0]
+        else:
+            costs[pair] = get_model_seconds(asm_sizes, pair[0], pair[1], cost_options) * scale
+    return costs
+
+def order_by_cost(pairs, costs):
+    """
+    Returns pairs sorted longest-first. Ties keep their order in pairs.
+    """
+    return sorted(pairs, key=lambda pair: -costs[pair])
+
+def get_resources(pair, cost_options, default_memory=None):
+    """
+    Returns the toil resource requests (e.g. memory=...) for pair's liftover job: the
+    memory it needed in the earlier run, if it was timed, or else default_memory (e.g. from
+    a halLiftover preset), or nothing extra (toil's defaults) if that's None.
+    """
+    timing = cost_options.liftover_timings.get(pair)
+    if timing is not None and timing[1] is not None:
+        return {"memory": timing[1]}
+    if default_memory is not None:
+        return {"memory": default_memory}
+    return dict()
+
+def get_critical_path(liftover_records):
+    """
+    Given the job_metrics records of the liftovers (with predicted_seconds), returns dict
+    with the liftover predicted to be the longest ("predicted") and the one that actually
+    was ("actual"), each with its predicted and actual seconds, plus the total predicted and
+    actual seconds of all the liftovers. With enough workers, the longest liftover is the
+    critical path of the liftover stage. Returns None if no liftover had a prediction.
+    """
+    pair_seconds = dict()
+    for metrics in liftover_records:
+        pair = (metrics.get("source"), metrics.get("target"))
+        predicted_seconds, actual_seconds = pair_seconds.get(pair, (None, 0.0))
+        if metrics.get("predicted_seconds") is not None:
+            predicted_seconds = metrics["predicted_seconds"]
+        # retries add up.
+        pair_seconds[pair] = (predicted_seconds, actual_seconds + metrics.get("wall_seconds", 0.0))
+    pair_seconds = {pair: seconds for pair, seconds in pair_seconds.items() if seconds[0] is not None}
+    if not pair_seconds:
+        return None
+
+    def describe(pair):
+        return {"source": pair[0], "target": pair[1], "predicted_seconds": pair_seconds[pair][0], "actual_seconds": pair_seconds[pair][1]}
+    return {
+        "predicted": describe(max(pair_seconds, key=lambda pair: pair_seconds[pair][0])),
+        "actual": describe(max(pair_seconds, key=lambda pair: pair_seconds[pair][1])),
+        "total_predicted_seconds": sum(predicted_seconds for predicted_seconds, actual_seconds in pair_seconds.values()),
+        "total_actual_seconds": sum(actual_seconds for predicted_seconds, actual_seconds in pair_seconds.values())}
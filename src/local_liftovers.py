@@ -0,0 +1,314 @@
+"""
+A lightweight alternative to running the liftovers through toil, for laptop-scale and
+single-node runs (e.g. quick QC of a freshly built graph).
+
+For small graphs, toil's job-store overhead is larger than the liftovers themselves. Here,
+the liftover matrix is run as a pool of halLiftover subprocesses (at most
+max_local_liftovers at a time), and each halLiftover's output is streamed straight into
+in-memory mapping_coverage_points, so nothing is ever written to a job store.
+"""
+from src import all_to_all_liftovers
+from src import calculate_bases_unmapped
+from src import connectivity_index
+from src import contig_length_table
+from src import fasta_scan
+from src import interval_kernels
+from src import liftover_costs
+from src import mask_intersection
+from src import paf_alignments
+from src import poor_mapping_regions
+from src import result_tables
+from src import source_coverage
+
+import asyncio
+import collections as col
+import os
+import sys
+import time
+
+# How much of halLiftover's stdout we read at a time before parsing it into the coverage
+# accumulators.
+READ_CHUNK_SIZE = 1 << 20
+
+def get_liftover_pairs(assembly_files, ref_id, sources=None, targets=None):
+    """
+    Returns list of (source_asm, target_asm) for every liftover needed. If ref_id is given,
+    that's one asm_to_ref liftover per source (as in get_bases_unmapped_to_ref). Otherwise,
+    it's every pair of a source and a target (as in all_to_all_liftovers). sources and
+    targets (see genome_subsets) default to every asm in assembly_files.
+    """
+    if sources is None:
+        sources = list(assembly_files)
+    if targets is None:
+        targets = list(assembly_files)
+    if ref_id is not None:
+        return [(asm, ref_id) for asm in sources if asm != ref_id]
+    return [(source_asm, target_asm) for target_asm in targets for source_asm in sources if source_asm != target_asm]
+
+async def feed_full_bed(stdin, contig_lengths):
+    try:
+        lines = list()
+        for line in all_to_all_liftovers.get_full_bed_lines(contig_lengths):
+            lines.append(line)
+            if len(lines) == 10000:
+                stdin.write("".join(lines).encode())
+                await stdin.drain()
+                lines = list()
+        stdin.write("".join(lines).encode())
+        await stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # halLiftover died before reading all of its input. Its return code will tell us why.
+        pass
+    finally:
+        stdin.close()
+
+async def stream_liftover(hal_file, source_asm, source_contig_lengths, target_asm, mapping_coverage_points, semaphore, export_bed=None, metrics_records=None, preview_lines=0, contig_ids=None, source_mapping_coverage_points=None, source_contig_ids=None, predicted_seconds=None, halLiftover_arguments=()):
+    """
+    Runs a single halLiftover, with the full bed of source_asm streamed into its stdin, and
+    parses its stdout into mapping_coverage_points as it arrives (keyed by contig_number,
+    if contig_ids from target_asm's contig table is given).
+
+    If source_mapping_coverage_points is given, halLiftover is run with --outPSL, and the
+    source side of each aligned block is parsed into it at the same time (keyed by
+    source_contig_ids, if given), so the one liftover gives the coverage of both asms.
+    halLiftover_arguments are passed through to halLiftover (see
+    all_to_all_liftovers.get_halLiftover_preset).
+
+    If metrics_records is given, appends a job_metrics-style record of the liftover to it,
+    with predicted_seconds (see liftover_costs). If preview_lines is nonzero, prints the first preview_lines lines of the output.
+    """
+    if source_mapping_coverage_points is not None:
+        parse_lines = lambda lines: interval_kernels.parse_psl_coverage_points(lines, mapping_coverage_points, source_mapping_coverage_points, contig_ids, source_contig_ids)
+    else:
+        parse_lines = lambda lines: interval_kernels.parse_mapping_coverage_points(lines, mapping_coverage_points, contig_ids)
+
+    async with semaphore:
+        wall_start = time.time()
+        output_bytes = int()
+        intervals = int()
+        psl_arguments = ["--outPSL"] if source_mapping_coverage_points is not None else list()
+        process = await asyncio.create_subprocess_exec("halLiftover", *psl_arguments, *halLiftover_arguments, hal_file, source_asm, "stdin", target_asm, "stdout", stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        feeder = asyncio.ensure_future(feed_full_bed(process.stdin, source_contig_lengths))
+        stderr = asyncio.ensure_future(process.stderr.read())
+
+        outf = open(export_bed, "w") if export_bed is not None else None
+        leftover = ""
+        preview = list()
+        try:
+            while True:
+                chunk = await process.stdout.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                output_bytes += len(chunk)
+                # only parse complete lines; hold on to any partial line for the next chunk.
+                lines = (leftover + chunk.decode()).split("\n")
+                leftover = lines.pop()
+                if len(preview) < preview_lines:
+                    preview.extend(lines[:preview_lines - len(preview)])
+                intervals += len(lines)
+                parse_lines(lines)
+                if outf is not None:
+                    outf.writelines(line + "\n" for line in lines)
+            if leftover:
+                intervals += 1
+                parse_lines([leftover])
+                if outf is not None:
+                    outf.write(leftover + "\n")
+        finally:
+            if outf is not None:
+                outf.close()
+
+        await feeder
+        stderr = (await stderr).decode()
+        returncode = await process.wait()
+
+    if preview:
+        print("first " + str(len(preview)) + " lines of liftover " + source_asm + " -> " + target_asm + ":\n" + "\n".join(preview), file=sys.stderr)
+
+    if metrics_records is not None:
+        metrics_records.append({"stage": "liftover", "source": source_asm, "target": target_asm, "wall_seconds": time.time() - wall_start, "halLiftover_exit_status": returncode, "output_bytes": output_bytes, "intervals": intervals, "predicted_seconds": predicted_seconds})
+    if returncode != 0:
+        raise RuntimeError("halLiftover " + source_asm + " -> " + target_asm + " failed with exit status " + str(returncode) + ". stderr:\n" + stderr)
+
+async def run_liftovers(hal_file, contig_lengths, pairs, coverage_key, max_local_liftovers, export_beds=None, metrics_records=None, preview_lines=0, contig_tables=None, source_mapping_coverage_points=None, predicted_seconds=None, halLiftover_arguments=()):
+    """
+    Runs all the liftovers in pairs, at most max_local_liftovers at a time, started in the
+    order of pairs. predicted_seconds (key: (source_asm, target_asm), value: output of
+    liftover_costs.get_liftover_costs) is only recorded in the metrics_records.
+    halLiftover_arguments are passed through to every halLiftover.
+
+    Liftovers with the same coverage_key(source_asm, target_asm) are streamed into the same
+    mapping_coverage_points. Returns dict of key: coverage_key, value: mapping_coverage_points.
+    If export_beds (key: (source_asm, target_asm), value: path) is given, each liftover's 
+    output is also written to its path as it streams by. If contig_tables (key: asm, value:
+    its contig table) is given, the points are keyed by the target's contig_numbers.
+
+    If source_mapping_coverage_points (a dict) is given, the liftovers are psls, and the
+    coverage of each source_asm by its target is also streamed into it, with key:
+    source_asm, value: mapping_coverage_points keyed by the source's contig_numbers.
+    """
+    semaphore = asyncio.Semaphore(max_local_liftovers)
+    mapping_coverage_points = col.defaultdict(lambda: col.defaultdict(list))
+    liftovers = list()
+    for source_asm, target_asm in pairs:
+        export_bed = None
+        if export_beds is not None:
+            export_bed = export_beds[(source_asm, target_asm)]
+        contig_ids = None
+        if contig_tables is not None:
+            contig_ids = contig_tables[target_asm].ids
+        source_points = None
+        source_contig_ids = None
+        if source_mapping_coverage_points is not None:
+            source_points = source_mapping_coverage_points.setdefault(source_asm, col.defaultdict(list))
+            if contig_tables is not None:
+                source_contig_ids = contig_tables[source_asm].ids
+        pair_predicted_seconds = None
+        if predicted_seconds is not None:
+            pair_predicted_seconds = predicted_seconds[(source_asm, target_asm)]
+        liftovers.append(stream_liftover(hal_file, source_asm, contig_lengths[source_asm], target_asm, mapping_coverage_points[coverage_key(source_asm, target_asm)], semaphore, export_bed, metrics_records, preview_lines, contig_ids, source_points, source_contig_ids, pair_predicted_seconds, halLiftover_arguments))
+    await asyncio.gather(*liftovers)
+    return mapping_coverage_points
+
+def write_index(index_dir, mapping_coverage_points, contig_table, track):
+    os.makedirs(index_dir, exist_ok=True)
+    connectivity_index.write_index(connectivity_index.get_index_file(index_dir, track), mapping_coverage_points, contig_table.lengths, track, contig_table.names)
+
+def write_store(store_dir, source_coverage_coords, contig_table, track):
+    os.makedirs(store_dir, exist_ok=True)
+    source_coverage.write_store(source_coverage.get_store_file(store_dir, track), source_coverage_coords, contig_table.lengths, track, contig_table.names)
+
+def write_table_part(table_dir, table, labels, rows, table_format):
+    os.makedirs(os.path.join(table_dir, table), exist_ok=True)
+    result_tables.write_table(result_tables.get_part_file(table_dir, table, labels, table_format), table, labels, rows, table_format)
+
+def run_local(assembly_files, ref_id, hal_file, options, metrics_records=None, mask_files=None, paf_files=None):
+    """
+    Toil-free equivalent of get_bases_unmapped_to_ref (if ref_id is given) or
+    get_asm_mapping_depths (if it isn't). assembly_files, hal_file and mask_files (dict
+    of key: mask name, value: bed) are local paths. If metrics_records is given, a metrics
+    record for each liftover is appended to it.
+
+    If paf_files is given, the coverage comes from those PAF alignments (see
+    paf_alignments) instead of from halLiftovers, and hal_file isn't used.
+
+    Returns (contig_lengths, results). In ref mode, results is dict with "gap_length_counts"
+    (key: asm, value: gap lengths in ref unmapped to asm), "gap_n_base_counts" (the N bases
+    of ref in those gaps), "multiplicity" (key: asm, value: the bases of ref covered 0, 1, 2
+    and >= 3 times by asm) and, with options.both_directions, "asm_gap_length_counts" and
+    "asm_gap_n_base_counts" (the same, for the gaps in asm unmapped to ref). Otherwise,
+    results is dict with "mapping_depths" and "n_bases_unmapped" (key: asm, value: the bases
+    of its runs of Ns at depth 0). Both have "asm_n_bases" (key: asm, value: the bases in its
+    runs of Ns). Everything is in the same format as the toil workflow, so the same output
+    functions apply.
+    """
+    contig_lengths = dict()
+    contig_tables = dict()
+    asm_n_bases = dict()
+    for asm, asm_file in assembly_files.items():
+        contig_lengths[asm], n_runs = fasta_scan.scan_fasta(asm_file)
+        contig_tables[asm] = contig_length_table.intern_contigs(contig_lengths[asm], n_runs)
+        asm_n_bases[asm] = fasta_scan.count_n_bases(n_runs)
+
+    pairs = get_liftover_pairs(assembly_files, ref_id, options.selected_sources, options.selected_targets)
+    # the liftovers are started longest-first, as in the toil workflow. pairs keeps its
+    # order, which is the order the sources are stored in.
+    asm_sizes = {asm: (sum(asm_contig_lengths.values()), len(asm_contig_lengths)) for asm, asm_contig_lengths in contig_lengths.items()}
+    predicted_seconds = liftover_costs.get_liftover_costs(pairs, asm_sizes, liftover_costs.get_cost_options(options.liftover_timings))
+    ordered_pairs = liftover_costs.order_by_cost(pairs, predicted_seconds)
+
+    # exported with the same names the toil workflow uses for --export_liftovers.
+    export_beds = None
+    if options.export_liftovers:
+        output_prefix = os.path.abspath(".".join(options.output.split(".")[:-1]))
+        export_beds = dict()
+        for source_asm, target_asm in pairs:
+            if ref_id is not None:
+                export_beds[(source_asm, target_asm)] = output_prefix + "_liftover_asm_" + source_asm + (".psl" if options.both_directions else ".bed")
+            else:
+                export_beds[(source_asm, target_asm)] = os.path.dirname(output_prefix) + "/" + source_asm + "_source_" + target_asm + "_target_liftover.bed"
+
+    def get_coverage_points(coverage_key, source_mapping_coverage_points=None):
+        # see run_liftovers.
+        if paf_files is not None:
+            return paf_alignments.read_paf_coverage_points(paf_files, contig_tables, pairs, coverage_key, source_mapping_coverage_points, metrics_records)
+        return asyncio.run(run_liftovers(hal_file, contig_lengths, ordered_pairs, coverage_key, options.max_local_liftovers, export_beds, metrics_records, options.liftover_preview_lines, contig_tables, source_mapping_coverage_points, predicted_seconds, options.halLiftover_arguments))
+
+    if ref_id is not None:
+        # each asm's liftover to the ref is measured on its own.
+        source_mapping_coverage_points = dict() if options.both_directions else None
+        mapping_coverage_points = get_coverage_points(lambda source_asm, target_asm: source_asm, source_mapping_coverage_points)
+        gap_length_counts = dict()
+        gap_n_base_counts = dict()
+        asm_gap_length_counts = dict()
+        asm_gap_n_base_counts = dict()
+        multiplicity = dict()
+        source_coverage_coords = dict()
+        masks = None
+        if mask_files:
+            masks = dict()
+            for name, mask_file in mask_files.items():
+                masks[name], intervals_skipped = mask_intersection.read_mask(mask_file, contig_tables[ref_id].ids)
+                if intervals_skipped:
+                    print("WARNING: " + str(intervals_skipped) + " intervals of mask " + name + " are on contigs that aren't in the ref, and were left out.", file=sys.stderr)
+            mask_totals = dict()
+        for asm in assembly_files:
+            if asm != ref_id:
+                mapping_coverage_coordinates = interval_kernels.get_mapping_coverage_coordinates(mapping_coverage_points[asm])
+                source_coverage_coords[asm] = mapping_coverage_coordinates
+                multicopy_coords = dict() if options.export_multicopy_regions else None
+                multiplicity[asm] = interval_kernels.get_multiplicity(mapping_coverage_points[asm], contig_tables[ref_id].lengths, multicopy_coords)
+                if multicopy_coords is not None:
+                    # named as in the toil workflow.
+                    calculate_bases_unmapped.write_multicopy_bed(os.path.abspath(".".join(options.output.split(".")[:-1])) + "_multicopy_regions_" + asm + ".bed", multicopy_coords, contig_tables[ref_id].names)
+                gaps_unmapped = interval_kernels.get_gaps_unmapped(mapping_coverage_coordinates, contig_tables[ref_id].lengths)
+                gap_length_counts[asm] = interval_kernels.count_gap_lengths(gaps_unmapped)
+                gap_n_base_counts[asm] = interval_kernels.count_gap_n_bases(gaps_unmapped, contig_tables[ref_id].n_runs)
+                if options.table_format is not None:
+                    write_table_part(result_tables.get_table_dir(options.output), "unmapped", {"ref": ref_id, "asm": asm}, result_tables.get_unmapped_rows(gaps_unmapped, contig_tables[ref_id].lengths, options.minimum_size_gap, contig_tables[ref_id].names), options.table_format)
+                if masks is not None:
+                    mask_rows = list(mask_intersection.get_mask_rows(gaps_unmapped, masks, contig_tables[ref_id].lengths, options.minimum_size_gap, contig_tables[ref_id].names))
+                    mask_totals[asm] = mask_intersection.get_mask_totals(mask_rows)
+                    if options.table_format is not None:
+                        write_table_part(result_tables.get_table_dir(options.output), "masks", {"ref": ref_id, "asm": asm}, mask_rows, options.table_format)
+                if options.export_poor_regions:
+                    # named as in the toil workflow.
+                    poor_mapping_prefix = os.path.abspath(".".join(options.output.split(".")[:-1])) + "_poor_regions_" + asm
+                    poor_mapping_regions.write_bed(poor_mapping_prefix + ".bed", contig_tables[ref_id].lengths, mapping_coverage_coordinates, options.sequence_context, options.minimum_size_gap, contig_tables[ref_id].names)
+                    poor_mapping_regions.write_fasta(poor_mapping_prefix + ".fa", poor_mapping_prefix + ".bed", assembly_files[ref_id])
+                if options.index_dir is not None:
+                    write_index(options.index_dir, mapping_coverage_points[asm], contig_tables[ref_id], ref_id + "_from_" + asm)
+        if options.source_coverage_dir is not None:
+            write_store(options.source_coverage_dir, source_coverage_coords, contig_tables[ref_id], ref_id)
+        if masks is not None:
+            mask_intersection.write_mask_summary(os.path.abspath(".".join(options.output.split(".")[:-1])) + "_masks.tsv", ref_id, mask_totals)
+        if options.both_directions:
+            for asm, asm_points in source_mapping_coverage_points.items():
+                asm_gaps_unmapped = interval_kernels.get_gaps_unmapped(interval_kernels.get_mapping_coverage_coordinates(asm_points), contig_tables[asm].lengths)
+                asm_gap_length_counts[asm] = interval_kernels.count_gap_lengths(asm_gaps_unmapped)
+                asm_gap_n_base_counts[asm] = interval_kernels.count_gap_n_bases(asm_gaps_unmapped, contig_tables[asm].n_runs)
+        return contig_lengths, {"gap_length_counts": gap_length_counts, "gap_n_base_counts": gap_n_base_counts, "asm_gap_length_counts": asm_gap_length_counts, "asm_gap_n_base_counts": asm_gap_n_base_counts, "multiplicity": multiplicity, "asm_n_bases": asm_n_bases}
+    else:
+        if options.source_coverage_dir is None:
+            # all liftovers onto the same target are merged.
+            mapping_coverage_points = get_coverage_points(lambda source_asm, target_asm: target_asm)
+        else:
+            # the store needs the coverage of each source on its own, so the liftovers are
+            # only merged after their coords are taken.
+            pair_coverage_points = get_coverage_points(lambda source_asm, target_asm: (source_asm, target_asm))
+            mapping_coverage_points = dict()
+            for target_asm in options.selected_targets:
+                sources = [source_asm for source_asm, pair_target_asm in pairs if pair_target_asm == target_asm]
+                source_coverage_coords = {source_asm: interval_kernels.get_mapping_coverage_coordinates(pair_coverage_points[(source_asm, target_asm)]) for source_asm in sources}
+                write_store(options.source_coverage_dir, source_coverage_coords, contig_tables[target_asm], target_asm)
+                mapping_coverage_points[target_asm] = interval_kernels.merge_mapping_coverage_points([pair_coverage_points.pop((source_asm, target_asm)) for source_asm in sources])
+        mapping_depths = dict()
+        n_bases_unmapped = dict()
+        for target_asm in options.selected_targets:
+            mapping_depths[target_asm] = interval_kernels.get_mapping_depths(mapping_coverage_points[target_asm], contig_tables[target_asm].lengths)
+            n_bases_unmapped[target_asm] = interval_kernels.count_unmapped_n_bases(mapping_coverage_points[target_asm], contig_tables[target_asm].lengths, contig_tables[target_asm].n_runs)
+            if options.table_format is not None:
+                write_table_part(result_tables.get_table_dir(options.output), "depths", {"target": target_asm}, result_tables.get_depth_rows(mapping_coverage_points[target_asm], contig_tables[target_asm].lengths, contig_tables[target_asm].names), options.table_format)
+            if options.index_dir is not None:
+                write_index(options.index_dir, mapping_coverage_points[target_asm], contig_tables[target_asm], target_asm)
+        return contig_lengths, {"mapping_depths": mapping_depths, "n_bases_unmapped": n_bases_unmapped, "asm_n_bases": asm_n_bases}
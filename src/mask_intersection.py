@@ -0,0 +1,210 @@
+"""
+Intersects the gaps left unmapped in the ref (see calculate_bases_unmapped) with external
+bed files of ref regions, e.g. dipcall confident regions, GIAB benchmark regions, or
+segdup and centromere masks, to report how much of each mask each asm leaves unmapped.
+
+All the masks are intersected with an asm's gaps in a single sweep per contig: the sorted
+interval lists of the gaps and of every mask are merged into one stream of start/stop
+events (with heapq.merge, which only ever compares the heads of the lists), and the bases
+between consecutive events are added to each mask that's open there. So the work is
+linear in the number of intervals, however many masks there are, rather than the
+len(gaps) * len(mask) of comparing every pair.
+
+For each asm, mask and ref contig, this gives:
+    mask_bases: the bases of the contig in the mask.
+    bases_mapped: the bases of the mask covered by the asm's liftover.
+    bases_unmapped: the bases of the mask in the gaps (mask minus coverage).
+    bases_mapped_outside_mask: the bases covered by the liftover, but not in the mask
+        (coverage minus mask).
+As in the main output, gaps shorter than minimum_size_gap count as mapped.
+"""
+from src import contig_length_table
+from src import job_metrics
+
+from types import SimpleNamespace
+import collections as col
+import heapq
+import logging
+import os
+
+def get_mask_options(ref_id, asm, minimum_size_gap=0, table_format=None):
+    options = SimpleNamespace()
+    options.ref_id = ref_id
+    options.asm = asm
+    options.minimum_size_gap = minimum_size_gap
+    options.table_format = table_format
+    return options
+
+def parse_mask_arguments(mask_arguments):
+    """
+    Given NAME=BED (or just BED, named after its file name up to the first '.') strings,
+    returns dict of key: mask name, value: bed file.
+    """
+    mask_files = dict()
+    for mask_argument in mask_arguments:
+        if "=" in mask_argument:
+            name, mask_file = mask_argument.split("=", 1)
+        else:
+            name, mask_file = os.path.basename(mask_argument).split(".")[0], mask_argument
+        if name in mask_files:
+            raise ValueError("two masks are named " + name + ". Name them with NAME=BED.")
+        mask_files[name] = mask_file
+    return mask_files
+
+def read_mask(mask_bed, contig_ids=None):
+    """
+    Returns dict of key: contig_id, value: sorted list of the (start, stop) coords in the
+    mask, with overlapping and touching intervals merged. If contig_ids (from the ref's
+    contig table) is given, contigs are keyed by contig_number, and intervals on contigs
+    that aren't in the ref are left out. Returns (mask_coords, intervals_skipped).
+    """
+    mask_coords = col.defaultdict(list)
+    intervals_skipped = 0
+    with open(mask_bed) as inf:
+        for line in inf:
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            parsed = line.split()
+            contig_id = parsed[0]
+            if contig_ids is not None:
+                if contig_id not in contig_ids:
+                    intervals_skipped += 1
+                    continue
+                contig_id = contig_ids[contig_id]
+            mask_coords[contig_id].append((int(parsed[1]), int(parsed[2])))
+
+    for contig_id, coords in mask_coords.items():
+        # beds are usually sorted already, in which case this sort is a single pass.
+        coords.sort()
+        merged = list()
+        for start, stop in coords:
+            if merged and start <= merged[-1][1]:
+                if stop > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], stop)
+            elif stop > start:
+                merged.append((start, stop))
+        mask_coords[contig_id] = merged
+    return mask_coords, intervals_skipped
+
+@job_metrics.instrumented
+def read_masks(job, mask_files, length_table, ref_id):
+    """
+    mask_files is dict of key: mask name, value: bed file. Returns dict of key: mask name,
+    value: output of read_mask, keyed by the contig_numbers of the ref, ref_id.
+    """
+    contig_table = contig_length_table.load_contig_table(job, length_table, ref_id)
+    masks = dict()
+    for name, mask_file in mask_files.items():
+        masks[name], intervals_skipped = read_mask(job.fileStore.readGlobalFile(mask_file), contig_table.ids)
+        if intervals_skipped:
+            job.fileStore.logToMaster("WARNING: " + str(intervals_skipped) + " intervals of mask " + name + " are on contigs that aren't in the ref, and were left out.", logging.WARNING)
+    job_metrics.record(intervals=sum(job_metrics.count_intervals(mask_coords) for mask_coords in masks.values()))
+    return masks
+
+def get_interval_events(coords, stream):
+    """
+    Yields (position, is_start, stream) for the sorted, non-overlapping coords. Stops come
+    before starts at the same position, so touching intervals don't overlap.
+    """
+    for start, stop in coords:
+        yield start, True, stream
+        yield stop, False, stream
+
+def sweep_masks(contig_gaps, contig_masks):
+    """
+    Given the sorted, non-overlapping gaps on one contig, and list of the sorted,
+    non-overlapping coords of each mask on the contig, returns (gap_bases, mask_bases,
+    bases_unmapped), where mask_bases and bases_unmapped are lists with one value per mask.
+    """
+    # the gaps are stream -1, and each mask is stream i.
+    streams = [get_interval_events(contig_gaps, -1)] + [get_interval_events(coords, i) for i, coords in enumerate(contig_masks)]
+    mask_bases = [0] * len(contig_masks)
+    bases_unmapped = [0] * len(contig_masks)
+    gap_bases = 0
+    in_gap = False
+    open_masks = set()
+    last_position = 0
+    for position, is_start, stream in heapq.merge(*streams, key=lambda event: (event[0], event[1])):
+        if position > last_position:
+            length = position - last_position
+            if in_gap:
+                gap_bases += length
+            for i in open_masks:
+                mask_bases[i] += length
+                if in_gap:
+                    bases_unmapped[i] += length
+            last_position = position
+        if stream == -1:
+            in_gap = is_start
+        elif is_start:
+            open_masks.add(stream)
+        else:
+            open_masks.discard(stream)
+    return gap_bases, mask_bases, bases_unmapped
+
+def get_mask_rows(poor_mapping_coords, masks, contig_lengths, minimum_size_gap=0, contig_names=None):
+    """
+    Given the gaps from get_poor_mapping_coverage_coordinates (with no sequence_context),
+    and masks (dict of key: mask name, value: output of read_mask), yields (mask, contig,
+    contig_length, mask_bases, bases_mapped, bases_unmapped, bases_mapped_outside_mask) for
+    every mask and contig. As in result_tables, contig_names gives the names of contigs
+    keyed by contig_number.
+    """
+    mask_names = list(masks)
+    for contig_id, length in contig_lengths.items():
+        # masks are clipped to the contig.
+        contig_masks = [[(start, min(stop, length)) for start, stop in masks[name].get(contig_id, list()) if start < length] for name in mask_names]
+        contig_gaps = [(start, stop) for start, stop in poor_mapping_coords.get(contig_id, list()) if stop > start and stop - start >= minimum_size_gap]
+        gap_bases, mask_bases, bases_unmapped = sweep_masks(contig_gaps, contig_masks)
+        for i, name in enumerate(mask_names):
+            bases_mapped = mask_bases[i] - bases_unmapped[i]
+            yield name, contig_id if contig_names is None else contig_names[contig_id], length, mask_bases[i], bases_mapped, bases_unmapped[i], length - gap_bases - bases_mapped
+
+def get_mask_totals(mask_rows):
+    """
+    Given rows from get_mask_rows, returns dict of key: mask name, value: [mask_bases,
+    bases_mapped, bases_unmapped, bases_mapped_outside_mask] over every contig.
+    """
+    mask_totals = dict()
+    for row in mask_rows:
+        totals = mask_totals.setdefault(row[0], [0, 0, 0, 0])
+        for i, value in enumerate(row[3:]):
+            totals[i] += value
+    return mask_totals
+
+@job_metrics.instrumented
+def intersect_masks(job, poor_mapping_coords, masks, length_table, mask_options):
+    """
+    Returns dict with:
+        "mask_totals": dict of key: mask name, value: [mask_bases, bases_mapped,
+            bases_unmapped, bases_mapped_outside_mask] over the whole ref.
+        "masks_table": if mask_options.table_format is given, this asm's part of the
+            per-contig masks table.
+    """
+    from src import result_tables
+
+    contig_table = contig_length_table.load_contig_table(job, length_table, mask_options.ref_id)
+    # one row per mask and contig, so these are small.
+    mask_rows = list(get_mask_rows(poor_mapping_coords, masks, contig_table.lengths, mask_options.minimum_size_gap, contig_table.names))
+    masks_table = None
+    if mask_options.table_format is not None:
+        out_file = job.fileStore.getLocalTempFile()
+        result_tables.write_table(out_file, "masks", {"ref": mask_options.ref_id, "asm": mask_options.asm}, mask_rows, mask_options.table_format)
+        masks_table = job.fileStore.writeGlobalFile(out_file)
+    job_metrics.record(intervals=job_metrics.count_intervals(poor_mapping_coords) + sum(job_metrics.count_intervals(mask_coords) for mask_coords in masks.values()))
+    return {"mask_totals": get_mask_totals(mask_rows), "masks_table": masks_table}
+
+def save_mask_summary(job, ref_id, mask_totals):
+    """
+    mask_totals is dict of key: asm, value: "mask_totals" from intersect_masks.
+    """
+    output = job.fileStore.getLocalTempFile()
+    write_mask_summary(output, ref_id, mask_totals)
+    return job.fileStore.writeGlobalFile(output)
+
+def write_mask_summary(output, ref_id, mask_totals):
+    with open(output, "w") as outf:
+        outf.write("ref\tasm\tmask\tmask_bases\tbases_mapped\tbases_unmapped\tbases_mapped_outside_mask\tbases_unmapped/mask_bases_ratio\n")
+        for asm, asm_mask_totals in mask_totals.items():
+            for name, (mask_bases, bases_mapped, bases_unmapped, bases_mapped_outside_mask) in asm_mask_totals.items():
+                outf.write(ref_id + "\t" + asm + "\t" + name + "\t" + str(mask_bases) + "\t" + str(bases_mapped) + "\t" + str(bases_unmapped) + "\t" + str(bases_mapped_outside_mask) + "\t" + str(bases_unmapped / mask_bases if mask_bases else 0) + "\n")
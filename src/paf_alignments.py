@@ -0,0 +1,150 @@
+"""
+Connectivity straight from PAF alignments (e.g. from minigraph or wfmash), without building
+a hal and lifting over through it.
+
+Each PAF line is an alignment of a query contig to a target contig, so it gives the
+coverage of both: the target covered by the query's asm, and the query covered by the
+target's asm. That's the same coverage halLiftover gives for the liftovers in both
+directions, so it's parsed into the same mapping_coverage_points, and everything after (the
+sweeps, depths, tables and indexes of interval_kernels and local_liftovers) is unchanged.
+
+With a cg:Z: cigar, only the aligned blocks (M, = and X) count as covered, as with
+halLiftover. Without one, the whole span of the alignment does, including any indels.
+
+The asm of each contig is looked up from the contig tables of the seq_file's fastas, so
+contig names must be unique across the asms (e.g. PanSN names, like HG002#1#chr1).
+"""
+from src import job_metrics
+
+from types import SimpleNamespace
+import collections as col
+import gzip
+import re
+import sys
+import time
+
+CIGAR_OPERATION = re.compile(r"(\d+)([MIDNSHP=X])")
+
+def open_paf(paf_file):
+    """
+    Opens a PAF for reading as text, gzipped or not.
+    """
+    if paf_file.endswith(".gz"):
+        return gzip.open(paf_file, "rt")
+    return open(paf_file)
+
+def get_contig_assemblies(contig_tables):
+    """
+    Returns dict of key: contig name, value: the asm it's in, for every contig of
+    contig_tables (key: asm, value: its contig table). Contig names in more than one asm
+    map to None.
+    """
+    contig_assemblies = dict()
+    for asm, contig_table in contig_tables.items():
+        for contig_name in contig_table.ids:
+            contig_assemblies[contig_name] = None if contig_name in contig_assemblies else asm
+    return contig_assemblies
+
+def get_aligned_blocks(parsed):
+    """
+    Yields (query_start, query_stop, target_start, target_stop) for each aligned block of
+    the parsed PAF line: from its cg:Z: cigar if it has one, or else the whole alignment as
+    one block, with each side's own span (they differ by the indels). Coords are on the
+    forward strand of both contigs.
+    """
+    query_start, query_stop = int(parsed[2]), int(parsed[3])
+    target_start, target_stop = int(parsed[7]), int(parsed[8])
+    reverse = parsed[4] == "-"
+    cigar = None
+    for tag in parsed[12:]:
+        if tag.startswith("cg:Z:"):
+            cigar = tag[5:]
+            break
+    if cigar is None:
+        yield query_start, query_stop, target_start, target_stop
+        return
+
+    # the cigar walks the target forwards, and the query backwards from its end if reverse.
+    query_position = query_stop if reverse else query_start
+    target_position = target_start
+    for length, operation in CIGAR_OPERATION.findall(cigar):
+        length = int(length)
+        if operation in "M=X":
+            if reverse:
+                query_position -= length
+                yield query_position, query_position + length, target_position, target_position + length
+            else:
+                yield query_position, query_position + length, target_position, target_position + length
+                query_position += length
+            target_position += length
+        elif operation == "I":
+            query_position += -length if reverse else length
+        elif operation in "DN":
+            target_position += length
+
+def read_paf_coverage_points(paf_files, contig_tables, pairs, coverage_key, source_mapping_coverage_points=None, metrics_records=None):
+    """
+    The PAF equivalent of local_liftovers.run_liftovers: takes the same pairs and
+    coverage_key, and returns the same dict of key: coverage_key(source_asm, target_asm),
+    value: mapping_coverage_points of target_asm covered by source_asm (keyed by
+    target_asm's contig_numbers). Every alignment between the asms of a pair counts, in
+    whichever direction it was aligned.
+
+    If source_mapping_coverage_points (a dict) is given, the coverage of each source_asm by
+    its target is also parsed into it, with key: source_asm, value: mapping_coverage_points
+    keyed by the source's contig_numbers (as with halLiftover --outPSL).
+
+    If metrics_records is given, appends a job_metrics-style record of the read to it.
+    Raises ValueError for an alignment on a contig name that's in more than one asm.
+    """
+    wall_start = time.time()
+    # key: (covering asm, covered asm), value: the accumulators of the covered asm's coverage.
+    wanted = col.defaultdict(list)
+    mapping_coverage_points = col.defaultdict(lambda: col.defaultdict(list))
+    for source_asm, target_asm in pairs:
+        wanted[(source_asm, target_asm)].append(SimpleNamespace(points=mapping_coverage_points[coverage_key(source_asm, target_asm)], contig_ids=contig_tables[target_asm].ids))
+        if source_mapping_coverage_points is not None:
+            source_points = source_mapping_coverage_points.setdefault(source_asm, col.defaultdict(list))
+            # the coverage of source_asm by target_asm is the reverse pair.
+            wanted[(target_asm, source_asm)].append(SimpleNamespace(points=source_points, contig_ids=contig_tables[source_asm].ids))
+
+    contig_assemblies = get_contig_assemblies(contig_tables)
+    alignments = int()
+    alignments_skipped = int()
+    for paf_file in paf_files:
+        with open_paf(paf_file) as inf:
+            for line in inf:
+                parsed = line.rstrip("\n").split("\t")
+                if len(parsed) < 12:
+                    continue
+                query_asm = contig_assemblies.get(parsed[0])
+                target_asm = contig_assemblies.get(parsed[5])
+                for contig_name, asm in ((parsed[0], query_asm), (parsed[5], target_asm)):
+                    if asm is None and contig_name in contig_assemblies:
+                        raise ValueError("contig " + contig_name + " of " + paf_file + " is in more than one asm, so its alignments can't be assigned to one.")
+                if query_asm is None or target_asm is None:
+                    alignments_skipped += 1
+                    continue
+                alignments += 1
+                # each alignment is the coverage of the target by the query, and of the
+                # query by the target.
+                sides = [(accumulator, parsed[5], True) for accumulator in wanted.get((query_asm, target_asm), ())]
+                sides += [(accumulator, parsed[0], False) for accumulator in wanted.get((target_asm, query_asm), ())]
+                if not sides:
+                    continue
+                blocks = list(get_aligned_blocks(parsed))
+                for accumulator, contig_name, covered_is_target in sides:
+                    contig_points = accumulator.points[accumulator.contig_ids[contig_name]]
+                    for query_start, query_stop, target_start, target_stop in blocks:
+                        if covered_is_target:
+                            contig_points.append((target_start, True))
+                            contig_points.append((target_stop, False))
+                        else:
+                            contig_points.append((query_start, True))
+                            contig_points.append((query_stop, False))
+
+    if alignments_skipped:
+        print("WARNING: " + str(alignments_skipped) + " PAF alignments are on contigs that aren't in any of the asms measured, and were left out.", file=sys.stderr)
+    if metrics_records is not None:
+        metrics_records.append({"stage": "paf", "wall_seconds": time.time() - wall_start, "input_bytes": sum(job_metrics.get_file_size(paf_file) for paf_file in paf_files), "alignments": alignments, "alignments_skipped": alignments_skipped})
+    return mapping_coverage_points
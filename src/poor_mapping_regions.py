@@ -0,0 +1,169 @@
+"""
+Exports the poorly-connected regions of a target (the gaps between its mapping coverage
+coordinates) as remap-ready bed and fasta files.
+
+This is the same calculation as get_poor_mapping_coverage_coordinates, with the same
+sequence_context and minimum_size_remap, but done with numpy array operations, and with the
+expanded regions merged wherever their context makes them overlap (so no base is exported
+twice).
+
+The fasta is streamed out of the assembly a region at a time, by seeking straight to each
+region with a samtools-style .fai index (read from <fasta>.fai if it's there, or built in a
+single pass over the fasta otherwise), so the assembly is never loaded into memory. That
+seeking needs an uncompressed fasta, so a gzipped one is refused (see read_fasta_index).
+"""
+from src import contig_length_table
+from src import job_metrics
+
+import os
+
+FASTA_LINE_LENGTH = 60
+GZIP_MAGIC = b"\x1f\x8b"
+
+def get_poor_mapping_regions(contig_length, contig_coverage_coords, sequence_context=0, minimum_size_remap=0):
+    """
+    Given the sorted, non-overlapping (start, stop) coords covered by a mapping on one
+    contig, returns (starts, stops) arrays of the gaps between them, each expanded by
+    sequence_context on both sides and clipped to the contig. Like
+    get_poor_mapping_coverage_coordinates, minimum_size_remap applies to the expanded gaps.
+    Gaps that overlap once expanded are merged.
+    """
+    # imported here, so that importing this module (e.g. for the cli) stays fast.
+    import numpy as np
+    coords = np.asarray(contig_coverage_coords, dtype=np.int64).reshape(-1, 2)
+    # the gaps are everything between the end of one mapping and the start of the next,
+    # plus from the start of the contig, and up to the end of the contig.
+    gap_starts = np.concatenate(([0], coords[:, 1]))
+    gap_stops = np.concatenate((coords[:, 0], [contig_length]))
+    is_gap = gap_stops > gap_starts
+    gap_starts = np.clip(gap_starts[is_gap] - sequence_context, 0, contig_length)
+    gap_stops = np.clip(gap_stops[is_gap] + sequence_context, 0, contig_length)
+
+    keep = gap_stops - gap_starts >= minimum_size_remap
+    gap_starts = gap_starts[keep]
+    gap_stops = gap_stops[keep]
+    if not len(gap_starts):
+        return gap_starts, gap_stops
+
+    # the gaps are still sorted by start (every gap was expanded by the same amount), so a
+    # new merged region begins wherever a gap starts after every earlier gap has stopped.
+    running_stops = np.maximum.accumulate(gap_stops)
+    region_firsts = np.flatnonzero(np.concatenate(([True], gap_starts[1:] > running_stops[:-1])))
+    return gap_starts[region_firsts], np.maximum.reduceat(gap_stops, region_firsts)
+
+@job_metrics.instrumented
+def write_poor_mapping_bed(job, length_table, asm, mapping_coverage_coords, options):
+    """
+    options is a namespace from get_poor_mapping_options (sequence_context and
+    minimum_size_remap). Returns the bed file of the poor mapping regions of asm.
+    """
+    contig_table = contig_length_table.load_contig_table(job, length_table, asm)
+    out_bed = job.fileStore.getLocalTempFile()
+    regions = write_bed(out_bed, contig_table.lengths, mapping_coverage_coords, options.sequence_context, options.minimum_size_remap, contig_table.names)
+    job_metrics.record(output_bytes=job_metrics.get_file_size(out_bed), intervals=regions)
+    return job.fileStore.writeGlobalFile(out_bed)
+
+def write_bed(out_bed, contig_lengths, mapping_coverage_coords, sequence_context=0, minimum_size_remap=0, contig_names=None):
+    """
+    Returns the number of regions written. If the contigs are keyed by contig_number,
+    contig_names gives their names for the bed.
+    """
+    regions = 0
+    with open(out_bed, "w") as outf:
+        for contig_id, length in contig_lengths.items():
+            starts, stops = get_poor_mapping_regions(length, mapping_coverage_coords.get(contig_id, list()), sequence_context, minimum_size_remap)
+            contig_name = contig_id if contig_names is None else contig_names[contig_id]
+            outf.writelines(contig_name + "\t" + str(start) + "\t" + str(stop) + "\n" for start, stop in zip(starts.tolist(), stops.tolist()))
+            regions += len(starts)
+    return regions
+
+@job_metrics.instrumented
+def write_poor_mapping_fasta(job, poor_mapping_bed, assembly):
+    """
+    Returns a fasta of the sequence of each region in poor_mapping_bed, taken from the
+    assembly fasta.
+    """
+    out_fasta = job.fileStore.getLocalTempFile()
+    bases = write_fasta(out_fasta, job.fileStore.readGlobalFile(poor_mapping_bed), job.fileStore.readGlobalFile(assembly))
+    job_metrics.record(output_bytes=job_metrics.get_file_size(out_fasta), bases=bases)
+    return job.fileStore.writeGlobalFile(out_fasta)
+
+def write_fasta(out_fasta, bed_file, assembly_file):
+    """
+    Writes one record per bed line, named contig_id:start-stop. Returns the number of bases
+    written.
+    """
+    fasta_index = read_fasta_index(assembly_file)
+    bases = 0
+    with open(assembly_file, "rb") as assembly, open(bed_file) as inf, open(out_fasta, "w") as outf:
+        for line in inf:
+            parsed = line.split("\t")
+            contig_id, start, stop = parsed[0], int(parsed[1]), int(parsed[2])
+            sequence = fetch_sequence(assembly, fasta_index[contig_id], start, stop)
+            outf.write(">" + contig_id + ":" + str(start) + "-" + str(stop) + "\n")
+            for i in range(0, len(sequence), FASTA_LINE_LENGTH):
+                outf.write(sequence[i:i + FASTA_LINE_LENGTH] + "\n")
+            bases += len(sequence)
+    return bases
+
+def is_gzipped(path):
+    """
+    Checks the file's first bytes rather than its name, since toil's local copies of files
+    don't keep their names.
+    """
+    with open(path, "rb") as inf:
+        return inf.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+def read_fasta_index(fasta):
+    """
+    Returns dict of key: contig_id, value: (length, offset, bases_per_line, bytes_per_line),
+    as in a samtools .fai file. Uses <fasta>.fai if it exists, and otherwise builds it in a
+    single pass over the fasta (which must then have the same line length throughout each
+    record, as samtools requires). Records with no sequence are indexed with length 0.
+
+    Raises ValueError if the fasta is gzipped (bgzipped or not), since the offsets are
+    seeked to in the uncompressed bytes.
+    """
+    if is_gzipped(fasta):
+        raise ValueError(fasta + " is gzipped, but the poorly mapped regions are seeked to in the fasta, so it needs to be uncompressed.")
+    fasta_index = dict()
+    if os.path.exists(fasta + ".fai"):
+        with open(fasta + ".fai") as inf:
+            for line in inf:
+                parsed = line.split("\t")
+                fasta_index[parsed[0]] = (int(parsed[1]), int(parsed[2]), int(parsed[3]), int(parsed[4]))
+        return fasta_index
+
+    contig_id = None
+    with open(fasta, "rb") as inf:
+        offset = 0
+        for line in inf:
+            if line.startswith(b">"):
+                contig_id = line[1:].split()[0].decode()
+                length = 0
+                sequence_offset = offset + len(line)
+                bases_per_line = None
+                # a record with no sequence lines still gets an entry, with length 0.
+                fasta_index[contig_id] = (0, sequence_offset, 0, 0)
+            elif contig_id is not None:
+                if bases_per_line is None:
+                    bases_per_line = len(line.rstrip(b"\r\n"))
+                    bytes_per_line = len(line)
+                length += len(line.rstrip(b"\r\n"))
+                fasta_index[contig_id] = (length, sequence_offset, bases_per_line, bytes_per_line)
+            offset += len(line)
+    return fasta_index
+
+def fetch_sequence(assembly, fasta_index_entry, start, stop):
+    """
+    Reads just the bytes of [start, stop) of a contig out of the open (binary) assembly
+    fasta.
+    """
+    length, offset, bases_per_line, bytes_per_line = fasta_index_entry
+    stop = min(stop, length)
+    if start >= stop:
+        return ""
+    first_byte = offset + (start // bases_per_line) * bytes_per_line + start % bases_per_line
+    last_byte = offset + ((stop - 1) // bases_per_line) * bytes_per_line + (stop - 1) % bases_per_line
+    assembly.seek(first_byte)
+    return assembly.read(last_byte - first_byte + 1).decode().replace("\n", "").replace("\r", "")
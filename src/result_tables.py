@@ -0,0 +1,176 @@
+"""
+Tidy, per-contig tables of the results, for downstream analysis: one row per target, contig
+and depth for the mapping depths, and one row per asm and ref contig for the bases unmapped
+to the ref.
+
+Each table is a directory of part files, one per target (or asm), written by the job that
+did that target's sweep as soon as it's done, so no job ever holds the results of every
+target at once. The parts are Parquet if pyarrow is installed (typed and compressed, and
+the whole directory loads as one table with e.g. pandas.read_parquet(table_dir)), and tab
+separated with a header line otherwise.
+
+Tables, with the columns in each:
+    depths: target, contig, contig_length, depth, bases
+    unmapped: ref, asm, contig, contig_length, bases_unmapped, gaps_unmapped
+        (counting only the gaps at least minimum_size_gap long, as in the main output.)
+    masks: ref, asm, mask, contig, contig_length, mask_bases, bases_mapped, bases_unmapped,
+        bases_mapped_outside_mask (see mask_intersection.)
+"""
+from src import connectivity_index
+from src import contig_length_table
+from src import job_metrics
+
+from types import SimpleNamespace
+import collections as col
+import importlib.util
+import os
+
+TABLE_FORMATS = ["auto", "parquet", "tsv", "none"]
+
+# key: table, value: list of (column, type). Label columns (e.g. target) come first.
+TABLE_COLUMNS = {
+    "depths": [("target", "string"), ("contig", "string"), ("contig_length", "int64"), ("depth", "int32"), ("bases", "int64")],
+    "unmapped": [("ref", "string"), ("asm", "string"), ("contig", "string"), ("contig_length", "int64"), ("bases_unmapped", "int64"), ("gaps_unmapped", "int64")],
+    "masks": [("ref", "string"), ("asm", "string"), ("mask", "string"), ("contig", "string"), ("contig_length", "int64"), ("mask_bases", "int64"), ("bases_mapped", "int64"), ("bases_unmapped", "int64"), ("bases_mapped_outside_mask", "int64")]}
+
+def has_pyarrow():
+    """
+    Checks for pyarrow without importing it, as importing it is slow. It's only imported
+    when a parquet table is actually read or written.
+    """
+    return importlib.util.find_spec("pyarrow") is not None
+
+def get_table_format(table_format):
+    """
+    Resolves "auto" to "parquet" if pyarrow is installed, and to "tsv" if it isn't. Returns
+    None for "none".
+    """
+    if table_format == "auto":
+        return "parquet" if has_pyarrow() else "tsv"
+    if table_format == "parquet" and not has_pyarrow():
+        raise ImportError("--table_format parquet requires pyarrow. Install it, or use --table_format tsv.")
+    if table_format == "none":
+        return None
+    return table_format
+
+def get_table_options(table_format, labels, minimum_size_gap=0):
+    """
+    labels is dict of key: label column, value: its value in every row of the part (e.g.
+    {"target": asm}).
+    """
+    options = SimpleNamespace()
+    options.table_format = table_format
+    options.labels = labels
+    options.minimum_size_gap = minimum_size_gap
+    return options
+
+def get_table_dir(output):
+    return os.path.abspath(".".join(output.split(".")[:-1])) + "_tables"
+
+def get_part_file(table_dir, table, labels, table_format):
+    """
+    Parts are named after their labels, e.g. <table_dir>/unmapped/<ref>_<asm>.parquet.
+    """
+    return os.path.join(table_dir, table, "_".join(labels.values()) + "." + table_format)
+
+def get_depth_rows(mapping_coverage_points, contig_lengths, contig_names=None):
+    """
+    Yields (contig, contig_length, depth, bases) for every depth seen on every contig.
+    Contigs without any mapping_coverage_points are all at depth 0. If the contigs are 
+    keyed by contig_number, contig_names gives their names for the contig column.
+    """
+    for contig_id, length in contig_lengths.items():
+        run_starts, run_depths = connectivity_index.get_depth_runs(mapping_coverage_points.get(contig_id, list()), length)
+        depth_bases = col.Counter()
+        for i in range(len(run_starts)):
+            run_stop = run_starts[i + 1] if i + 1 < len(run_starts) else length
+            depth_bases[run_depths[i]] += run_stop - run_starts[i]
+        for depth in sorted(depth_bases):
+            if depth_bases[depth]:
+                yield contig_id if contig_names is None else contig_names[contig_id], length, depth, depth_bases[depth]
+
+def get_unmapped_rows(poor_mapping_coords, contig_lengths, minimum_size_gap=0, contig_names=None):
+    """
+    Given the gaps from get_poor_mapping_coverage_coordinates (with no sequence_context),
+    yields (contig, contig_length, bases_unmapped, gaps_unmapped) for every contig. As in
+    get_depth_rows, contig_names gives the names of contigs keyed by contig_number.
+    """
+    for contig_id, length in contig_lengths.items():
+        bases_unmapped = 0
+        gaps_unmapped = 0
+        for start, stop in poor_mapping_coords.get(contig_id, list()):
+            if stop > start and stop - start >= minimum_size_gap:
+                bases_unmapped += stop - start
+                gaps_unmapped += 1
+        yield contig_id if contig_names is None else contig_names[contig_id], length, bases_unmapped, gaps_unmapped
+
+def write_table(out_file, table, labels, rows, table_format):
+    """
+    Writes one part of table. rows are the non-label columns. Returns the number of rows.
+    """
+    columns = TABLE_COLUMNS[table]
+    label_values = list(labels.values())
+    if table_format == "parquet":
+        import pyarrow
+        import pyarrow.parquet
+        values = [list() for column in columns[len(label_values):]]
+        for row in rows:
+            for i, value in enumerate(row):
+                values[i].append(value)
+        num_rows = len(values[0]) if values else 0
+        values = [[value] * num_rows for value in label_values] + values
+        schema = pyarrow.schema([(column, getattr(pyarrow, column_type)()) for column, column_type in columns])
+        pyarrow.parquet.write_table(pyarrow.Table.from_arrays([pyarrow.array(column_values, type=field.type) for column_values, field in zip(values, schema)], schema=schema), out_file)
+        return num_rows
+
+    num_rows = 0
+    with open(out_file, "w") as outf:
+        outf.write("\t".join(column for column, column_type in columns) + "\n")
+        prefix = "".join(value + "\t" for value in label_values)
+        for row in rows:
+            outf.write(prefix + "\t".join(str(value) for value in row) + "\n")
+            num_rows += 1
+    return num_rows
+
+def read_table(table_path):
+    """
+    Yields the rows of a table (either a single part, or a directory of parts, as
+    written by cactus_connectivity) as dicts of key: column, value: typed value.
+    """
+    part_files = [table_path]
+    if os.path.isdir(table_path):
+        part_files = sorted(os.path.join(table_path, part) for part in os.listdir(table_path) if part.endswith((".parquet", ".tsv")))
+    for part_file in part_files:
+        if part_file.endswith(".parquet"):
+            import pyarrow.parquet
+            yield from pyarrow.parquet.read_table(part_file).to_pylist()
+            continue
+        with open(part_file) as inf:
+            columns = inf.readline().rstrip("\n").split("\t")
+            column_types = dict(column for table_columns in TABLE_COLUMNS.values() for column in table_columns)
+            parsers = [int if column_types.get(column, "string").startswith("int") else str for column in columns]
+            for line in inf:
+                values = line.rstrip("\n").split("\t")
+                yield {column: parser(value) for column, parser, value in zip(columns, parsers, values)}
+
+@job_metrics.instrumented
+def write_depths_table(job, mapping_coverage_points, length_table, asm, table_options):
+    """
+    Returns the depths table's part for one target, asm.
+    """
+    contig_table = contig_length_table.load_contig_table(job, length_table, asm)
+    out_file = job.fileStore.getLocalTempFile()
+    num_rows = write_table(out_file, "depths", table_options.labels, get_depth_rows(mapping_coverage_points, contig_table.lengths, contig_table.names), table_options.table_format)
+    job_metrics.record(output_bytes=job_metrics.get_file_size(out_file), rows=num_rows)
+    return job.fileStore.writeGlobalFile(out_file)
+
+@job_metrics.instrumented
+def write_unmapped_table(job, poor_mapping_coords, length_table, asm, table_options):
+    """
+    Returns the unmapped table's part for one target, asm.
+    """
+    contig_table = contig_length_table.load_contig_table(job, length_table, asm)
+    out_file = job.fileStore.getLocalTempFile()
+    num_rows = write_table(out_file, "unmapped", table_options.labels, get_unmapped_rows(poor_mapping_coords, contig_table.lengths, table_options.minimum_size_gap, contig_table.names), table_options.table_format)
+    job_metrics.record(output_bytes=job_metrics.get_file_size(out_file), rows=num_rows)
+    return job.fileStore.writeGlobalFile(out_file)
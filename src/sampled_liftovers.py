@@ -0,0 +1,165 @@
+"""
+Approximate versions of get_bases_unmapped_to_ref and get_asm_mapping_depths, for quick QC
+of a freshly built graph.
+
+Rather than lifting over every base of every assembly, we sample windows from the assembly
+we're measuring, and lift over just those. Each sampled base is its own bed line, named
+"<window_index>:<offset>" (halLiftover carries the name column over to the output), so the
+liftover tells us exactly which sampled bases are aligned to the other assembly, and how
+many times.
+
+The windows are stratified by contig length: contigs are binned by order of magnitude of
+their length, each bin gets a share of the windows proportional to its share of the
+assembly, and within each bin a contig is picked (weighted by length) for each window.
+Estimates are the length-weighted means of the per-stratum means, and the confidence
+intervals come from bootstrapping the windows within each stratum.
+
+Note that the sampled bases are lifted from the assembly being measured to the other
+assembly, the opposite direction to the exact calculations. The bases aligned between two
+assemblies are the same either way.
+"""
+from src import contig_length_table
+from src import job_metrics
+
+import collections as col
+import math
+import random
+
+def get_length_stratum(length):
+    """
+    Contigs are stratified by order of magnitude of their length.
+    """
+    return int(math.log10(max(length, 1)))
+
+def sample_windows(contig_lengths, num_windows, window_size, seed=0):
+    """
+    Returns (windows, stratum_weights).
+        windows: list of (stratum, contig_id, start, stop). Windows on contigs shorter than
+            window_size span the whole contig.
+        stratum_weights: dict of key: stratum, value: the fraction of the assembly's bases
+            in that stratum.
+    """
+    rng = random.Random(seed)
+    strata = col.defaultdict(list)
+    for contig_id, length in contig_lengths.items():
+        if length > 0:
+            strata[get_length_stratum(length)].append((contig_id, length))
+    total_length = sum(length for contigs in strata.values() for contig_id, length in contigs)
+    stratum_weights = {stratum: sum(length for contig_id, length in contigs) / total_length for stratum, contigs in strata.items()}
+
+    # proportional allocation, by largest remainder, with at least one window per stratum
+    # (so that every stratum has an estimate).
+    quotas = {stratum: weight * num_windows for stratum, weight in stratum_weights.items()}
+    allocation = {stratum: max(1, int(quota)) for stratum, quota in quotas.items()}
+    for stratum in sorted(quotas, key=lambda stratum: int(quotas[stratum]) - quotas[stratum])[:max(0, num_windows - sum(allocation.values()))]:
+        allocation[stratum] += 1
+
+    windows = list()
+    for stratum in sorted(strata):
+        contigs = strata[stratum]
+        cumulative_lengths = list()
+        cumulative_length = 0
+        for contig_id, length in contigs:
+            cumulative_length += length
+            cumulative_lengths.append(cumulative_length)
+        for contig_id, length in rng.choices(contigs, cum_weights=cumulative_lengths, k=allocation[stratum]):
+            start = rng.randint(0, max(0, length - window_size))
+            windows.append((stratum, contig_id, start, min(length, start + window_size)))
+    return windows, stratum_weights
+
+@job_metrics.instrumented
+def write_sampled_bed(job, length_table, asm, num_windows, window_size, seed=0):
+    """
+    Used in place of write_full_bed, and likewise reads only asm from the
+    contig_length_table with file ID length_table. Returns (sampled_bed, windows,
+    stratum_weights), see sample_windows.
+    """
+    contig_lengths = contig_length_table.load_contig_lengths(job, length_table, asm)
+    windows, stratum_weights = sample_windows(contig_lengths, num_windows, window_size, seed)
+    out_bed = job.fileStore.getLocalTempFile()
+    with open(out_bed, "w") as outf:
+        for window_index, (stratum, contig_id, start, stop) in enumerate(windows):
+            for position in range(start, stop):
+                outf.write(contig_id + "\t" + str(position) + "\t" + str(position + 1) + "\t" + str(window_index) + ":" + str(position - start) + "\n")
+    job_metrics.record(output_bytes=job_metrics.get_file_size(out_bed), intervals=sum(stop - start for stratum, contig_id, start, stop in windows))
+    return job.fileStore.writeGlobalFile(out_bed), windows, stratum_weights
+
+@job_metrics.instrumented
+def count_sampled_copies(job, liftover_bed):
+    """
+    Given a liftover of a sampled bed, returns dict of key: sampled base's name, value: the
+    number of places it lifted to. Sampled bases that didn't lift over are left out.
+    """
+    copies = col.Counter()
+    with open(job.fileStore.readGlobalFile(liftover_bed)) as inf:
+        for line in inf:
+            parsed = line.split()
+            if len(parsed) > 3:
+                copies[parsed[3]] += 1
+    job_metrics.record(intervals=sum(copies.values()))
+    return copies
+
+def get_window_depths(windows, sampled_copies_list):
+    """
+    Given the windows, and a list with one count_sampled_copies output per liftover,
+    returns list (one per window) of col.Counter of key: mapping depth (i.e. the total
+    number of places the base lifted to, summed over every liftover), value: number of
+    sampled bases in the window at that depth.
+    """
+    total_copies = col.Counter()
+    for sampled_copies in sampled_copies_list:
+        total_copies.update(sampled_copies)
+
+    window_depths = list()
+    for window_index, (stratum, contig_id, start, stop) in enumerate(windows):
+        depths = col.Counter()
+        for offset in range(stop - start):
+            depths[total_copies.get(str(window_index) + ":" + str(offset), 0)] += 1
+        window_depths.append(depths)
+    return window_depths
+
+def estimate_fraction(windows, stratum_weights, window_values, num_bootstraps=1000, confidence=0.95, seed=0):
+    """
+    Estimates the fraction of the assembly's bases with some property, given window_values,
+    a list (one per window) of the number of bases in that window with the property.
+
+    Returns (estimate, ci_low, ci_high).
+    """
+    stratum_windows = col.defaultdict(list)
+    for window_index, (stratum, contig_id, start, stop) in enumerate(windows):
+        stratum_windows[stratum].append((window_values[window_index], stop - start))
+
+    def get_estimate(sampled_stratum_windows):
+        estimate = float()
+        for stratum, sampled_windows in sampled_stratum_windows.items():
+            estimate += stratum_weights[stratum] * sum(value for value, length in sampled_windows) / sum(length for value, length in sampled_windows)
+        return estimate
+
+    rng = random.Random(seed)
+    bootstraps = sorted(get_estimate({stratum: rng.choices(sampled_windows, k=len(sampled_windows)) for stratum, sampled_windows in stratum_windows.items()}) for _ in range(num_bootstraps))
+    if not bootstraps:
+        estimate = get_estimate(stratum_windows)
+        return estimate, estimate, estimate
+    tail = (1 - confidence) / 2
+    return get_estimate(stratum_windows), bootstraps[int(tail * (num_bootstraps - 1))], bootstraps[int(math.ceil((1 - tail) * (num_bootstraps - 1)))]
+
+@job_metrics.instrumented
+def estimate_unmapped_fraction(job, windows, stratum_weights, sampled_copies, num_bootstraps=1000, seed=0):
+    """
+    Returns (estimate, ci_low, ci_high) of the fraction of the sampled assembly left
+    unmapped by one liftover.
+    """
+    window_depths = get_window_depths(windows, [sampled_copies])
+    return estimate_fraction(windows, stratum_weights, [depths[0] for depths in window_depths], num_bootstraps, seed=seed)
+
+@job_metrics.instrumented
+def estimate_depth_fractions(job, windows, stratum_weights, sampled_copies_list, num_bootstraps=1000, seed=0):
+    """
+    Returns dict of key: mapping depth, value: (estimate, ci_low, ci_high) of the fraction of
+    the sampled assembly at that depth, for every depth seen in the sample.
+    """
+    window_depths = get_window_depths(windows, sampled_copies_list)
+    depths_seen = set()
+    for depths in window_depths:
+        depths_seen.update(depths)
+    return {depth: estimate_fraction(windows, stratum_weights, [depths[depth] for depths in window_depths], num_bootstraps, seed=seed) for depth in sorted(depths_seen)}
@@ -0,0 +1,297 @@
+"""
+A persisted, memory-mapped store of which sources cover each base of a target genome, so
+that questions the union and depth sweeps can't answer (e.g. which bases of the target are
+aligned only to one genome, or to none of a population) can be asked later, without
+redoing any liftovers.
+
+The sources covering each base are a bitset (bit i for the i-th source in the header),
+packed into 64-bit words. Along each contig, the bitsets are stored as runs: the start of
+each run, and the bitset of the run (runs extend to the start of the next run, or the end
+of the contig). Neighbouring runs always have different bitsets.
+
+The bitsets are built by a vectorized sweep: each source's merged coverage coords (see
+get_mapping_coverage_coordinates) toggle its bit on at every start and off at every stop, so
+the bitset along the contig is just the running xor of the toggles, in position order.
+Queries select the runs of a region with a binary search, and test all of their bitsets at
+once with numpy bit operations.
+
+File layout (native byte order):
+    8 bytes: header length, then a json header (padded to a multiple of 8 bytes) with the
+    track name, the sources, the words per bitset, and key: contig_id, value: [length,
+    first_run, num_runs] for each contig.
+    Then, for all runs of all contigs, concatenated: run starts (uint64), then run bitsets
+    (words_per_bitset uint64s each).
+
+Query from the command line with, e.g.:
+python -m src.source_coverage hg38.ccsrc --private HG002
+python -m src.source_coverage hg38.ccsrc chr21:5000000-6000000 --at_least 2 --group HG002,HG005,NA19240
+python -m src.source_coverage hg38.ccsrc --bed regions.bed --none HG002,HG005
+Regions are 0-based and half-open, as in a bed file. Without any regions, every contig is
+reported whole.
+"""
+from src import connectivity_index
+from src import contig_length_table
+from src import job_metrics
+
+from argparse import ArgumentParser
+from types import SimpleNamespace
+import json
+import mmap
+import os
+import sys
+
+STORE_VERSION = 1
+
+def get_store_options(track, sources):
+    """
+    sources are the sources of the liftovers onto the target named track, in the order
+    their liftovers are given.
+    """
+    options = SimpleNamespace()
+    options.track = track
+    options.sources = sources
+    return options
+
+def get_store_file(store_dir, track):
+    return os.path.join(store_dir, track + ".ccsrc")
+
+def get_words_per_bitset(num_sources):
+    return max(1, (num_sources + 63) // 64)
+
+def get_source_runs(np, source_coords, contig_length, words_per_bitset):
+    """
+    Given list (one per source, in bit order) of that source's sorted, non-overlapping
+    (start, stop) coords on one contig, returns (run_starts, run_bitsets) arrays. The first
+    run starts at 0.
+    """
+    positions = list()
+    sources = list()
+    for source_number, coords in enumerate(source_coords):
+        coords = np.asarray(coords, dtype=np.int64).reshape(-1, 2)
+        positions.append(coords.ravel())
+        sources.append(np.full(coords.size, source_number, dtype=np.int64))
+    positions = np.concatenate(positions) if positions else np.zeros(0, dtype=np.int64)
+    sources = np.concatenate(sources) if sources else np.zeros(0, dtype=np.int64)
+
+    keep = positions < contig_length
+    positions = positions[keep]
+    sources = sources[keep]
+    order = np.argsort(positions, kind="stable")
+    positions = positions[order]
+    sources = sources[order]
+
+    toggles = np.zeros((len(positions), words_per_bitset), dtype=np.uint64)
+    toggles[np.arange(len(positions)), sources // 64] = np.left_shift(np.uint64(1), (sources % 64).astype(np.uint64))
+    bitsets = np.bitwise_xor.accumulate(toggles, axis=0) if len(positions) else toggles
+
+    # the bitset from each position onwards is the one after its last toggle.
+    last_at_position = np.flatnonzero(np.concatenate((positions[1:] != positions[:-1], [True]))) if len(positions) else np.zeros(0, dtype=np.int64)
+    run_starts = np.concatenate(([0], positions[last_at_position])).astype(np.uint64)
+    run_bitsets = np.concatenate((np.zeros((1, words_per_bitset), dtype=np.uint64), bitsets[last_at_position]))
+    if len(run_starts) > 1 and run_starts[1] == 0:
+        run_starts = run_starts[1:]
+        run_bitsets = run_bitsets[1:]
+
+    # merge neighbouring runs with the same bitset.
+    changes = np.concatenate(([True], (run_bitsets[1:] != run_bitsets[:-1]).any(axis=1)))
+    return run_starts[changes], run_bitsets[changes]
+
+def write_store(store_file, source_coverage_coords, contig_lengths, track, contig_names=None):
+    """
+    Writes the store of one target genome. source_coverage_coords is dict of key: source,
+    value: that source's mapping_coverage_coords on the target (see
+    get_mapping_coverage_coordinates). If the contigs are keyed by contig_number,
+    contig_names (from the target's contig table) gives their names, which are what the
+    store is queried by.
+    """
+    import numpy as np
+
+    sources = list(source_coverage_coords)
+    words_per_bitset = get_words_per_bitset(len(sources))
+    contigs = dict()
+    all_run_starts = list()
+    all_run_bitsets = list()
+    num_runs = 0
+    for contig_id, length in contig_lengths.items():
+        run_starts, run_bitsets = get_source_runs(np, [source_coverage_coords[source].get(contig_id, list()) for source in sources], length, words_per_bitset)
+        contigs[contig_id if contig_names is None else contig_names[contig_id]] = [length, num_runs, len(run_starts)]
+        all_run_starts.append(run_starts)
+        all_run_bitsets.append(run_bitsets)
+        num_runs += len(run_starts)
+
+    header = json.dumps({"version": STORE_VERSION, "byteorder": sys.byteorder, "track": track, "sources": sources, "words_per_bitset": words_per_bitset, "num_runs": num_runs, "contigs": contigs}).encode()
+    header += b" " * (-len(header) % 8)
+    with open(store_file, "wb") as outf:
+        outf.write(len(header).to_bytes(8, "little"))
+        outf.write(header)
+        for run_starts in all_run_starts:
+            outf.write(run_starts.astype(np.uint64).tobytes())
+        for run_bitsets in all_run_bitsets:
+            outf.write(run_bitsets.astype(np.uint64).tobytes())
+    return store_file
+
+@job_metrics.instrumented
+def write_source_coverage_store(job, source_coverage_coords, length_table, asm, store_options):
+    """
+    source_coverage_coords is dict of key: source, value: that source's
+    mapping_coverage_coords on the target asm, keyed by contig_number. Returns the target's
+    store.
+    """
+    contig_table = contig_length_table.load_contig_table(job, length_table, asm)
+    store_file = job.fileStore.getLocalTempFile()
+    write_store(store_file, source_coverage_coords, contig_table.lengths, store_options.track, contig_table.names)
+    job_metrics.record(output_bytes=job_metrics.get_file_size(store_file), intervals=sum(job_metrics.count_intervals(coords) for coords in source_coverage_coords.values()))
+    return job.fileStore.writeGlobalFile(store_file)
+
+def open_store(store_file):
+    """
+    Memory-maps the store, so opening it is instant however big it is, and only the pages
+    touched by queries are read. Close with close_store.
+    """
+    import numpy as np
+
+    with open(store_file, "rb") as inf:
+        store_map = mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ)
+    header_length = int.from_bytes(store_map[:8], "little")
+    header = json.loads(store_map[8:8 + header_length])
+    if header["version"] != STORE_VERSION or header["byteorder"] != sys.byteorder:
+        store_map.close()
+        raise ValueError(store_file + " was written by an incompatible version of source_coverage, or on a machine with a different byte order.")
+
+    num_runs = header["num_runs"]
+    words_per_bitset = header["words_per_bitset"]
+    offset = 8 + header_length
+    store = SimpleNamespace(track=header["track"], sources=header["sources"], contigs=header["contigs"], words_per_bitset=words_per_bitset, map=store_map, np=np)
+    store.source_numbers = {source: source_number for source_number, source in enumerate(store.sources)}
+    store.starts = np.frombuffer(store_map, dtype=np.uint64, count=num_runs, offset=offset)
+    store.bitsets = np.frombuffer(store_map, dtype=np.uint64, count=num_runs * words_per_bitset, offset=offset + 8 * num_runs).reshape(num_runs, words_per_bitset)
+    return store
+
+def close_store(store):
+    # the arrays hold on to the map's buffer, so they have to go first.
+    del store.starts
+    del store.bitsets
+    store.map.close()
+
+def get_group_bitset(store, group):
+    """
+    Returns the bitset (as a words_per_bitset array) of the sources in group.
+    """
+    np = store.np
+    group_bitset = np.zeros(store.words_per_bitset, dtype=np.uint64)
+    for source in group:
+        if source not in store.source_numbers:
+            raise KeyError(source + " isn't a source in the store for " + store.track + ". Sources: " + ", ".join(store.sources))
+        source_number = store.source_numbers[source]
+        group_bitset[source_number // 64] |= np.uint64(1) << np.uint64(source_number % 64)
+    return group_bitset
+
+def popcount(np, words):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1)
+    return np.unpackbits(np.ascontiguousarray(words).view(np.uint8), axis=-1).sum(axis=-1)
+
+def select_any(store, group):
+    """
+    Selects the bases covered by at least one source in group.
+    """
+    group_bitset = get_group_bitset(store, group)
+    return lambda bitsets: (bitsets & group_bitset).any(axis=1)
+
+def select_none(store, group):
+    """
+    Selects the bases covered by no source in group (including bases covered by nothing).
+    """
+    group_bitset = get_group_bitset(store, group)
+    return lambda bitsets: ~(bitsets & group_bitset).any(axis=1)
+
+def select_private(store, group):
+    """
+    Selects the bases covered by sources in group, and by no source outside of it (e.g.
+    with a group of one source, the bases aligned only to that source).
+    """
+    group_bitset = get_group_bitset(store, group)
+    return lambda bitsets: (bitsets & group_bitset).any(axis=1) & ~(bitsets & ~group_bitset).any(axis=1)
+
+def select_at_least(store, group, k):
+    """
+    Selects the bases covered by at least k of the sources in group.
+    """
+    group_bitset = get_group_bitset(store, group)
+    return lambda bitsets: popcount(store.np, bitsets & group_bitset) >= k
+
+def count_selected_bases(store, contig_id, start, stop, select):
+    """
+    Returns the number of bases in the region selected by select (one of the select_
+    functions). The region is clipped to the contig.
+    """
+    np = store.np
+    if contig_id not in store.contigs:
+        raise KeyError("contig " + contig_id + " isn't in the store for " + store.track)
+    length, first_run, num_runs = store.contigs[contig_id]
+    start = min(max(start, 0), length)
+    stop = min(max(stop, start), length)
+    if start == stop:
+        return 0
+    run_starts = store.starts[first_run:first_run + num_runs]
+    # only the runs overlapping the region are tested.
+    first = max(0, int(np.searchsorted(run_starts, start, side="right")) - 1)
+    last = int(np.searchsorted(run_starts, stop, side="left"))
+    region_run_starts = run_starts[first:last].astype(np.int64)
+    region_run_stops = np.append(region_run_starts[1:], run_starts[last] if last < num_runs else length).astype(np.int64)
+    bases = np.minimum(region_run_stops, stop) - np.maximum(region_run_starts, start)
+    selected = select(store.bitsets[first_run + first:first_run + last])
+    return int(bases[selected].sum())
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument(
+        'store_file', help='A source coverage store, as saved by cactus_connectivity.py --source_coverage_dir.', type=str)
+    parser.add_argument(
+        'regions', help='Regions to look up, in contig:start-stop format (0-based, half-open, as in a bed file). Without any (or --bed), every contig is reported whole.', nargs='*', type=str)
+    parser.add_argument(
+        '--bed', help='A bed file of regions to look up, in addition to any given as arguments.', type=str)
+    parser.add_argument(
+        '--private', help='Comma-separated sources. Count the bases covered by these sources, and by no other source.', type=str)
+    parser.add_argument(
+        '--any', help='Comma-separated sources. Count the bases covered by at least one of them.', type=str)
+    parser.add_argument(
+        '--none', help='Comma-separated sources. Count the bases covered by none of them.', type=str)
+    parser.add_argument(
+        '--at_least', help='Count the bases covered by at least this many of the --group sources.', type=int)
+    parser.add_argument(
+        '--group', help='Comma-separated sources, for --at_least. Defaults to every source.', type=str)
+    parser.add_argument(
+        '--list_sources', help='Just list the sources in the store.', action='store_true')
+    options = parser.parse_args()
+
+    store = open_store(options.store_file)
+    if options.list_sources:
+        print("\n".join(store.sources))
+        close_store(store)
+        return
+    if options.private:
+        select = select_private(store, options.private.split(","))
+    elif options.any:
+        select = select_any(store, options.any.split(","))
+    elif options.none:
+        select = select_none(store, options.none.split(","))
+    elif options.at_least is not None:
+        select = select_at_least(store, options.group.split(",") if options.group else store.sources, options.at_least)
+    else:
+        parser.error("give one of --private, --any, --none or --at_least.")
+
+    regions = [connectivity_index.parse_region(region) for region in options.regions]
+    if options.bed:
+        regions += list(connectivity_index.get_bed_regions(options.bed))
+    if not regions:
+        regions = [(contig_id, 0, length) for contig_id, (length, first_run, num_runs) in store.contigs.items()]
+
+    print("contig\tstart\tstop\tbases_selected\tselected_fraction")
+    for contig_id, start, stop in regions:
+        bases = count_selected_bases(store, contig_id, start, stop, select)
+        print(contig_id + "\t" + str(start) + "\t" + str(stop) + "\t" + str(bases) + "\t" + str(bases / max(1, stop - start)))
+    close_store(store)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+"""
+The tests import the modules of src/ as the workflow does (from src import ...), from the
+root of the repo.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,36 @@
+from src import all_to_all_liftovers
+
+import os
+
+import pytest
+
+@pytest.fixture
+def hal_file(tmp_path):
+    hal_file = str(tmp_path / "graph.hal")
+    with open(hal_file, "w") as outf:
+        outf.write("hal")
+    return hal_file
+
+def test_checkpoint_manifest(tmp_path, hal_file):
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    manifest = all_to_all_liftovers.get_checkpoint_manifest(hal_file, ["--noDupes"])
+    # the first run writes the manifest, and a run with the same hal and options reuses it.
+    assert all_to_all_liftovers.check_checkpoint_manifest(checkpoint_dir, manifest) is None
+    assert os.path.isfile(os.path.join(checkpoint_dir, all_to_all_liftovers.CHECKPOINT_MANIFEST))
+    assert all_to_all_liftovers.check_checkpoint_manifest(checkpoint_dir, all_to_all_liftovers.get_checkpoint_manifest(hal_file, ["--noDupes"])) is None
+
+    problem = all_to_all_liftovers.check_checkpoint_manifest(checkpoint_dir, all_to_all_liftovers.get_checkpoint_manifest(hal_file, list()))
+    assert problem is not None and "halLiftover_arguments" in problem
+
+def test_checkpoint_manifest_rebuilt_hal(tmp_path, hal_file):
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    assert all_to_all_liftovers.check_checkpoint_manifest(checkpoint_dir, all_to_all_liftovers.get_checkpoint_manifest(hal_file, list())) is None
+    with open(hal_file, "w") as outf:
+        outf.write("rebuilt hal")
+    assert all_to_all_liftovers.check_checkpoint_manifest(checkpoint_dir, all_to_all_liftovers.get_checkpoint_manifest(hal_file, list())) is not None
+
+def test_checkpoints_without_manifest(tmp_path, hal_file):
+    checkpoint_dir = tmp_path / "checkpoints"
+    checkpoint_dir.mkdir()
+    (checkpoint_dir / "A_source_B_target_liftover.bed").write_text("chr1\t0\t10\n")
+    assert all_to_all_liftovers.check_checkpoint_manifest(str(checkpoint_dir), all_to_all_liftovers.get_checkpoint_manifest(hal_file, list())) is not None
@@ -0,0 +1,31 @@
+from src import connectivity_index
+
+import pytest
+
+@pytest.fixture
+def index(tmp_path):
+    # chr1 (length 38) is covered at depth 1 over 10-20 and depth 2 over 15-20; chr2
+    # (length 44) has no coverage.
+    points = {"chr1": [(10, True), (20, False), (15, True), (20, False)]}
+    index_file = connectivity_index.write_index(str(tmp_path / "t.ccidx"), points, {"chr1": 38, "chr2": 44}, "t")
+    index = connectivity_index.open_index(index_file)
+    yield index
+    connectivity_index.close_index(index)
+
+def test_query_unmapped(index):
+    assert connectivity_index.query_unmapped(index, "chr1", 0, 38) == [(0, 10), (20, 38)]
+    assert connectivity_index.query_unmapped(index, "chr1", 12, 25) == [(20, 25)]
+    assert connectivity_index.query_unmapped(index, "chr2", 5, 50) == [(5, 44)]
+
+def test_query_unmapped_outside_contig(index):
+    assert connectivity_index.query_unmapped(index, "chr1", 41, 42) == []
+    assert connectivity_index.query_unmapped(index, "chr1", 6, 6) == []
+    assert connectivity_index.query_unmapped(index, "chr2", 44, 46) == []
+    assert connectivity_index.query_unmapped(index, "chr1", -5, 3) == [(0, 3)]
+
+def test_query_depth(index):
+    depth = connectivity_index.query_depth(index, "chr1", 10, 20)
+    assert depth["bases"] == 10
+    assert depth["mean_depth"] == 1.5
+    assert depth["covered_fraction"] == 1.0
+    assert connectivity_index.query_depth(index, "chr1", 41, 42)["bases"] == 0
@@ -0,0 +1,135 @@
+from src import interval_kernels
+
+import collections as col
+import random
+
+import pytest
+
+def test_uncovered_n_contig_is_at_depth_0():
+    # contig 0 is fully covered, and contig 1 is all Ns, with no coverage at all.
+    points = {0: [(0, True), (10, False)]}
+    contig_lengths = {0: 10, 1: 1000}
+    n_runs = {1: [(0, 1000)]}
+    mapping_depths = interval_kernels.get_mapping_depths(points, contig_lengths)[0]
+    assert mapping_depths[0] == 1000
+    assert mapping_depths[1] == 10
+    assert interval_kernels.count_unmapped_n_bases(points, contig_lengths, n_runs) == 1000
+
+def get_random_contigs(seed):
+    """
+    Returns (mapping_coverage_points, contig_lengths, n_runs) of a few small random contigs,
+    some of them with no coverage at all, and the per-base depths of each contig.
+    """
+    rng = random.Random(seed)
+    mapping_coverage_points = col.defaultdict(list)
+    contig_lengths = dict()
+    n_runs = dict()
+    base_depths = dict()
+    for contig_id in range(rng.randint(1, 5)):
+        length = rng.randint(1, 60)
+        contig_lengths[contig_id] = length
+        base_depths[contig_id] = [0] * length
+        if rng.random() < 0.8:
+            for _ in range(rng.randint(0, 8)):
+                start = rng.randrange(length)
+                stop = rng.randint(start + 1, length)
+                mapping_coverage_points[contig_id].append((start, True))
+                mapping_coverage_points[contig_id].append((stop, False))
+                for position in range(start, stop):
+                    base_depths[contig_id][position] += 1
+            rng.shuffle(mapping_coverage_points[contig_id])
+        is_n = [rng.random() < 0.3 for _ in range(length)]
+        contig_n_runs = get_runs(is_n)
+        if contig_n_runs:
+            n_runs[contig_id] = contig_n_runs
+    return mapping_coverage_points, contig_lengths, n_runs, base_depths
+
+def get_runs(is_set):
+    """
+    The sorted (start, stop) of the maximal runs of True in the list is_set.
+    """
+    runs = list()
+    for position, value in enumerate(is_set):
+        if value:
+            if runs and runs[-1][1] == position:
+                runs[-1] = (runs[-1][0], position + 1)
+            else:
+                runs.append((position, position + 1))
+    return runs
+
+SEEDS = range(50)
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_coverage_coordinates(seed):
+    points, contig_lengths, n_runs, base_depths = get_random_contigs(seed)
+    coords = interval_kernels.get_mapping_coverage_coordinates(points)
+    for contig_id, depths in base_depths.items():
+        # abutting mappings can give abutting coords, so compare the bases they cover.
+        covered = [False] * contig_lengths[contig_id]
+        for start, stop in coords.get(contig_id, ()):
+            assert start < stop and not any(covered[start:stop])
+            covered[start:stop] = [True] * (stop - start)
+        assert covered == [depth > 0 for depth in depths]
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_gaps_unmapped(seed):
+    points, contig_lengths, n_runs, base_depths = get_random_contigs(seed)
+    gaps = interval_kernels.get_gaps_unmapped(interval_kernels.get_mapping_coverage_coordinates(points), contig_lengths)
+    gap_length_counts = interval_kernels.count_gap_lengths(gaps)
+    expected = col.Counter()
+    for depths in base_depths.values():
+        for start, stop in get_runs([depth == 0 for depth in depths]):
+            expected[stop - start] += 1
+    assert gap_length_counts == expected
+
+    thresholds = [0, 1, 2, 5, 10, 30, 100]
+    for minimum_size_gap in thresholds:
+        bases_unmapped = sum(length * count for length, count in expected.items() if length >= minimum_size_gap)
+        assert interval_kernels.get_bases_unmapped(gap_length_counts, minimum_size_gap) == bases_unmapped
+    assert interval_kernels.get_bases_unmapped(gap_length_counts) == sum(depths.count(0) for depths in base_depths.values())
+    for threshold, bases_unmapped, gaps_counted in interval_kernels.get_threshold_curve(gap_length_counts, thresholds):
+        assert bases_unmapped == interval_kernels.get_bases_unmapped(gap_length_counts, threshold)
+        assert gaps_counted == sum(count for length, count in expected.items() if length >= threshold)
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_mapping_depths(seed):
+    points, contig_lengths, n_runs, base_depths = get_random_contigs(seed)
+    mapping_depths = interval_kernels.get_mapping_depths(points, contig_lengths)[0]
+    expected = col.Counter(depth for depths in base_depths.values() for depth in depths)
+    assert {depth: bases for depth, bases in mapping_depths.items() if bases} == dict(expected)
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_multiplicity(seed):
+    points, contig_lengths, n_runs, base_depths = get_random_contigs(seed)
+    multicopy_coords = dict()
+    multiplicity = interval_kernels.get_multiplicity(points, contig_lengths, multicopy_coords)
+    expected = [0] * interval_kernels.MULTIPLICITY_LEVELS
+    for depths in base_depths.values():
+        for depth in depths:
+            expected[min(depth, interval_kernels.MULTIPLICITY_LEVELS - 1)] += 1
+    assert multiplicity == expected
+    for contig_id, depths in base_depths.items():
+        assert multicopy_coords.get(contig_id, list()) == get_runs([depth >= 2 for depth in depths])
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_n_bases_unmapped(seed):
+    points, contig_lengths, n_runs, base_depths = get_random_contigs(seed)
+    gaps = interval_kernels.get_gaps_unmapped(interval_kernels.get_mapping_coverage_coordinates(points), contig_lengths)
+    gap_n_base_counts = interval_kernels.count_gap_n_bases(gaps, n_runs)
+    is_n = {contig_id: [False] * length for contig_id, length in contig_lengths.items()}
+    for contig_id, contig_n_runs in n_runs.items():
+        for start, stop in contig_n_runs:
+            is_n[contig_id][start:stop] = [True] * (stop - start)
+    for minimum_size_gap in (0, 1, 3, 10, 100):
+        expected = 0
+        for contig_id, depths in base_depths.items():
+            for start, stop in get_runs([depth == 0 for depth in depths]):
+                if stop - start >= minimum_size_gap:
+                    expected += sum(is_n[contig_id][start:stop])
+        assert interval_kernels.get_n_bases_unmapped(gap_n_base_counts, minimum_size_gap) == expected
+    assert interval_kernels.count_unmapped_n_bases(points, contig_lengths, n_runs) == interval_kernels.get_n_bases_unmapped(gap_n_base_counts)
+
+def test_parse_mapping_coverage_points():
+    bed_lines = ["chr1\t0\t10\tx\n", "chr1\t5\t8\tx\n", "chr2\t3\t4\tx\n"]
+    points = interval_kernels.parse_mapping_coverage_points(bed_lines, contig_ids={"chr1": 0, "chr2": 1})
+    assert dict(points) == {0: [(0, True), (10, False), (5, True), (8, False)], 1: [(3, True), (4, False)]}
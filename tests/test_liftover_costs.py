@@ -0,0 +1,31 @@
+from src import job_metrics
+from src import liftover_costs
+
+import json
+import sys
+
+def test_model_includes_target():
+    asm_sizes = {"small": (1000, 1), "big": (1000000, 100), "other": (1000, 1)}
+    costs = liftover_costs.get_liftover_costs([("small", "big"), ("small", "other")], asm_sizes, liftover_costs.get_cost_options())
+    # same source, so only the target tells the pairs apart.
+    assert costs[("small", "big")] > costs[("small", "other")]
+
+def test_timings_use_halLiftover_rss(tmp_path):
+    metrics_file = str(tmp_path / "metrics.json")
+    with open(metrics_file, "w") as outf:
+        json.dump({"jobs": [
+            # the worker's lifetime peak_rss_kb is left out of the memory request.
+            {"stage": "liftover", "source": "A", "target": "B", "wall_seconds": 2.0, "peak_rss_kb": 1000000, "halLiftover_peak_rss_kb": 1000},
+            {"stage": "liftover", "source": "B", "target": "A", "wall_seconds": 3.0, "peak_rss_kb": 1000000}]}, outf)
+    timings = liftover_costs.read_liftover_timings(metrics_file)
+    assert timings[("A", "B")] == (2.0, int(1000 * 1024 * liftover_costs.MEMORY_HEADROOM))
+    assert timings[("B", "A")] == (3.0, None)
+
+def test_run_measured():
+    returncode, peak_rss_kb = job_metrics.run_measured([sys.executable, "-c", "x = bytearray(200 * 1024 * 1024)"])
+    assert returncode == 0
+    assert peak_rss_kb >= 200 * 1024
+    returncode, peak_rss_kb = job_metrics.run_measured([sys.executable, "-c", "import sys; sys.exit(3)"])
+    assert returncode == 3
+    # only the one process counts, not the bigger child before it.
+    assert peak_rss_kb < 200 * 1024
@@ -0,0 +1,30 @@
+from src import contig_length_table
+from src import paf_alignments
+
+def get_paf_line(query, query_length, query_start, query_stop, strand, target, target_length, target_start, target_stop, *tags):
+    fields = [query, query_length, query_start, query_stop, strand, target, target_length, target_start, target_stop, 0, max(query_stop - query_start, target_stop - target_start), 60]
+    return "\t".join(str(field) for field in fields + list(tags)) + "\n"
+
+def read_coverage(tmp_path, paf_lines):
+    paf_file = str(tmp_path / "aln.paf")
+    with open(paf_file, "w") as outf:
+        outf.writelines(paf_lines)
+    contig_tables = {"Q": contig_length_table.intern_contigs({"q": 1000}), "T": contig_length_table.intern_contigs({"t": 1000})}
+    source_points = dict()
+    target_points = paf_alignments.read_paf_coverage_points([paf_file], contig_tables, [("Q", "T")], lambda source_asm, target_asm: target_asm, source_points)
+    return dict(target_points["T"]), dict(source_points["Q"])
+
+def test_no_cigar_keeps_each_sides_span(tmp_path):
+    target_points, query_points = read_coverage(tmp_path, [get_paf_line("q", 1000, 100, 300, "+", "t", 1000, 500, 650)])
+    assert target_points == {0: [(500, True), (650, False)]}
+    assert query_points == {0: [(100, True), (300, False)]}
+
+def test_cigar_blocks(tmp_path):
+    # 10M 5I 10M 3D 10M: the query spans 35 bases, and the target 33.
+    forward, forward_query = read_coverage(tmp_path, [get_paf_line("q", 1000, 100, 135, "+", "t", 1000, 500, 533, "cg:Z:10M5I10M3D10M")])
+    assert forward == {0: [(500, True), (510, False), (510, True), (520, False), (523, True), (533, False)]}
+    assert forward_query == {0: [(100, True), (110, False), (115, True), (125, False), (125, True), (135, False)]}
+    # on the reverse strand, the query is walked back from its end.
+    reverse, reverse_query = read_coverage(tmp_path, [get_paf_line("q", 1000, 100, 135, "-", "t", 1000, 500, 533, "cg:Z:10M5I10M3D10M")])
+    assert reverse == forward
+    assert reverse_query == {0: [(125, True), (135, False), (110, True), (120, False), (100, True), (110, False)]}
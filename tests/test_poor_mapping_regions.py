@@ -0,0 +1,34 @@
+from src import poor_mapping_regions
+
+import gzip
+
+import pytest
+
+FASTA = ">chr1\nACGTA\nCG\n>empty\n>chr2 description\nNNNN\n"
+
+def test_fasta_index_keeps_empty_records(tmp_path):
+    fasta = str(tmp_path / "asm.fa")
+    with open(fasta, "w") as outf:
+        outf.write(FASTA)
+    fasta_index = poor_mapping_regions.read_fasta_index(fasta)
+    assert list(fasta_index) == ["chr1", "empty", "chr2"]
+    assert fasta_index["empty"][0] == 0
+    with open(fasta, "rb") as assembly:
+        assert poor_mapping_regions.fetch_sequence(assembly, fasta_index["chr1"], 3, 7) == "TACG"
+        assert poor_mapping_regions.fetch_sequence(assembly, fasta_index["empty"], 0, 10) == ""
+
+    bed = str(tmp_path / "regions.bed")
+    with open(bed, "w") as outf:
+        outf.write("empty\t0\t10\nchr2\t1\t3\n")
+    out_fasta = str(tmp_path / "regions.fa")
+    assert poor_mapping_regions.write_fasta(out_fasta, bed, fasta) == 2
+    with open(out_fasta) as inf:
+        assert inf.read() == ">empty:0-10\n>chr2:1-3\nNN\n"
+
+def test_gzipped_fasta_refused(tmp_path):
+    # named without .gz, as toil's local copies are.
+    fasta = str(tmp_path / "asm")
+    with gzip.open(fasta, "wt") as outf:
+        outf.write(FASTA)
+    with pytest.raises(ValueError):
+        poor_mapping_regions.read_fasta_index(fasta)